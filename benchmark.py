@@ -0,0 +1,129 @@
+"""Throughput benchmarks for the data pipeline."""
+import os
+import tempfile
+from argparse import ArgumentParser
+from timeit import default_timer as timer
+
+import numpy as np
+
+from tools.data_reader import DataReader
+from tools.data_writer import DataWriter
+from tools.trajectory_store import TrajectoryStore
+from tools.utils import printc
+
+
+def write_synthetic_data_file(file_name: str, trajectory_number: int, seed: int = 0) -> None:
+    # Random walks in the data format described in datasets/data_format.txt
+    rng = np.random.default_rng(seed)
+    with open(file_name, 'w') as file_object:
+        for i in range(trajectory_number):
+            length = rng.integers(10, 100)
+            start = rng.uniform(0, 100, 2)
+            points = start + np.cumsum(rng.normal(0, 0.1, (length, 2)), axis=0)
+            file_object.write('#' + str(i) + ':\n>0:')
+            file_object.write(('%.3f,%.3f;' * length) % tuple(points.reshape(-1)))
+            file_object.write('\n')
+
+
+def same_trajectories(trajectory_list1: list, trajectory_list2: list) -> bool:
+    if len(trajectory_list1) != len(trajectory_list2):
+        return False
+    return all(np.array_equal(tr1, tr2) for tr1, tr2 in zip(trajectory_list1, trajectory_list2))
+
+
+def time_call(function, repeat: int, *args):
+    runtimes = []
+    for _ in range(repeat):
+        start = timer()
+        result = function(*args)
+        runtimes.append(timer() - start)
+    return min(runtimes), result
+
+
+def benchmark_reader(file_name: str, repeat: int) -> None:
+    reader = DataReader()
+    file_size = os.path.getsize(file_name) / 1024 ** 2
+    printc("File:", f"{file_name} ({file_size:.1f} MB)")
+    readers = {
+        'line by line': reader.read_tra_data_line_by_line,
+        'bulk': reader.read_tra_data,
+    }
+    results = {}
+    for name, read in readers.items():
+        runtime, trajectory_list = time_call(read, repeat, file_name)
+        results[name] = trajectory_list
+        printc(f"{name}:", f"{runtime:.3f}s, {file_size / runtime:.1f} MB/s, "
+                           f"{len(trajectory_list) / runtime:.0f} trajectories/s")
+    printc("Identical result:", same_trajectories(results['line by line'], results['bulk']))
+
+
+def benchmark_store(file_name: str, cache_name: str, repeat: int) -> None:
+    reader = DataReader()
+    file_size = os.path.getsize(file_name) / 1024 ** 2
+    printc("File:", f"{file_name} ({file_size:.1f} MB)")
+    runtime, _ = time_call(reader.convert_data_file, 1, file_name, cache_name)
+    printc("convert:", f"{runtime:.3f}s")
+    runtime, (points, offsets) = time_call(reader.read_tra_data_cached, repeat, file_name, cache_name)
+    printc("open cached:", f"{runtime:.4f}s")
+    runtime, trajectory_list = time_call(reader.split_points_by_offsets, repeat, points, offsets)
+    printc("trajectory views:", f"{runtime:.3f}s, {len(trajectory_list) / runtime:.0f} trajectories/s")
+    printc("Identical result:", same_trajectories(reader.read_tra_data(file_name), trajectory_list))
+
+
+def benchmark_writer(file_name: str, output_folder: str, repeat: int) -> None:
+    trajectory_list = DataReader().read_tra_data(file_name)
+    writer = DataWriter()
+    writers = {
+        'point by point': (writer.save_trajectory_data_in_list_to_file_point_by_point, 'point_by_point.dat'),
+        'batched': (writer.save_trajectory_data_in_list_to_file, 'batched.dat'),
+        'store': (writer.save_trajectory_data_in_list_to_store, 'store'),
+    }
+    for name, (write, output_n) in writers.items():
+        runtime, _ = time_call(write, repeat, trajectory_list, os.path.join(output_folder, output_n))
+        printc(f"{name}:", f"{runtime:.3f}s, {len(trajectory_list) / runtime:.0f} trajectories/s")
+    with open(os.path.join(output_folder, 'point_by_point.dat'), 'rb') as f1, \
+            open(os.path.join(output_folder, 'batched.dat'), 'rb') as f2:
+        printc("Identical text:", f1.read() == f2.read())
+
+
+def benchmark_ingest(file_name: str, worker_number: int, repeat: int) -> None:
+    file_size = os.path.getsize(file_name) / 1024 ** 2
+    printc("File:", f"{file_name} ({file_size:.1f} MB)")
+    single_runtime = None
+    for workers in range(1, worker_number + 1):
+        reader = DataReader(use_cache=False, worker_number=workers)
+        runtime, _ = time_call(reader.read_tra_data_in_bulk, repeat, file_name)
+        if single_runtime is None:
+            single_runtime = runtime
+        printc(f"{workers} workers:", f"{runtime:.3f}s, {file_size / runtime:.1f} MB/s, "
+                                      f"speedup {single_runtime / runtime:.2f}")
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(description="PrivTrace Benchmarks")
+    parser.add_argument('benchmark', type=str, choices=['reader', 'store', 'writer', 'ingest'], help='Benchmark to run')
+    parser.add_argument('--file', type=str, default=None,
+                        help='Trajectory file to use. By default a synthetic file is generated.')
+    parser.add_argument('--trajectories', type=int, default=100_000,
+                        help='Number of trajectories of the synthetic file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Largest number of reader processes of the ingest benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions, the fastest one is reported')
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_file = args.file
+        if data_file is None:
+            data_file = os.path.join(tmp_dir, 'synthetic.dat')
+            write_synthetic_data_file(data_file, args.trajectories)
+        if args.benchmark == 'reader':
+            benchmark_reader(data_file, args.repeat)
+        elif args.benchmark == 'store':
+            benchmark_store(data_file, os.path.join(tmp_dir, 'cache', 'store'), args.repeat)
+        elif args.benchmark == 'writer':
+            benchmark_writer(data_file, tmp_dir, args.repeat)
+        elif args.benchmark == 'ingest':
+            benchmark_ingest(data_file, args.workers, args.repeat)
@@ -5,3 +5,5 @@ dataset_file_name = 'simple_example.dat'
 OUTPUT_DIR = 'outputs'
 trajectory_data_folder = 'datasets'
 
+# binary copies of parsed trajectory files are cached in this folder inside trajectory_data_folder
+trajectory_cache_folder = '.cache'
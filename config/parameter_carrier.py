@@ -15,6 +15,63 @@ class ParameterCarrier:
             self.pop = args['pop']
         else:
             self.pop = False
+        if 'reader_worker_number' in args:
+            # Number of processes parsing the input file
+            self.reader_worker_number = args['reader_worker_number']
+        else:
+            self.reader_worker_number = 1
+        if 'streaming' in args:
+            # Whether the dataset is read in chunks instead of being kept in memory
+            self.streaming = args['streaming']
+            self.chunk_size = args['chunk_size']
+            self.shard_number = args['shard_number']
+        else:
+            self.streaming = False
+            self.chunk_size = 100000
+            self.shard_number = 1
+        if 'neighbor_edge_matching' in args:
+            # How subcells at the common side of adjacent large cells are matched as neighbors
+            self.neighbor_edge_matching = args['neighbor_edge_matching']
+        else:
+            self.neighbor_edge_matching = 'edge'
+        if 'border_quantile' in args:
+            # Quantile of the coordinates the border is set to and how points outside of it are handled
+            self.border_quantile = args['border_quantile']
+            self.outlier_policy = args['outlier_policy']
+        else:
+            self.border_quantile = 0
+            self.outlier_policy = 'clamp'
+        if 'state_pruning' in args:
+            # How states are pruned down to at most max_state_number states, -1 is no limit
+            self.state_pruning = args['state_pruning']
+            self.max_state_number = args['max_state_number']
+        else:
+            self.state_pruning = 'none'
+            self.max_state_number = -1
+        if 'noisy_markov_mode' in args:
+            # How the noise of the markov matrix is added, see MarkovModel.noisy_markov
+            self.noisy_markov_mode = args['noisy_markov_mode']
+            self.noisy_markov_row_block = args['noisy_markov_row_block']
+            self.noisy_markov_seed = args['noisy_markov_seed']
+        else:
+            self.noisy_markov_mode = 'dense'
+            self.noisy_markov_row_block = 256
+            self.noisy_markov_seed = -1
+        if 'regulation_worker_number' in args:
+            # Number of processes regulating noisy matrices and adding noise to guideposts
+            self.regulation_worker_number = args['regulation_worker_number']
+        else:
+            self.regulation_worker_number = 1
+        if 'guidepost_noise_seed' in args:
+            # Seed of the noise of guideposts, see MarkovModel.add_noise_to_guidepost
+            self.guidepost_noise_seed = args['guidepost_noise_seed']
+        else:
+            self.guidepost_noise_seed = -1
+        if 'guidepost_states' in args:
+            # Last and next states kept in the order 2 matrix of a guidepost, see GuidePost.guidepost_set_up
+            self.guidepost_states = args['guidepost_states']
+        else:
+            self.guidepost_states = 'all'
         self.K = 0  # Level 1 Grid Size
 
 
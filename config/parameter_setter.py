@@ -12,14 +12,54 @@ class ParSetter:
         pass
 
     def set_up_args(self, dataset_file_name=None, epsilon=False, epsilon_partition=False, level1_parameter=False,
-                    level2_parameter=False, out_size: int = -1, output_file_name=None, c_parameter=False, pop=False):
+                    level2_parameter=False, out_size: int = -1, output_file_name=None, c_parameter=False, pop=False,
+                    streaming=False):
         parser = argparse.ArgumentParser()
         parser.add_argument('--dataset_file_name', type=str, default=fname.dataset_file_name, help="Input File")
         parser.add_argument('-o', '--output' , type=str, default=None, help="Output File. Default is input file name + '_output.dat'")
+        # 'text' writes the format of datasets/data_format.txt, 'store' a binary trajectory store
+        parser.add_argument('--output_format', type=str, default='text', choices=['text', 'store'])
+        # digits after the decimal point of coordinates in text output
+        parser.add_argument('--output_precision', type=int, default=2)
+        # number of processes parsing the input file
+        parser.add_argument('--reader_worker_number', type=int, default=1)
+        # the streaming mode reads the dataset in chunks of chunk_size trajectories twice instead of keeping it in memory
+        parser.add_argument('--streaming', action='store_true')
+        parser.add_argument('--chunk_size', type=int, default=100000)
+        # in streaming mode, the trajectories are counted in this many shards by as many processes
+        parser.add_argument('--shard_number', type=int, default=1)
         parser.add_argument('--subdividing_inner_parameter', type=float, default=200)
+        # the border is set from the border_quantile and 1 - border_quantile quantiles of the coordinates instead of
+        # their minimum and maximum, points outside of it are handled by outlier_policy, see Grid.process_outliers
+        parser.add_argument('--border_quantile', type=float, default=0)
+        parser.add_argument('--outlier_policy', type=str, default='clamp',
+                            choices=['clamp', 'drop_point', 'drop_trajectory'])
+        # subcells at the common side of adjacent large cells are neighbors: 'edge' all of them, 'overlap' only those
+        # whose sides overlap
+        parser.add_argument('--neighbor_edge_matching', type=str, default='edge', choices=['edge', 'overlap'])
+        # 'drop' drops the states of large cells without noisy density and keeps at most max_state_number connected
+        # states, the densest ones, 'merge' first subdivides the least dense large cells into fewer subcells. Points in
+        # dropped states are moved to the nearest kept state
+        parser.add_argument('--state_pruning', type=str, default='none', choices=['none', 'drop', 'merge'])
+        parser.add_argument('--max_state_number', type=int, default=-1)
         parser.add_argument('--total_epsilon', type=float, default=2.0)
         # regularly, partition solution is suggested to be np.array([0.2, 0.52, 0.28]))
         parser.add_argument('--epsilon_partition', type=np.ndarray, default=np.array([0.2, 0.4, 0.4]))
+        # 'rows' adds the noise of the markov matrix in blocks of noisy_markov_row_block rows, the noise of a row comes
+        # from a generator keyed on (noisy_markov_seed, row), -1 draws the seed from np.random
+        parser.add_argument('--noisy_markov_mode', type=str, default='dense', choices=['dense', 'rows'])
+        parser.add_argument('--noisy_markov_row_block', type=int, default=256)
+        parser.add_argument('--noisy_markov_seed', type=int, default=-1)
+        # number of processes regulating the rows of the noisy markov matrix and adding noise to guideposts
+        parser.add_argument('--regulation_worker_number', type=int, default=1)
+        # the noise of a guidepost comes from a generator keyed on (guidepost_noise_seed, state of the guidepost), -1
+        # draws the seed from np.random
+        parser.add_argument('--guidepost_noise_seed', type=int, default=-1)
+        # 'neighbors' keeps the order 2 values of a guidepost only for last and next states next to its state. This cuts
+        # the memory of a guidepost from (states + 1) ** 2 to (neighbors + 1) ** 2 values, but it leaves out the
+        # transitions between states that are not neighbors, so the model differs. 'all' keeps all of them and gives
+        # the counts of the original matrices, so it is the default
+        parser.add_argument('--guidepost_states', type=str, default='all', choices=['all', 'neighbors'])
         # this parameter indicates how many trajectories to generate
         parser.add_argument('--trajectory_number_to_generate', type=int, default=-1)
         args = vars(parser.parse_args([]))  # disable parser
@@ -36,6 +76,8 @@ class ParSetter:
             args['subdividing_inner_parameter'] = level2_parameter
         if dataset_file_name is not None:
             args['dataset_file_name'] = dataset_file_name
+        if streaming is not False:
+            args['streaming'] = streaming
         if args['output'] is None:
             # Write to input file
             args['output'] = fname.OUTPUT_DIR + args['dataset_file_name'].split('/')[-1].split('.')[0] + '_output.dat'
@@ -51,6 +93,18 @@ class ParSetter:
         # Print Parameters
         printc("Input file name:", args['dataset_file_name'])
         printc("Output file name:", args['output'])
+        printc("Output format:", args['output_format'])
+        if args['streaming']:
+            printc("Streaming chunk size:", args['chunk_size'])
+            printc("Shard number:", args['shard_number'])
+        if args['border_quantile'] > 0:
+            printc("Border quantile:", args['border_quantile'], args['outlier_policy'])
+        if args['state_pruning'] != 'none':
+            printc("State pruning:", args['state_pruning'], args['max_state_number'])
+        if args['noisy_markov_mode'] != 'dense':
+            printc("Noisy markov mode:", args['noisy_markov_mode'], args['noisy_markov_row_block'])
+        if args['guidepost_states'] != 'all':
+            printc("Guidepost states:", args['guidepost_states'])
         printc("Total epsilon:", args['total_epsilon'])
         printc("Epsilon partition:", args['epsilon_partition'])
         printc("Trajectory number to generate:", args['trajectory_number_to_generate'])
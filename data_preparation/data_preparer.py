@@ -1,4 +1,3 @@
-from data_preparation.trajectory import Trajectory
 from data_preparation.trajectory_set import TrajectorySet
 from tools.data_reader import DataReader
 from config.parameter_carrier import ParameterCarrier
@@ -11,10 +10,7 @@ class DataPreparer:
 
     def get_trajectory_set(self):
         tr_set = TrajectorySet()
-        reader1 = DataReader()
-        tr_list = reader1.read_trajectories_from_data_file(self.cc.dataset_file_name)
-        for tr_array in tr_list:
-            tr = Trajectory()
-            tr.trajectory_array = tr_array
-            tr_set.add_trajectory(tr)
+        reader1 = DataReader(worker_number=self.cc.reader_worker_number)
+        points, offsets = reader1.read_trajectory_points_from_data_file(self.cc.dataset_file_name)
+        tr_set.give_points_and_offsets(points, offsets)
         return tr_set
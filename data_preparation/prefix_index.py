@@ -0,0 +1,80 @@
+import bisect
+
+import numpy as np
+
+# sequence entries are stored as big endian unsigned integers of this many bytes, so comparing the bytes of two
+# sequences compares the sequences lexicographically and a sequence comes before all its extensions
+KEY_ENTRY_DTYPE = np.dtype('>u4')
+# a key of a prefix followed by this is larger than the key of every sequence beginning with the prefix
+KEY_UPPER_BOUND = b'\xff' * KEY_ENTRY_DTYPE.itemsize
+
+
+# This class is a sorted index of the simple trajectories of a trajectory set. Every sequence is turned into a byte
+# key and the keys are sorted once. The sequences beginning with a prefix are a contiguous range of the sorted keys,
+# which is found with two binary searches.
+class PrefixIndex:
+
+    def __init__(self, sequences: np.ndarray, offsets: np.ndarray):
+        # flat sequences, sequence i is sequences[offsets[i]: offsets[i + 1]]
+        self.sequences = np.asarray(sequences)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.sequence_number = self.offsets.size - 1
+        keys = self.give_keys()
+        # position of every sequence in sorted order and the sorted keys
+        self.sorted_positions = np.array(sorted(range(self.sequence_number), key=keys.__getitem__), dtype=np.int64)
+        self.sorted_keys = [keys[position] for position in self.sorted_positions]
+
+    # this function gives the byte key of every sequence, entries are shifted by one so that -1 is the smallest one
+    def give_keys(self) -> list:
+        key_buffer = (self.sequences.astype(np.int64) + 1).astype(KEY_ENTRY_DTYPE).tobytes()
+        entry_size = KEY_ENTRY_DTYPE.itemsize
+        bounds = (self.offsets * entry_size).tolist()
+        return [key_buffer[bounds[i]: bounds[i + 1]] for i in range(self.sequence_number)]
+
+    # this function gives the key of a prefix
+    def give_prefix_key(self, prefix) -> bytes:
+        prefix = np.asarray(prefix, dtype=np.int64).reshape(-1)
+        return (prefix + 1).astype(KEY_ENTRY_DTYPE).tobytes()
+
+    # this function gives the range [start, end) of sorted positions of sequences beginning with prefix, and the end
+    # of the sequences that are equal to the prefix, they are the first ones of the range
+    def give_prefix_range(self, prefix):
+        prefix_key = self.give_prefix_key(prefix)
+        start = bisect.bisect_left(self.sorted_keys, prefix_key)
+        end = bisect.bisect_left(self.sorted_keys, prefix_key + KEY_UPPER_BOUND, start)
+        equal_end = bisect.bisect_right(self.sorted_keys, prefix_key, start, end)
+        return start, end, equal_end
+
+    # this function gives the positions of sequences beginning with prefix in their original order
+    def find_positions_with_prefix(self, prefix) -> np.ndarray:
+        start, end, _ = self.give_prefix_range(prefix)
+        return np.sort(self.sorted_positions[start: end])
+
+    # this function gives the number of sequences that are equal to prefix
+    def give_end_weight(self, prefix) -> int:
+        start, _, equal_end = self.give_prefix_range(prefix)
+        return equal_end - start
+
+    # this function gives the states following prefix in the sequences beginning with prefix
+    def give_next_states(self, prefix) -> np.ndarray:
+        _, end, equal_end = self.give_prefix_range(prefix)
+        prefix_length = np.asarray(prefix).size
+        longer_positions = self.sorted_positions[equal_end: end]
+        return self.sequences[self.offsets[longer_positions] + prefix_length]
+
+    # this function answers a prefix query, see TrajectorySet.find_trajectories_with_given_prefix
+    def query_prefix(self, prefix, minimal_state_number: int = 1000):
+        positions = self.find_positions_with_prefix(prefix)
+        tras = [self.sequences[self.offsets[position]: self.offsets[position + 1]] for position in positions]
+        next_states = self.give_next_states(prefix)
+        next_states = next_states[next_states >= 0]
+        state_number = minimal_state_number
+        if next_states.size > 0:
+            state_number = max(state_number, int(np.max(next_states)) + 1)
+        states_tran = np.bincount(next_states, minlength=state_number).astype(float)
+        end_weights = self.give_end_weight(prefix)
+        return tras, states_tran, end_weights
+
+    # this function answers many prefix queries
+    def query_prefixes(self, prefix_list: list, minimal_state_number: int = 1000) -> list:
+        return [self.query_prefix(prefix, minimal_state_number) for prefix in prefix_list]
@@ -2,9 +2,52 @@ import numpy as np
 from tools.general_tools import GeneralTools
 
 
+# A field of a trajectory. A trajectory that is not in a set keeps the field itself. Once it is added to a
+# TrajectorySet the field is a view of the flat arrays of the set, see TrajectorySet.give_field and
+# TrajectorySet.set_field. field_kind is 'point' (one entry per point), 'simple' (one entry per element of the simple
+# trajectory) or 'trajectory' (one value per trajectory).
+class TrajectoryField:
+
+    def __init__(self, field_kind: str):
+        self.field_kind = field_kind
+        self.name = ''
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, trajectory1, owner):
+        if trajectory1 is None:
+            return self
+        if trajectory1.trajectory_set is None:
+            return trajectory1.own_fields[self.name]
+        return trajectory1.trajectory_set.give_field(self.name, self.field_kind, trajectory1.position_in_set)
+
+    def __set__(self, trajectory1, value):
+        if trajectory1.trajectory_set is None:
+            trajectory1.own_fields[self.name] = value
+        else:
+            trajectory1.trajectory_set.set_field(self.name, self.field_kind, trajectory1.position_in_set, value)
+
+
 class Trajectory:
 
-    def __init__(self):
+    trajectory_array = TrajectoryField('point')
+    trajectory_index = TrajectoryField('trajectory')
+    level1_cell_index_sequence = TrajectoryField('point')
+    level2_cell_index_sequence = TrajectoryField('point')
+    usable_sequence = TrajectoryField('point')
+    cell_sequence = TrajectoryField('simple')
+    cell_sequence_frequency = TrajectoryField('simple')
+    usable_simple_sequence = TrajectoryField('simple')
+    has_not_usable_index = TrajectoryField('trajectory')
+
+    def __init__(self, trajectory_set=None, position_in_set: int = -1):
+        # set this trajectory is a view of and the position of the trajectory in the set
+        self.trajectory_set = trajectory_set
+        self.position_in_set = position_in_set
+        self.own_fields = {}
+        if trajectory_set is not None:
+            return
         self.trajectory_array = np.array([-1, -1])
         # define index of  trajectory
         self.trajectory_index = -1
@@ -20,6 +63,12 @@ class Trajectory:
         self.usable_simple_sequence = np.array([])
         self.has_not_usable_index = False
 
+    # this function makes this trajectory a view of a trajectory set
+    def bind_to_set(self, trajectory_set, position_in_set: int):
+        self.trajectory_set = trajectory_set
+        self.position_in_set = position_in_set
+        self.own_fields = {}
+
     # this function give trajectory index to this trajectory
     def give_index(self, index1):
         self.trajectory_index = index1
@@ -34,10 +83,12 @@ class Trajectory:
 
     # this function get point number of trajectory
     def get_point_number(self):
-        if self.point_number == 0:
+        if self.trajectory_set is not None:
+            self.point_number = self.trajectory_set.give_point_number_of(self.position_in_set)
+        elif self.point_number == 0:
             self.point_number = self.trajectory_array.shape[0]
-            if self.point_number == 0:
-                raise ValueError('Point number of trajectory {} is zero!'.format(self.trajectory_index))
+        if self.point_number == 0:
+            raise ValueError('Point number of trajectory {} is zero!'.format(self.trajectory_index))
         return self.point_number
 
     # this function give trajectory point array by ndarray of trajectory
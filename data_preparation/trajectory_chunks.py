@@ -0,0 +1,84 @@
+import numpy as np
+
+from config.parameter_carrier import ParameterCarrier
+from data_preparation.trajectory_set import TrajectorySet
+from tools.data_reader import DataReader
+from tools.general_tools import GeneralTools
+
+
+# This class reads the trajectories of a data file in chunks. The file is converted into a binary store once (see
+# DataReader.open_trajectory_store) and every iteration gives one TrajectorySet of at most chunk_size trajectories
+# after another, so the whole data set is never in memory. Bounding box and numbers of points and trajectories come
+# from the sidecar of the store without reading the points.
+class TrajectoryChunks:
+
+    def __init__(self, cc: ParameterCarrier, chunk_size: int = 100000):
+        self.cc = cc
+        self.chunk_size = max(int(chunk_size), 1)
+        reader1 = DataReader(worker_number=cc.reader_worker_number)
+        self.points, self.offsets, self.store_info = reader1.open_trajectory_store(cc.dataset_file_name)
+        self.trajectory_number = int(self.store_info['trajectory_number'])
+        self.point_number = int(self.store_info['point_number'])
+        # [x_min, y_min, x_max, y_max] or None if there are no points
+        self.bounding_box = self.store_info['bounding_box']
+
+    # this function gives the number of chunks
+    def get_chunk_number(self) -> int:
+        return -(-self.trajectory_number // self.chunk_size)
+
+    # this function gives the trajectory set of trajectories start, ..., end - 1
+    def give_chunk(self, start: int, end: int) -> TrajectorySet:
+        chunk_offsets = np.asarray(self.offsets[start: end + 1], dtype=np.int64)
+        chunk_points = np.asarray(self.points[chunk_offsets[0]: chunk_offsets[-1]])
+        tr_set = TrajectorySet()
+        tr_set.give_points_and_offsets(chunk_points, chunk_offsets - chunk_offsets[0])
+        tr_set.trajectory_index = np.arange(start, end) + 1
+        return tr_set
+
+    # this function gives the chunks of trajectories start, ..., end - 1 one after another
+    def iterate_range(self, start: int, end: int):
+        for chunk_start in range(start, end, self.chunk_size):
+            yield self.give_chunk(chunk_start, min(chunk_start + self.chunk_size, end))
+
+    def __iter__(self):
+        return self.iterate_range(0, self.trajectory_number)
+
+    # this function gives [x_min, y_min, x_max, y_max] of the points between the quantile and the 1 - quantile quantile
+    # of every coordinate, like Grid.border. The first pass counts the coordinates in bin_number bins between the
+    # bounds of the sidecar, the second one collects the coordinates in the bins of the bounding order statistics.
+    def give_quantile_bounding_box(self, quantile: float, bin_number: int = 65536):
+        if self.bounding_box is None:
+            return None
+        gt1 = GeneralTools()
+        ranks = gt1.give_quantile_ranks(self.point_number, quantile)
+        lower = np.asarray(self.bounding_box[:2], dtype=float)
+        upper = np.asarray(self.bounding_box[2:], dtype=float)
+        counts = np.zeros((2, bin_number), dtype=np.int64)
+        for trajectory_set1 in self:
+            coordinate_bins = self.give_coordinate_bins(trajectory_set1.trajectory_array, lower, upper, bin_number)
+            for coordinate in range(2):
+                counts[coordinate] += np.bincount(coordinate_bins[:, coordinate], minlength=bin_number)
+        cumulative_counts = np.cumsum(counts, axis=1)
+        # bin of every order statistic (coordinate, rank) and its rank among the coordinates in the bin
+        targets = []
+        for coordinate in range(2):
+            for rank in ranks:
+                target_bin = int(np.searchsorted(cumulative_counts[coordinate], rank, side='right'))
+                rank_in_bin = rank - (cumulative_counts[coordinate, target_bin - 1] if target_bin > 0 else 0)
+                targets.append((coordinate, target_bin, int(rank_in_bin)))
+        collected = [[] for _ in targets]
+        for trajectory_set1 in self:
+            points = trajectory_set1.trajectory_array
+            coordinate_bins = self.give_coordinate_bins(points, lower, upper, bin_number)
+            for target_index, (coordinate, target_bin, _) in enumerate(targets):
+                collected[target_index].append(points[coordinate_bins[:, coordinate] == target_bin, coordinate])
+        order_statistics = [float(np.sort(np.concatenate(values))[target[2]])
+                            for values, target in zip(collected, targets)]
+        return [order_statistics[0], order_statistics[2], order_statistics[1], order_statistics[3]]
+
+    # this function gives the bins of both coordinates of points, bins are equally wide between lower and upper
+    def give_coordinate_bins(self, points: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+                             bin_number: int) -> np.ndarray:
+        width = np.where(upper > lower, upper - lower, 1.0)
+        coordinate_bins = np.floor((points - lower) / width * bin_number)
+        return np.clip(coordinate_bins, 0, bin_number - 1).astype(np.int64)
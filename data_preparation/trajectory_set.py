@@ -1,39 +1,142 @@
 import numpy as np
 from data_preparation.trajectory import Trajectory
+from data_preparation.prefix_index import PrefixIndex
 
+# type of the empty value of every trajectory field before it is calculated, see give_field_default
+FIELD_DEFAULT_TYPES = {
+    'level1_cell_index_sequence': int,
+    'level2_cell_index_sequence': int,
+    'usable_sequence': float,
+    'cell_sequence': int,
+    'cell_sequence_frequency': int,
+    'usable_simple_sequence': float,
+}
+POINT_FIELDS = ['level1_cell_index_sequence', 'level2_cell_index_sequence', 'usable_sequence']
+SIMPLE_FIELDS = ['cell_sequence', 'cell_sequence_frequency', 'usable_simple_sequence']
+# arrays of a set that hold the simple trajectories
+SIMPLE_ARRAYS = SIMPLE_FIELDS + ['simple_offsets']
 
+
+# this function gives a new empty value of a trajectory field, every trajectory gets its own array
+def give_field_default(field_name: str) -> np.ndarray:
+    return np.array([], dtype=FIELD_DEFAULT_TYPES[field_name])
+
+
+# A flat array of a TrajectorySet, it is kept in TrajectorySet.field_arrays. Reading or assigning the array moves
+# pending trajectories and, for a simple array, buffered simple trajectories into the arrays first. An assigned point
+# array gives every trajectory a value.
+class SetArray:
+
+    def __init__(self):
+        self.name = ''
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, trajectory_set1, owner):
+        if trajectory_set1 is None:
+            return self
+        trajectory_set1.flush_pending_trajectories()
+        if self.name in SIMPLE_ARRAYS:
+            trajectory_set1.flush_simple_writes()
+        return trajectory_set1.field_arrays[self.name]
+
+    def __set__(self, trajectory_set1, value):
+        trajectory_set1.flush_pending_trajectories()
+        if self.name in SIMPLE_ARRAYS:
+            trajectory_set1.flush_simple_writes()
+        trajectory_set1.field_arrays[self.name] = value
+        trajectory_set1.missing_point_values.pop(self.name, None)
+
+
+# The trajectories of a set are stored as ragged (CSR) arrays. trajectory_array holds the points of all trajectories,
+# the points of trajectory i are trajectory_array[offsets[i]: offsets[i + 1]]. level1_cell_index_sequence,
+# level2_cell_index_sequence and usable_sequence have one entry per point and share offsets. The simple trajectories
+# (cell_sequence, cell_sequence_frequency, usable_simple_sequence) share simple_offsets. trajectory_index and
+# has_not_usable_index have one entry per trajectory. Point and simple fields are None until they are calculated.
+# The Trajectory objects of trajectory_list are views of these arrays.
 class TrajectorySet:
 
+    trajectory_array = SetArray()
+    level1_cell_index_sequence = SetArray()
+    level2_cell_index_sequence = SetArray()
+    usable_sequence = SetArray()
+    simple_offsets = SetArray()
+    cell_sequence = SetArray()
+    cell_sequence_frequency = SetArray()
+    usable_simple_sequence = SetArray()
+
     def __init__(self):
-        self.trajectory_list = []
+        self.field_arrays = {'trajectory_array': np.empty((0, 2)), 'simple_offsets': np.zeros(1, dtype=np.int64)}
+        for field_name in POINT_FIELDS + SIMPLE_FIELDS:
+            self.field_arrays[field_name] = None
+        # trajectories without a value of a point field, a field that is not in the dict has a value for every
+        # trajectory once its array exists
+        self.missing_point_values = {}
+        # simple trajectories written with another size than before, position -> simple field name -> value. They are
+        # moved into the arrays at once by flush_simple_writes.
+        self.simple_writes = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.trajectory_index = np.array([], dtype=int)
+        self.has_not_usable_index = np.array([], dtype=bool)
         self.trajectory_number = 0
+        # fields of trajectories added one by one, they are moved into the arrays when the arrays are used next time
+        self.pending_trajectories = []
+        self.trajectory_views = []
+        # index of usable simple trajectories, it is built by the first prefix query
+        self.prefix_index = None
 
     # this function give new trajectory number
     def refresh_trajectory_number(self):
-        self.trajectory_number = len(self.trajectory_list)
+        self.trajectory_number = self.offsets.size - 1 + len(self.pending_trajectories)
 
     # this function give trajectory number
     def get_trajectory_number(self):
         return self.trajectory_number
 
+    # this function gives the list of trajectories, every trajectory is a view of the arrays of this set
+    @property
+    def trajectory_list(self) -> list:
+        self.flush_pending_trajectories()
+        for position in range(len(self.trajectory_views), self.trajectory_number):
+            self.trajectory_views.append(Trajectory(self, position))
+        return self.trajectory_views
+
     # this function give set trajectory list
     def give_trajectory_list(self, trajectory_list1):
         if not isinstance(trajectory_list1, list):
             raise TypeError('TrajectorySet must receive list of trajectory as parameter')
-        self.trajectory_list += trajectory_list1
-        self.refresh_trajectory_number()
+        for trajectory1 in trajectory_list1:
+            self.add_trajectory(trajectory1, give_index=False)
 
     # this function add new trajectory in trajectory list
     def add_trajectory(self, trajectory1, give_index=True):
-        sample1 = Trajectory()
-        if type(sample1) is not type(trajectory1):
+        if not isinstance(trajectory1, Trajectory):
             raise TypeError('Must add trajectory to set')
+        if trajectory1.trajectory_set is not None:
+            raise ValueError('trajectory is already in a set')
         trajectory_number_now = self.get_trajectory_number()
         if give_index:
             trajectory1.give_index(trajectory_number_now + 1)
-        self.trajectory_list.append(trajectory1)
+        self.pending_trajectories.append(trajectory1.own_fields)
+        trajectory1.bind_to_set(self, trajectory_number_now)
+        self.trajectory_views.append(trajectory1)
         self.refresh_trajectory_number()
 
+    # this function adds many trajectories at once, the points of trajectory i are points[offsets[i]: offsets[i + 1]]
+    def give_points_and_offsets(self, points: np.ndarray, offsets: np.ndarray, give_index=True):
+        self.flush_pending_trajectories()
+        offsets = np.asarray(offsets, dtype=np.int64)
+        new_trajectory_number = offsets.size - 1
+        new_point_numbers = np.diff(offsets)
+        new_simple_numbers = np.zeros(new_trajectory_number, dtype=np.int64)
+        if give_index:
+            new_index = np.arange(new_trajectory_number) + self.trajectory_number + 1
+        else:
+            new_index = np.zeros(new_trajectory_number, dtype=int) - 1
+        new_fields = {'trajectory_index': new_index, 'has_not_usable_index': np.zeros(new_trajectory_number, dtype=bool)}
+        self.append_trajectories(points, new_point_numbers, new_simple_numbers, new_fields)
+
     # this function give trajectory according to index
     def give_trajectory_by_index(self, index1) -> Trajectory:
         try:
@@ -53,39 +156,312 @@ class TrajectorySet:
 
     # this function calculate all point number in this trajectory set
     def get_whole_point_number(self) -> int:
-        point_number = 0
-        trajectory_number = self.get_trajectory_number()
-        for trajectory_index in range(trajectory_number):
-            trajectory1 = self.give_trajectory_by_index(trajectory_index)
-            this_trajectory_point_number = trajectory1.get_point_number()
-            point_number = point_number + this_trajectory_point_number
-        return point_number
+        self.check_point_numbers()
+        return int(self.offsets[-1])
+
+    # this function raises a ValueError if a trajectory has no points, like Trajectory.get_point_number
+    def check_point_numbers(self) -> None:
+        point_numbers = self.give_point_numbers()
+        if (point_numbers == 0).any():
+            empty_position = int(np.flatnonzero(point_numbers == 0)[0])
+            raise ValueError('Point number of trajectory {} is zero!'.format(self.trajectory_index[empty_position]))
+
+    # this function gives the point number of every trajectory
+    def give_point_numbers(self) -> np.ndarray:
+        self.flush_pending_trajectories()
+        return np.diff(self.offsets)
+
+    # this function gives the point number of the trajectory at position
+    def give_point_number_of(self, position: int) -> int:
+        self.flush_pending_trajectories()
+        return int(self.offsets[position + 1] - self.offsets[position])
+
+    # this function keeps the points of point_indicator and removes the other ones, trajectories without points are
+    # removed. Cell and simple fields are calculated again after this and trajectories of trajectory_list before this
+    # are not valid anymore.
+    def keep_points(self, point_indicator: np.ndarray) -> None:
+        self.flush_pending_trajectories()
+        trajectory_positions = self.give_trajectory_position_of_points()
+        kept_point_numbers = np.bincount(trajectory_positions[point_indicator], minlength=self.trajectory_number)
+        kept_trajectories = kept_point_numbers > 0
+        self.trajectory_array = self.trajectory_array[point_indicator]
+        self.offsets = np.zeros(int(np.sum(kept_trajectories)) + 1, dtype=np.int64)
+        np.cumsum(kept_point_numbers[kept_trajectories], out=self.offsets[1:])
+        self.trajectory_index = self.trajectory_index[kept_trajectories]
+        self.has_not_usable_index = self.has_not_usable_index[kept_trajectories]
+        self.simple_writes = {}
+        self.missing_point_values = {}
+        for field_name in POINT_FIELDS + SIMPLE_FIELDS:
+            self.field_arrays[field_name] = None
+        self.simple_offsets = np.zeros(self.offsets.size, dtype=np.int64)
+        self.trajectory_views = []
+        self.prefix_index = None
+        self.refresh_trajectory_number()
+
+    # this function gives for every point the position of its trajectory
+    def give_trajectory_position_of_points(self) -> np.ndarray:
+        return np.repeat(np.arange(self.trajectory_number), self.give_point_numbers())
 
     # this function gives discrete trajectory the sample trajectory(unrepeated cell index array and its frequency)
     def get_simple_trajectory(self, dict1: np.ndarray):
-        for trajectory1 in self.trajectory_list:
-            trajectory1.give_simple_trajectory(dict1)
+        point_numbers = self.give_point_numbers()
+        if (point_numbers == 0).any():
+            raise IndexError('a trajectory without points has no simple trajectory')
+        # the simple trajectories of all trajectories are replaced, buffered ones are not needed anymore
+        self.simple_writes = {}
+        level2_sequence = self.level2_cell_index_sequence
+        if level2_sequence is None:
+            level2_sequence = np.array([], dtype=int)
+        # a new element of a simple trajectory begins at the start of a trajectory and where the subcell changes
+        new_element = np.ones(level2_sequence.size, dtype=bool)
+        new_element[1:] = level2_sequence[1:] != level2_sequence[:-1]
+        new_element[self.offsets[:-1]] = True
+        element_starts = np.flatnonzero(new_element)
+        self.cell_sequence = level2_sequence[element_starts].astype(int)
+        self.cell_sequence_frequency = np.diff(np.append(element_starts, level2_sequence.size)).astype(int)
+        self.usable_simple_sequence = dict1[self.cell_sequence]
+        self.prefix_index = None
+        simple_offsets = np.zeros(self.trajectory_number + 1, dtype=np.int64)
+        simple_offsets[:-1] = np.searchsorted(element_starts, self.offsets[:-1])
+        simple_offsets[-1] = element_starts.size
+        self.simple_offsets = simple_offsets
+
+    # this function gives a field of the trajectory at position, see Trajectory
+    def give_field(self, field_name: str, field_kind: str, position: int):
+        self.flush_pending_trajectories()
+        if field_kind == 'trajectory':
+            return getattr(self, field_name)[position]
+        if field_kind == 'simple' and position in self.simple_writes:
+            return self.give_buffered_simple_field(field_name, position)
+        field_array = self.field_arrays[field_name]
+        missing_values = self.missing_point_values.get(field_name)
+        if field_array is None or (missing_values is not None and missing_values[position]):
+            return give_field_default(field_name)
+        if field_kind == 'point':
+            return field_array[self.offsets[position]: self.offsets[position + 1]]
+        simple_offsets = self.field_arrays['simple_offsets']
+        return field_array[simple_offsets[position]: simple_offsets[position + 1]]
+
+    # this function gives a simple field of a buffered simple trajectory, a field without a value gets -1 entries
+    def give_buffered_simple_field(self, field_name: str, position: int) -> np.ndarray:
+        buffered_fields = self.simple_writes[position]
+        if field_name not in buffered_fields:
+            entry_number = next(iter(buffered_fields.values())).size
+            field_array = self.field_arrays[field_name]
+            field_type = int if field_array is None else field_array.dtype
+            buffered_fields[field_name] = np.zeros(entry_number, dtype=field_type) - 1
+        return buffered_fields[field_name]
+
+    # this function gives a point field of all trajectories at once. Trajectories of missing_indicator get no value,
+    # their field is empty as before it was calculated.
+    def give_point_field(self, field_name: str, values: np.ndarray, missing_indicator: np.ndarray) -> None:
+        self.flush_pending_trajectories()
+        setattr(self, field_name, values)
+        if missing_indicator.any():
+            self.missing_point_values[field_name] = np.array(missing_indicator, dtype=bool)
+
+    # this function sets a field of the trajectory at position. Point fields are written in place, a simple field
+    # of another size is buffered, see set_simple_field.
+    def set_field(self, field_name: str, field_kind: str, position: int, value):
+        self.flush_pending_trajectories()
+        if field_kind == 'trajectory':
+            getattr(self, field_name)[position] = value
+        elif field_kind == 'point':
+            if field_name == 'trajectory_array':
+                raise AttributeError('points of a trajectory in a set can not be replaced')
+            start, end = self.offsets[position], self.offsets[position + 1]
+            value = np.asarray(value)
+            if value.size != end - start:
+                raise ValueError('{} of trajectory {} must have one entry per point'.format(field_name, position))
+            if self.field_arrays[field_name] is None:
+                self.field_arrays[field_name] = np.zeros(self.offsets[-1], dtype=int) - 1
+                self.missing_point_values[field_name] = np.ones(self.trajectory_number, dtype=bool)
+            self.field_arrays[field_name][start: end] = value
+            if field_name in self.missing_point_values:
+                self.missing_point_values[field_name][position] = False
+        else:
+            self.set_simple_field(field_name, position, np.asarray(value))
+
+    # this function sets a simple field of the trajectory at position. A value of the size of the simple trajectory is
+    # written in place. A value of another size is buffered in simple_writes together with the other simple fields of
+    # the trajectory, so writing all trajectories one by one moves the arrays only once.
+    def set_simple_field(self, field_name: str, position: int, value: np.ndarray):
+        self.prefix_index = None
+        buffered_fields = self.simple_writes.get(position)
+        if buffered_fields is not None:
+            if value.size != next(iter(buffered_fields.values())).size:
+                buffered_fields.clear()
+            buffered_fields[field_name] = value.copy()
+            return
+        simple_offsets = self.field_arrays['simple_offsets']
+        start, end = simple_offsets[position], simple_offsets[position + 1]
+        if value.size != end - start:
+            self.simple_writes[position] = {field_name: value.copy()}
+            return
+        for simple_field_name in SIMPLE_FIELDS:
+            if self.field_arrays[simple_field_name] is None:
+                self.field_arrays[simple_field_name] = np.zeros(simple_offsets[-1], dtype=int) - 1
+        field_array = self.field_arrays[field_name]
+        if not np.can_cast(value.dtype, field_array.dtype, casting='same_kind'):
+            field_array = field_array.astype(np.result_type(field_array, value))
+            self.field_arrays[field_name] = field_array
+        field_array[start: end] = value
+
+    # this function moves the buffered simple trajectories into the simple arrays. Every array is built once, entries
+    # of fields without a buffered value are -1.
+    def flush_simple_writes(self):
+        if not self.simple_writes:
+            return
+        simple_writes = self.simple_writes
+        self.simple_writes = {}
+        positions = np.array(sorted(simple_writes), dtype=np.int64)
+        buffered_list = [simple_writes[position] for position in positions.tolist()]
+        buffered_numbers = [next(iter(buffered_fields.values())).size for buffered_fields in buffered_list]
+        old_offsets = self.field_arrays['simple_offsets']
+        old_numbers = np.diff(old_offsets)
+        new_numbers = old_numbers.copy()
+        new_numbers[positions] = buffered_numbers
+        is_buffered = np.zeros(old_numbers.size, dtype=bool)
+        is_buffered[positions] = True
+        old_kept = ~np.repeat(is_buffered, old_numbers)
+        new_buffered = np.repeat(is_buffered, new_numbers)
+        new_offsets = np.zeros(old_offsets.size, dtype=np.int64)
+        np.cumsum(new_numbers, out=new_offsets[1:])
+        for field_name in SIMPLE_FIELDS:
+            old_array = self.field_arrays[field_name]
+            if old_array is None:
+                old_array = np.zeros(old_offsets[-1], dtype=int) - 1
+            field_type = old_array.dtype
+            for buffered_fields in buffered_list:
+                value = buffered_fields.get(field_name)
+                if value is not None and not np.can_cast(value.dtype, field_type, casting='same_kind'):
+                    field_type = np.result_type(field_type, value.dtype)
+            new_array = np.empty(new_offsets[-1], dtype=field_type)
+            new_array[~new_buffered] = old_array[old_kept]
+            new_array[new_buffered] = np.concatenate([
+                buffered_fields.get(field_name, np.zeros(entry_number, dtype=field_type) - 1)
+                for buffered_fields, entry_number in zip(buffered_list, buffered_numbers)])
+            self.field_arrays[field_name] = new_array
+        self.field_arrays['simple_offsets'] = new_offsets
 
-    #
+    # this function moves trajectories added by add_trajectory into the arrays
+    def flush_pending_trajectories(self):
+        if not self.pending_trajectories:
+            return
+        pending_fields = self.pending_trajectories
+        self.pending_trajectories = []
+        points = [np.asarray(fields['trajectory_array'], dtype=float).reshape((-1, 2)) for fields in pending_fields]
+        point_numbers = np.array([point_array.shape[0] for point_array in points], dtype=np.int64)
+        simple_numbers = np.array([np.asarray(fields['cell_sequence']).size for fields in pending_fields],
+                                  dtype=np.int64)
+        new_fields = {
+            'trajectory_index': np.array([fields['trajectory_index'] for fields in pending_fields], dtype=int),
+            'has_not_usable_index': np.array([fields['has_not_usable_index'] for fields in pending_fields],
+                                             dtype=bool),
+        }
+        new_missing_values = {}
+        for field_name, entry_numbers in [(name, point_numbers) for name in POINT_FIELDS] + \
+                                         [(name, simple_numbers) for name in SIMPLE_FIELDS]:
+            values = [np.asarray(fields[field_name]) for fields in pending_fields]
+            if all(value.size == 0 for value in values):
+                continue
+            missing_values = np.array([value.size != entry_number for value, entry_number in
+                                       zip(values, entry_numbers)], dtype=bool)
+            new_fields[field_name] = np.concatenate([
+                np.zeros(entry_number, dtype=int) - 1 if missing else value
+                for value, entry_number, missing in zip(values, entry_numbers, missing_values)])
+            if field_name in POINT_FIELDS:
+                new_missing_values[field_name] = missing_values
+        self.append_trajectories(np.concatenate(points), point_numbers, simple_numbers, new_fields, new_missing_values)
+
+    # this function appends trajectories to the arrays. Fields that are missing in new_fields are filled with -1, the
+    # new trajectories have no value of a point field that is missing in new_fields or marked in new_missing_values.
+    def append_trajectories(self, points: np.ndarray, point_numbers: np.ndarray, simple_numbers: np.ndarray,
+                            new_fields: dict, new_missing_values: dict = None):
+        self.flush_simple_writes()
+        self.prefix_index = None
+        if new_missing_values is None:
+            new_missing_values = {}
+        field_arrays = self.field_arrays
+        old_trajectory_number = self.offsets.size - 1
+        new_trajectory_number = point_numbers.size
+        old_point_number = int(self.offsets[-1])
+        old_simple_number = int(field_arrays['simple_offsets'][-1])
+        if old_point_number == 0:
+            field_arrays['trajectory_array'] = points
+        else:
+            field_arrays['trajectory_array'] = np.concatenate((field_arrays['trajectory_array'], points))
+        self.offsets = np.concatenate((self.offsets, old_point_number + np.cumsum(point_numbers)))
+        field_arrays['simple_offsets'] = np.concatenate((field_arrays['simple_offsets'],
+                                                         old_simple_number + np.cumsum(simple_numbers)))
+        for field_name, old_number, new_number in [(name, old_point_number, int(np.sum(point_numbers)))
+                                                   for name in POINT_FIELDS] + \
+                                                  [(name, old_simple_number, int(np.sum(simple_numbers)))
+                                                   for name in SIMPLE_FIELDS]:
+            field_array = field_arrays[field_name]
+            if field_array is None and field_name not in new_fields:
+                continue
+            if field_name in POINT_FIELDS:
+                old_missing = self.missing_point_values.get(field_name)
+                if old_missing is None:
+                    old_missing = np.zeros(old_trajectory_number, dtype=bool) | (field_array is None)
+                new_missing = new_missing_values.get(field_name, np.zeros(new_trajectory_number, dtype=bool))
+                if field_name not in new_fields:
+                    new_missing = np.ones(new_trajectory_number, dtype=bool)
+                missing_values = np.concatenate((old_missing, new_missing))
+                if missing_values.any():
+                    self.missing_point_values[field_name] = missing_values
+                else:
+                    self.missing_point_values.pop(field_name, None)
+            if field_array is None:
+                field_array = np.zeros(old_number, dtype=int) - 1
+            new_array = new_fields.get(field_name, np.zeros(new_number, dtype=int) - 1)
+            field_arrays[field_name] = np.concatenate((field_array, new_array))
+        self.trajectory_index = np.concatenate((self.trajectory_index, new_fields['trajectory_index']))
+        self.has_not_usable_index = np.concatenate((self.has_not_usable_index, new_fields['has_not_usable_index']))
+        self.refresh_trajectory_number()
+
+    # this function gives the prefix index of the usable simple trajectories
+    def give_prefix_index(self) -> PrefixIndex:
+        self.flush_pending_trajectories()
+        if self.prefix_index is None:
+            usable_simple_sequence = self.usable_simple_sequence
+            if usable_simple_sequence is None:
+                usable_simple_sequence = np.array([], dtype=int)
+            self.prefix_index = PrefixIndex(usable_simple_sequence, self.simple_offsets)
+        return self.prefix_index
+
+    # this function gives the usable simple trajectories beginning with prefix, how often every state follows the
+    # prefix and how many trajectories end with the prefix. Like in the original code nothing in the pipeline calls
+    # it, it is the query interface for analyses of the real simple trajectories outside the pipeline.
     def find_trajectories_with_given_prefix(self, prefix):
+        return self.give_prefix_index().query_prefix(np.asarray(prefix))
+
+    # this function answers find_trajectories_with_given_prefix for every prefix of a list
+    def find_trajectories_with_given_prefixes(self, prefix_list: list) -> list:
+        return self.give_prefix_index().query_prefixes([np.asarray(prefix) for prefix in prefix_list])
+
+    # this function is the linear scan over all trajectories answering a prefix query, it is kept as reference.
+    # Sequences shorter than the prefix do not match, negative (not usable) next states are not counted and a next
+    # state that grows states_tran is counted.
+    def find_trajectories_with_given_prefix_by_scan(self, prefix):
         tras = []
         states_tran = np.zeros(1000)
         prefix_length = prefix.size
         end_weights = 0
         for tr in self.trajectory_list:
             seq = tr.usable_simple_sequence
-            if (seq[:prefix_length] == prefix).all():
+            if seq.size >= prefix_length and (seq[:prefix_length] == prefix).all():
                 tras.append(seq)
                 if seq.size == prefix_length:
                     end_weights += 1
-                else:
+                elif seq[prefix_length] >= 0:
                     next_state = seq[prefix_length]
                     if next_state >= states_tran.size:
                         tem = np.zeros(next_state + 1)
                         tem[:states_tran.size] = states_tran
                         states_tran = tem
-                    else:
-                        states_tran[next_state] += 1
+                    states_tran[next_state] += 1
         return tras, states_tran, end_weights
 
 
@@ -1,5 +1,6 @@
 from discretization.grid import Grid
 from config.parameter_carrier import ParameterCarrier
+from primarkov.partial_statistics import ShardCounter
 
 
 class DisData:
@@ -15,3 +16,19 @@ class DisData:
         if self.cc.trajectory_number_to_generate < 0:
             self.cc.trajectory_number_to_generate = trajectory_set1.trajectory_number
         return grid
+
+    # this function is the first pass of the streaming mode, the grid is built from TrajectoryChunks without
+    # keeping the trajectories, see ModelBuilder.build_model_in_chunks for the second pass
+    def get_discrete_data_in_chunks(self, trajectory_chunks):
+        grid = Grid(self.cc)
+        if self.cc.shard_number > 1:
+            grid.level1_grid_of_chunks(trajectory_chunks)
+            partial1 = ShardCounter(self.cc.shard_number, self.cc.shard_number).count(grid, trajectory_chunks)
+            grid.level2_grid_of_level1_density(partial1.give_sum('level1_density'))
+        else:
+            grid.get_grid_in_chunks(trajectory_chunks)
+        grid.state_pruning()
+        grid.construct_usable_index_neighbors()
+        if self.cc.trajectory_number_to_generate < 0:
+            self.cc.trajectory_number_to_generate = grid.trajectory_number
+        return grid
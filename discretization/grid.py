@@ -1,12 +1,16 @@
-import copy as cop
+import heapq
 import logging
 
 import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from scipy.spatial import cKDTree
 
 from config.parameter_carrier import ParameterCarrier
 from data_preparation.trajectory import Trajectory
 from data_preparation.trajectory_set import TrajectorySet
 from discretization.divide import Divide
+from discretization.subcell_index import SubcellSpatialIndex
 from tools.general_tools import GeneralTools
 from tools.noise import Noise
 
@@ -57,15 +61,29 @@ class Grid:
         self.level2_borders = np.array([])
         self.level2_x_bin_dict = []
         self.level2_y_bin_dict = []
+        # subcell (large cell c, x, y) has index level2_index_base[c] + x * level2_subdividing_parameter[c] + y
+        self.level2_index_base = np.array([], dtype=int)
+        # subdividing bins of all large cells in one array, bins of cell c start at level2_x_bin_offsets[c]
+        self.level2_x_bin_array = np.array([])
+        self.level2_y_bin_array = np.array([])
+        self.level2_x_bin_offsets = np.array([], dtype=int)
+        self.level2_y_bin_offsets = np.array([], dtype=int)
         self.subcell_number = -1
         self.level2_real_density = np.array([])
         self.level2_noisy_density = np.array([])
         self.real_subcell_index_to_usable_index_dict = np.array([])
         self.usable_subcell_index_to_real_index_dict = np.array([])
         self.usable_state_number = -1
-        self.subcell_neighbors_position = []
-        self.subcell_neighbors_real_index = []
-        self.subcell_neighbors_usable_index = []
+        # the subcell points of a subcell are moved to, a subcell dropped by state pruning is mapped to the nearest kept
+        # subcell, every other subcell to itself
+        self.subcell_to_kept_subcell_dict = np.array([], dtype=int)
+        # central points of usable states, row i is latitude and longitude of usable state i
+        self.usable_state_central_point_array = np.zeros((0, 2))
+        # adjacency of subcells and of usable states, see adjacency_matrix
+        self.subcell_adjacency = sparse.csr_matrix((0, 0), dtype=bool)
+        self.usable_state_adjacency = sparse.csr_matrix((0, 0), dtype=bool)
+        # rectangle and point queries over subcells, see SubcellSpatialIndex
+        self.spatial_index = None
 
     def give_level2_cells_border(self, borders: np.ndarray) -> None:
         self.level2_borders = borders
@@ -219,23 +237,55 @@ class Grid:
         return self.level2_y_bin_dict[index]
 
     def border(self, trajectory_set1: TrajectorySet) -> None:
+        trajectory_set1.flush_pending_trajectories()
+        trajectory_set1.check_point_numbers()
+        arr = trajectory_set1.trajectory_array
+        bounding_box = None
+        if arr.shape[0] > 0 and self.cc.border_quantile > 0:
+            gt1 = GeneralTools()
+            low_rank, high_rank = gt1.give_quantile_ranks(arr.shape[0], self.cc.border_quantile)
+            bounds = np.partition(arr, [low_rank, high_rank], axis=0)
+            bounding_box = [bounds[low_rank, 0], bounds[low_rank, 1], bounds[high_rank, 0], bounds[high_rank, 1]]
+        elif arr.shape[0] > 0:
+            bounding_box = [np.amin(arr[:, 0]), np.amin(arr[:, 1]), np.amax(arr[:, 0]), np.amax(arr[:, 1])]
+        self.border_of_bounding_box(bounding_box)
+
+    # this function handles points outside of the border by outlier_policy: 'clamp' moves them onto the border,
+    # 'drop_point' removes them and 'drop_trajectory' removes their trajectories. Points are only outside of the
+    # border if it is set from quantiles, see border.
+    def process_outliers(self, trajectory_set1: TrajectorySet) -> None:
+        north, south, west, east = self.get_border('all')
+        points = trajectory_set1.trajectory_array
+        outside = (points[:, 0] < west) | (points[:, 0] > east) | (points[:, 1] < south) | (points[:, 1] > north)
+        if not outside.any():
+            return
+        outlier_policy = self.cc.outlier_policy
+        if outlier_policy == 'clamp':
+            clamped_points = np.empty_like(points)
+            clamped_points[:, 0] = np.clip(points[:, 0], west, east)
+            clamped_points[:, 1] = np.clip(points[:, 1], south, north)
+            trajectory_set1.trajectory_array = clamped_points
+        elif outlier_policy == 'drop_point':
+            trajectory_set1.keep_points(~outside)
+        elif outlier_policy == 'drop_trajectory':
+            trajectory_positions = trajectory_set1.give_trajectory_position_of_points()
+            outlier_number = np.bincount(trajectory_positions[outside], minlength=trajectory_set1.trajectory_number)
+            trajectory_set1.keep_points(outlier_number[trajectory_positions] == 0)
+        else:
+            raise ValueError('wrong outlier policy')
+
+    # this function sets the border from [x_min, y_min, x_max, y_max] of all points, None if there are no points
+    def border_of_bounding_box(self, bounding_box) -> None:
         extend_ratio1 = self.get_extend_ratio()
         south1 = 1000000000
         north1 = -1000000000
         west1 = 1000000000
         east1 = -1000000000
-        trajectory_number = trajectory_set1.trajectory_number
-        for trajectory_index in range(trajectory_number):
-            trajectory1 = trajectory_set1.give_trajectory_by_index(trajectory_index)
-            arr = trajectory1.trajectory_array
-            if west1 > np.amin(arr[:, 0]):
-                west1 = np.amin(arr[:, 0])
-            if east1 < np.amax(arr[:, 0]):
-                east1 = np.max(arr[:, 0])
-            if south1 > np.amin(arr[:, 1]):
-                south1 = np.amin(arr[:, 1])
-            if north1 < np.amax(arr[:, 1]):
-                north1 = np.amax(arr[:, 1])
+        if bounding_box is not None:
+            west1 = min(west1, bounding_box[0])
+            east1 = max(east1, bounding_box[2])
+            south1 = min(south1, bounding_box[1])
+            north1 = max(north1, bounding_box[3])
         x_extend = extend_ratio1 * (east1 - west1)
         west1 = west1 - x_extend
         east1 = east1 + x_extend
@@ -249,6 +299,10 @@ class Grid:
     def give_point_number(self, trajectory_set1: TrajectorySet) -> None:
         point_number = trajectory_set1.get_whole_point_number()
         trajectory_number = trajectory_set1.trajectory_number
+        self.give_point_and_trajectory_number(point_number, trajectory_number)
+
+    # this function gives point number and trajectory number of the whole dataset
+    def give_point_and_trajectory_number(self, point_number: int, trajectory_number: int) -> None:
         self.give_whole_point_number(point_number)
         self.trajectory_number = trajectory_number
 
@@ -286,22 +340,15 @@ class Grid:
         row_number = y_divide_bins.size - 1
         column_number = x_divide_bins.size - 1
         cell_number = row_number * column_number
+        # cells are numbered column by column
+        x_index = np.repeat(np.arange(column_number), row_number)
+        y_index = np.tile(np.arange(row_number), column_number)
         index_border_dict = np.empty((cell_number, 4))
-        index_border_dict.reshape((-1, 4))
-        index_position_dict = np.empty((cell_number, 2), dtype=int)
-        index_position_dict.reshape((-1, 2))
-        cell_counter = 0
-        for x_index in range(column_number):
-            for y_index in range(row_number):
-                north_border = y_divide_bins[y_index + 1]
-                south_border = y_divide_bins[y_index]
-                west_border = x_divide_bins[x_index]
-                east_border = x_divide_bins[x_index + 1]
-                border_array = np.array([[north_border, south_border, west_border, east_border]])
-                position_array = np.array([[x_index, y_index]])
-                index_border_dict[cell_counter] = border_array
-                index_position_dict[cell_counter] = position_array
-                cell_counter = cell_counter + 1
+        index_border_dict[:, 0] = y_divide_bins[y_index + 1]
+        index_border_dict[:, 1] = y_divide_bins[y_index]
+        index_border_dict[:, 2] = x_divide_bins[x_index]
+        index_border_dict[:, 3] = x_divide_bins[x_index + 1]
+        index_position_dict = np.stack((x_index, y_index), axis=1).astype(int)
         self.give_level1_index_border_dict(index_border_dict)
         self.give_level1_index_position_dict(index_position_dict)
         position_index_dict = self.level1_position_index_dictionary()
@@ -319,12 +366,8 @@ class Grid:
     # this function creates a dictionary of position-index of level 1 dividing
     def level1_position_index_dictionary(self) -> dict:
         index_position_dict = self.get_level1_index_position_dict()
-        position_index_dict = {}
-        for cell_index in range(index_position_dict.shape[0]):
-            row_index = index_position_dict[cell_index, 0]
-            column_index = index_position_dict[cell_index, 1]
-            position_tuple = (row_index, column_index)
-            position_index_dict[position_tuple] = cell_index
+        positions = map(tuple, index_position_dict.tolist())
+        position_index_dict = dict(zip(positions, range(index_position_dict.shape[0])))
         return position_index_dict
 
     # This function creates level1 cell for
@@ -334,11 +377,16 @@ class Grid:
         self.cell_borders(x_divide_bins, y_divide_bins)
 
     # this function makes point array in trajectories become cell array
+    # all points of the set are looked up at once, see level1_trajectory_point_to_cell
     def level1_trajectory_set_point_to_cell(self, trajectory_set1: TrajectorySet) -> None:
-        trajectory_number = trajectory_set1.get_trajectory_number()
-        for trajectory_index1 in range(trajectory_number):
-            trajectory1 = trajectory_set1.give_trajectory_by_index(trajectory_index1)
-            self.level1_trajectory_point_to_cell(trajectory1)
+        general_tool1 = GeneralTools()
+        point_array = trajectory_set1.trajectory_array.reshape((-1, 2))
+        x_bin = self.get_x_divide_bins()
+        y_bin = self.get_y_divide_bins()
+        level1_cell_index = general_tool1.get_points_bin_index(point_array, x_bin, y_bin)
+        self.illegal_index_process(level1_cell_index, 'error')
+        cell_index_array = self.get_trajectory_point_level1_index(level1_cell_index[:, 1], level1_cell_index[:, 0])
+        trajectory_set1.level1_cell_index_sequence = cell_index_array
 
     # this function transforms point array in a single trajectory into cell index array
     def level1_trajectory_point_to_cell(self, trajectory1: Trajectory,
@@ -363,17 +411,30 @@ class Grid:
 
     # this function calculates cell density of level1 dividing
     def level1_density(self, trajectory_set1: TrajectorySet) -> None:
-        cell_number = self.get_level1_cell_number()
-        density = np.zeros(cell_number)
-        trajectory_number = trajectory_set1.get_trajectory_number()
-        for trajectory_index in range(trajectory_number):
-            if trajectory_index >= trajectory_number:
-                raise IndexError('wrong index'.format(trajectory_index))
-            trajectory1 = trajectory_set1.give_trajectory_by_index(trajectory_index)
-            frequency_array = trajectory1.give_regularized_trajectory_cell_density(cell_number)
-            density = density + frequency_array
+        density = np.zeros(self.get_level1_cell_number())
+        density = self.add_level1_density(trajectory_set1, density)
         self.give_level1_real_density(density)
 
+    # this function adds the level1 densities of the trajectories of a set to density, one trajectory after another.
+    # the density of a trajectory in a cell is its point number in the cell divided by its point number, the densities
+    # are added in trajectory order so that the sums do not depend on how the trajectories are split into sets
+    def add_level1_density(self, trajectory_set1: TrajectorySet, density: np.ndarray) -> np.ndarray:
+        cell_number = self.get_level1_cell_number()
+        general_tool1 = GeneralTools()
+        trajectory_set1.flush_pending_trajectories()
+        trajectory_set1.check_point_numbers()
+        trajectory_positions = trajectory_set1.give_trajectory_position_of_points()
+        cell_indices, frequency = general_tool1.grouped_frequency(
+            trajectory_positions, trajectory_set1.level1_cell_index_sequence, trajectory_set1.give_point_numbers())
+        wrong_cell_index = (cell_indices >= cell_number)
+        if wrong_cell_index.any():
+            wrong_position = trajectory_positions[np.flatnonzero(
+                trajectory_set1.level1_cell_index_sequence >= cell_number)[0]]
+            raise IndexError('trajectory {} has wrong cell index'.format(trajectory_set1.trajectory_index[wrong_position]))
+        density = np.array(density, dtype=float)
+        np.add.at(density, cell_indices, frequency)
+        return density
+
     # this function gives noisy frequency
     def noisy_frequency(self, epsilon_for_level1_density) -> None:
         cc1 = self.cc
@@ -405,13 +466,36 @@ class Grid:
             if level1_cell_need_to_subdivide[cell_index]:
                 subdividing_number = self.subdividing_number(noisy_density[cell_index])
                 subdividing_parameter[cell_index] = subdividing_number
+        if self.cc.state_pruning == 'merge' and self.cc.max_state_number > 0:
+            subdividing_parameter = self.merge_subcells_to_budget(subdividing_parameter, self.cc.max_state_number)
         log.info(f"Subdividing parameter (=Kappa): {subdividing_parameter}")
         self.give_level2_parameter(subdividing_parameter)
 
-    # this function initialize two parameter storage array for subdividing
-    def initializing_subdividing_parameter(self, subdividing_cell_number: int):
-        self.level2_borders = np.empty((subdividing_cell_number, 4))
-        self.level2_index_position_dict = np.empty((subdividing_cell_number, 3), dtype=int)
+    # this function lowers the subdividing parameters of the large cells with the least noisy density per subcell until
+    # there are at most max_state_number subcells or no large cell is subdivided. Only the noisy level1 density is
+    # used, so no privacy budget is spent.
+    def merge_subcells_to_budget(self, subdividing_parameter: np.ndarray, max_state_number: int) -> np.ndarray:
+        if np.sum(subdividing_parameter ** 2) <= max_state_number:
+            return subdividing_parameter
+        noisy_density = np.maximum(self.get_level1_noisy_density(), 0)
+        # the smallest density per subcell is searched by bisection, the number of subcells falls as it rises
+        low = 0.0
+        high = max(float(np.max(noisy_density)), 1.0)
+        for _ in range(100):
+            middle = (low + high) / 2
+            merged_parameter = self.merged_subdividing_parameter(subdividing_parameter, noisy_density, middle)
+            if np.sum(merged_parameter ** 2) > max_state_number:
+                low = middle
+            else:
+                high = middle
+        return self.merged_subdividing_parameter(subdividing_parameter, noisy_density, high)
+
+    # this function gives the subdividing parameters that give every subdivided large cell a density of at least
+    # subcell_density per subcell
+    def merged_subdividing_parameter(self, subdividing_parameter: np.ndarray, noisy_density: np.ndarray,
+                                     subcell_density: float) -> np.ndarray:
+        merged_parameter = np.floor(np.sqrt(noisy_density / subcell_density))
+        return np.clip(merged_parameter, 1, subdividing_parameter).astype(int)
 
     # this function calculate bins for subdividing
     def subdividing_bins(self, level1_cell_index: int, this_cell_subdividing_parameter: int):
@@ -427,318 +511,161 @@ class Grid:
         self.add_level2_subdividing_x_bin(this_cell_x_bin)
         self.add_level2_subdividing_y_bin(this_cell_y_bin)
 
-    def give_subcell_border(self, large_cell_index: int, subcell_index: int, subcell_inner_x_index: int,
-                            subcell_inner_y_index: int):
-        this_cell_x_bin = self.get_level2_subdividing_x_bin_by_index(large_cell_index)
-        this_cell_y_bin = self.get_level2_subdividing_y_bin_by_index(large_cell_index)
-        small_cell_w = this_cell_x_bin[subcell_inner_x_index]
-        small_cell_e = this_cell_x_bin[subcell_inner_x_index + 1]
-        small_cell_s = this_cell_y_bin[subcell_inner_y_index]
-        small_cell_n = this_cell_y_bin[subcell_inner_y_index + 1]
-        self.give_level2_border_by_index(subcell_index, small_cell_n, small_cell_s, small_cell_w, small_cell_e)
-
     # this function subdivides cells that are too dense
     def subdividing(self):
         self.level2_parameter()
         subdividing_parameter = self.get_level2_parameter()
-        subdividing_cell_number = subdividing_parameter ** 2
-        cell_number = np.sum(subdividing_cell_number)
-        cell_number = int(cell_number)
-        self.initializing_subdividing_parameter(cell_number)
-        subcell_index = 0
         for level1_cell_index in range(subdividing_parameter.size):
             this_cell_subdividing_parameter = subdividing_parameter[level1_cell_index]
             self.subdividing_bins(level1_cell_index, this_cell_subdividing_parameter)
-            for subcell_inner_x_index in range(this_cell_subdividing_parameter):
-                for subcell_inner_y_index in range(this_cell_subdividing_parameter):
-                    self.give_subcell_border(level1_cell_index, subcell_index, subcell_inner_x_index,
-                                             subcell_inner_y_index)
-                    self.give_level2_position_by_index(subcell_index, level1_cell_index, subcell_inner_x_index,
-                                                       subcell_inner_y_index)
-                    subcell_index = subcell_index + 1
+        self.level2_offset_tables()
+        self.subcell_tables()
         self.level2_position_to_index_dict()
         self.give_level2_subcell_to_large_cell_dict()
         # function to creat cells
         self.give_subcell_number()
         self.give_subcells_neighbors()
+        self.spatial_index = SubcellSpatialIndex(self)
+
+    # this function gives borders and positions (large cell, x, y) of all subcells. Subcells are numbered large cell by
+    # large cell, x by x within a large cell, see level2_offset_tables
+    def subcell_tables(self):
+        subdividing_parameter = self.get_level2_parameter().astype(int)
+        large_cells = np.repeat(np.arange(subdividing_parameter.size), subdividing_parameter ** 2)
+        cell_subdividing_parameter = subdividing_parameter[large_cells]
+        inner_index = np.arange(large_cells.size) - self.level2_index_base[large_cells]
+        x_index = inner_index // cell_subdividing_parameter
+        y_index = inner_index % cell_subdividing_parameter
+        x_bin_numbers = np.diff(self.level2_x_bin_offsets)
+        y_bin_numbers = np.diff(self.level2_y_bin_offsets)
+        if (x_bin_numbers <= subdividing_parameter).any() or (y_bin_numbers <= subdividing_parameter).any():
+            raise IndexError('subdividing bins are shorter than the subdividing parameter')
+        x_positions = self.level2_x_bin_offsets[large_cells] + x_index
+        y_positions = self.level2_y_bin_offsets[large_cells] + y_index
+        borders = np.empty((large_cells.size, 4))
+        borders[:, 0] = self.level2_y_bin_array[y_positions + 1]
+        borders[:, 1] = self.level2_y_bin_array[y_positions]
+        borders[:, 2] = self.level2_x_bin_array[x_positions]
+        borders[:, 3] = self.level2_x_bin_array[x_positions + 1]
+        self.give_level2_cells_border(borders)
+        self.give_level2_index_position_dict(np.stack((large_cells, x_index, y_index), axis=1).astype(int))
 
     # this function gives position to index dict of level2 cell
     def level2_position_to_index_dict(self):
         index_to_position_dict = self.level2_index_position_dict
-        position_to_index_dict = {}
-        subcell_number = index_to_position_dict.shape[0]
-        for cell_index in range(subcell_number):
-            position = (index_to_position_dict[cell_index, 0], index_to_position_dict[cell_index, 1],
-                        index_to_position_dict[cell_index, 2])
-            position_to_index_dict[position] = cell_index
+        positions = map(tuple, index_to_position_dict.tolist())
+        position_to_index_dict = dict(zip(positions, range(index_to_position_dict.shape[0])))
         self.give_level2_position_index_dict(position_to_index_dict)
 
+    # this function gives the tables to find subcells of points without the position index dict
+    def level2_offset_tables(self):
+        subdividing_parameter = self.get_level2_parameter()
+        self.level2_index_base = np.zeros(subdividing_parameter.size, dtype=int)
+        self.level2_index_base[1:] = np.cumsum(subdividing_parameter ** 2)[:-1]
+        self.level2_x_bin_array, self.level2_x_bin_offsets = self.concatenate_bins(self.level2_x_bin_dict)
+        self.level2_y_bin_array, self.level2_y_bin_offsets = self.concatenate_bins(self.level2_y_bin_dict)
+
+    # this function concatenates bins, it gives the bins and where the bins of every cell start and end
+    def concatenate_bins(self, bins: list):
+        offsets = np.zeros(len(bins) + 1, dtype=int)
+        offsets[1:] = np.cumsum([bin1.size for bin1 in bins])
+        if len(bins) == 0:
+            return np.array([]), offsets
+        return np.concatenate(bins), offsets
+
     #
     def give_level2_subcell_to_large_cell_dict(self):
         index_to_position_dict = self.level2_index_position_dict
-        array = np.zeros(index_to_position_dict.shape[0]) - 1
-        for row_i in range(index_to_position_dict.shape[0]):
-            array[row_i] = index_to_position_dict[row_i, 0]
-        self.level2_subcell_to_large_cell_dict = array
+        self.level2_subcell_to_large_cell_dict = index_to_position_dict[:, 0].copy()
 
     # this function gives subcell number
     def give_subcell_number(self):
         self.subcell_number = self.level2_index_position_dict.shape[0]
 
-    # this function gives all subcell neighbors
+    # this function gives the adjacency of all subcells. Subcells of a large cell are neighbors if they share a side.
+    # Of two adjacent large cells, every subcell at the common side is a neighbor of every subcell at the other side of
+    # it if neighbor_edge_matching is 'edge', and only of those whose sides overlap if it is 'overlap'
     def give_subcells_neighbors(self):
-        subcell_number = self.subcell_number
-        for subcell_index in range(subcell_number):
-            neighbors = self.get_neighbor_of_i(subcell_index)
-            self.subcell_neighbors_position.append(neighbors)
-
-    def construct_real_index_neighbors(self):
-        positions = self.subcell_neighbors_position
-        real_index = []
-        for neighbor_position in positions:
-            neighbor_number = neighbor_position.shape[0]
-            indices = np.empty(neighbor_number, dtype=int)
-            for neighbor_index_of_this_subcell in range(neighbor_number):
-                single_neighbor_position = neighbor_position[neighbor_index_of_this_subcell, :]
-                neighbor_subcell_index = self.level2_position_index_dict[tuple(single_neighbor_position)]
-                indices[neighbor_index_of_this_subcell] = int(neighbor_subcell_index)
-            real_index.append(indices)
-
-        self.subcell_neighbors_real_index = real_index
-
-    def construct_usable_index_neighbors(self):
-        real_indices = self.subcell_neighbors_real_index
-        usable_indices = []
-        tran_dict = self.real_subcell_index_to_usable_index_dict
-        for subcell_index in range(len(real_indices)):
-            usable_subcell_index = tran_dict[subcell_index]
-            if usable_subcell_index >= 0:
-                neighbor_indices_for_this = real_indices[subcell_index]
-                usable_indices_for_this = tran_dict[neighbor_indices_for_this]
-                usable_indices_for_this = np.unique(usable_indices_for_this)
-                if np.max(usable_indices_for_this) < 0:
-                    usable_indices_for_this = np.array([])
-                else:
-                    usable_indices_for_this = usable_indices_for_this[usable_indices_for_this >= 0]
-                usable_indices.append(usable_indices_for_this)
-        self.subcell_neighbors_usable_index = usable_indices
-
-    # this function gives subcell i neighbor subcells
-    def get_neighbor_of_i(self, subcell_i):
-        whole_position_of_i = self.level2_index_position_dict[subcell_i]
-        large_cell_number = whole_position_of_i[0]
-        subdividing_parameter = self.level2_subdividing_parameter[large_cell_number]
-        is_large_cell = False
-        if subdividing_parameter <= 1:
-            is_large_cell = True
-        if is_large_cell:
-            neighbors = self.neighbor_of_large_i(large_cell_number)
-        else:
-            x_in_large = whole_position_of_i[1]
-            y_in_large = whole_position_of_i[2]
-            neighbors = self.neighbor_of_subcell_i(large_cell_number, x_in_large, y_in_large)
-        neighbors.astype(int)
-        return neighbors
-
-    # this function finds neighbors for a large cell
-    def neighbor_of_large_i(self, large_index: int):
-        gt1 = GeneralTools()
-        level1_x_bins = self.x_divide_bins
-        level1_y_bins = self.y_divide_bins
-        large_neighbor_list = self.get_adjacent_cells(large_index, level1_x_bins, level1_y_bins)
-        direction_neighbor_dict = gt1.transfer_set_of_elements(large_neighbor_list, self.level1_position_index_dict)
-        neighbors = []
-        for direction_key in direction_neighbor_dict:
-            neighbor_level1_index = direction_neighbor_dict[direction_key]
-            if neighbor_level1_index is not False:
-                this_large_cell_subdivide_parameter = self.level2_subdividing_parameter[neighbor_level1_index]
-                whether_divided = False
-                if this_large_cell_subdivide_parameter > 1:
-                    whether_divided = True
-                if whether_divided:
-                    neighbor_subcells = self.subcell_neighbor_of_large_cell(neighbor_level1_index, direction_key)
-                    neighbors = neighbors + neighbor_subcells
-                else:
-                    level2_index = self.level2_position_index_dict[(neighbor_level1_index, 0, 0)]
-                    # neighbors.append(level2_index)
-                    neighbors.append(np.array([neighbor_level1_index, 0, 0]))
-        # neighbors = np.array(neighbors, dtype=int)
-        neighbors1 = np.empty((len(neighbors), 3))
-        for row_i in range(len(neighbors)):
-            neighbors1[row_i, :] = neighbors[row_i]
-        return neighbors1
-
-    # this function gives subcell neighbors of a large cell
-    def subcell_neighbor_of_large_cell(self, neighborhood_cell_level1_index, neighborhood_direction):
-        x_subbin = self.level2_x_bin_dict[neighborhood_cell_level1_index]
-        y_subbin = self.level2_y_bin_dict[neighborhood_cell_level1_index]
-        x_number = x_subbin.size - 1
-        y_number = y_subbin.size - 1
-        neighborhood_subcells_list = []
-        if neighborhood_direction == 'w':
-            for y_index in range(y_number):
-                position_array = np.array([neighborhood_cell_level1_index, x_number - 1, y_index])
-                neighborhood_subcells_list.append(position_array)
-        if neighborhood_direction == 'e':
-            for y_index in range(y_number):
-                position_array = np.array([neighborhood_cell_level1_index, 0, y_index])
-                neighborhood_subcells_list.append(position_array)
-        if neighborhood_direction == 's':
-            for x_index in range(x_number):
-                position_array = np.array([neighborhood_cell_level1_index, x_index, y_number - 1])
-                neighborhood_subcells_list.append(position_array)
-        if neighborhood_direction == 'n':
-            for x_index in range(x_number):
-                position_array = np.array([neighborhood_cell_level1_index, x_index, 0])
-                neighborhood_subcells_list.append(position_array)
-        return neighborhood_subcells_list
-
-    # this function finds neighbors for a subcell
-    def neighbor_of_subcell_i(self, large_index, x_position_in_large, y_position_in_large):
-        x_bins = self.level2_x_bin_dict[large_index]
-        y_bins = self.level2_y_bin_dict[large_index]
-        x_number = x_bins.size - 1
-        y_number = y_bins.size - 1
-
-        if x_position_in_large == 0:
-            if y_position_in_large == 0:
-                neighboring_direction = [False, True, True, False]
-            elif y_position_in_large == y_number - 1:
-                neighboring_direction = [True, False, True, False]
-            else:
-                neighboring_direction = [False, False, True, False]
-        elif x_position_in_large == x_number - 1:
-            if y_position_in_large == 0:
-                neighboring_direction = [False, True, False, True]
-            elif y_position_in_large == y_number - 1:
-                neighboring_direction = [True, False, False, True]
-            else:
-                neighboring_direction = [False, False, False, True]
+        subdividing_parameter = self.get_level2_parameter().astype(int)
+        positions = self.level2_index_position_dict
+        cell_subdividing_parameter = subdividing_parameter[positions[:, 0]]
+        subcell_indices = np.arange(self.subcell_number)
+        east_within = subcell_indices[positions[:, 1] + 1 < cell_subdividing_parameter]
+        north_within = subcell_indices[positions[:, 2] + 1 < cell_subdividing_parameter]
+        rows = [east_within, north_within]
+        columns = [east_within + cell_subdividing_parameter[east_within], north_within + 1]
+        # large cells are numbered column by column, see cell_borders
+        row_number = self.y_divide_bins.size - 1
+        large_cells = np.arange(self.get_level1_cell_number())
+        east_cells = large_cells[self.level1_cell_position[:, 0] + 1 < self.x_divide_bins.size - 1]
+        north_cells = large_cells[self.level1_cell_position[:, 1] + 1 < row_number]
+        for direction, cells1, cells2 in (('e', east_cells, east_cells + row_number),
+                                          ('n', north_cells, north_cells + 1)):
+            subcells1, subcells2 = self.subcells_at_common_side(direction, cells1, cells2)
+            rows.append(subcells1)
+            columns.append(subcells2)
+        self.subcell_adjacency = self.adjacency_matrix(np.concatenate(rows), np.concatenate(columns),
+                                                       self.subcell_number)
+
+    # this function gives the pairs of neighboring subcells at the common side of large cells cells1 and cells2, cells2
+    # are the cells in direction ('e' or 'n') of cells1
+    def subcells_at_common_side(self, direction, cells1: np.ndarray, cells2: np.ndarray):
+        subdividing_parameter = self.get_level2_parameter().astype(int)
+        pair_numbers = subdividing_parameter[cells1] * subdividing_parameter[cells2]
+        cell_pairs = np.repeat(np.arange(cells1.size), pair_numbers)
+        cells1 = cells1[cell_pairs]
+        cells2 = cells2[cell_pairs]
+        parameter1 = subdividing_parameter[cells1]
+        parameter2 = subdividing_parameter[cells2]
+        inner_index = np.arange(cell_pairs.size) - (np.cumsum(pair_numbers) - pair_numbers)[cell_pairs]
+        side_index1 = inner_index // parameter2
+        side_index2 = inner_index % parameter2
+        base = self.level2_index_base
+        if direction == 'e':
+            # last column of cells1 and first column of cells2, the subcells along the side are numbered by y
+            subcells1 = base[cells1] + (parameter1 - 1) * parameter1 + side_index1
+            subcells2 = base[cells2] + side_index2
+            bins, offsets = self.level2_y_bin_array, self.level2_y_bin_offsets
         else:
-            if y_position_in_large == 0:
-                neighboring_direction = [False, True, False, False]
-            elif y_position_in_large == y_number - 1:
-                neighboring_direction = [True, False, False, False]
-            else:
-                neighboring_direction = [False, False, False, False]
-
-        neighbor_subcells = []
-        large_cell_position_in_level1 = self.level1_cell_position[large_index, :]
-        large_cell_level1_x = large_cell_position_in_level1[0]
-        large_cell_level1_y = large_cell_position_in_level1[1]
-        level1_x_divide_number = self.x_divide_bins.size - 1
-        level1_y_divide_number = self.y_divide_bins.size - 1
-        if neighboring_direction[0]:
-            north_large_neighbor_y = large_cell_level1_y + 1
-            neighbor_direction = 'n'
-            if north_large_neighbor_y < level1_y_divide_number:
-                north_neighbors = self.adjacent_subcells_of_a_subcell(
-                    neighbor_direction, large_cell_level1_x, north_large_neighbor_y)
-                neighbor_subcells = neighbor_subcells + north_neighbors
-        if neighboring_direction[1]:
-            south_large_neighbor_y = large_cell_level1_y - 1
-            neighbor_direction = 's'
-            if south_large_neighbor_y >= 0:
-                south_neighbors = self.adjacent_subcells_of_a_subcell(
-                    neighbor_direction, large_cell_level1_x, south_large_neighbor_y)
-                neighbor_subcells = neighbor_subcells + south_neighbors
-        if neighboring_direction[2]:
-            west_large_neighbor_x = large_cell_level1_x - 1
-            neighbor_direction = 'w'
-            if west_large_neighbor_x >= 0:
-                west_neighbors = self.adjacent_subcells_of_a_subcell(
-                    neighbor_direction, west_large_neighbor_x, large_cell_level1_y)
-                neighbor_subcells = neighbor_subcells + west_neighbors
-        if neighboring_direction[3]:
-            east_large_neighbor_x = large_cell_level1_x + 1
-            neighbor_direction = 'e'
-            if east_large_neighbor_x < level1_x_divide_number:
-                east_neighbors = self.adjacent_subcells_of_a_subcell(
-                    neighbor_direction, east_large_neighbor_x, large_cell_level1_y)
-                neighbor_subcells = neighbor_subcells + east_neighbors
-        neighbor_subcells = neighbor_subcells \
-                            + self.direct_neighbors_within_large_cell_of_subcell(x_number, large_index,
-                                                                                 x_position_in_large,
-                                                                                 y_position_in_large)
-
-        neighbors = np.empty((len(neighbor_subcells), 3))
-        for row_i in range(len(neighbor_subcells)):
-            neighbors[row_i, :] = neighbor_subcells[row_i]
+            # last row of cells1 and first row of cells2, the subcells along the side are numbered by x
+            subcells1 = base[cells1] + side_index1 * parameter1 + parameter1 - 1
+            subcells2 = base[cells2] + side_index2 * parameter2
+            bins, offsets = self.level2_x_bin_array, self.level2_x_bin_offsets
+        if self.cc.neighbor_edge_matching == 'overlap':
+            low1 = bins[offsets[cells1] + side_index1]
+            high1 = bins[offsets[cells1] + side_index1 + 1]
+            low2 = bins[offsets[cells2] + side_index2]
+            high2 = bins[offsets[cells2] + side_index2 + 1]
+            overlap = np.minimum(high1, high2) - np.maximum(low1, low2)
+            overlapping = overlap > 1e-9 * np.minimum(high1 - low1, high2 - low2)
+            subcells1 = subcells1[overlapping]
+            subcells2 = subcells2[overlapping]
+        return subcells1, subcells2
+
+    # this function gives the symmetric adjacency matrix of edges (rows[i], columns[i]) in compressed sparse row format
+    # with sorted int32 indices, neighbors of i are adjacency.indices[adjacency.indptr[i]: adjacency.indptr[i + 1]]
+    def adjacency_matrix(self, rows: np.ndarray, columns: np.ndarray, node_number: int):
+        all_rows = np.concatenate((rows, columns))
+        all_columns = np.concatenate((columns, rows))
+        adjacency = sparse.csr_matrix((np.ones(all_rows.size, dtype=bool), (all_rows, all_columns)),
+                                      shape=(node_number, node_number))
+        adjacency.sum_duplicates()
+        adjacency.sort_indices()
+        adjacency.indptr = adjacency.indptr.astype(np.int32)
+        adjacency.indices = adjacency.indices.astype(np.int32)
+        return adjacency
+
+    # this function gives the adjacency of usable states
+    def construct_usable_index_neighbors(self):
+        usable_to_real = np.asarray(self.usable_subcell_index_to_real_index_dict, dtype=int)
+        usable_adjacency = self.subcell_adjacency[usable_to_real][:, usable_to_real].tocoo()
+        self.usable_state_adjacency = self.adjacency_matrix(usable_adjacency.row, usable_adjacency.col,
+                                                            usable_to_real.size)
 
-        return neighbors
-
-    # this function gives direct four neighbors(top, bottom, left, right) of a subcell
-    def direct_neighbors_within_large_cell_of_subcell(self, divide_number, large_cell_number, x_position, y_position):
-        if x_position - 1 >= 0:
-            left_neighbor = np.array([large_cell_number, x_position - 1, y_position])
-        else:
-            left_neighbor = False
-        if x_position + 1 < divide_number:
-            right_neighbor = np.array([large_cell_number, x_position + 1, y_position])
-        else:
-            right_neighbor = False
-        if y_position + 1 < divide_number:
-            top_neighbor = np.array([large_cell_number, x_position, y_position + 1])
-        else:
-            top_neighbor = False
-        if y_position - 1 >= 0:
-            bottom_neighbor = np.array([large_cell_number, x_position, y_position - 1])
-        else:
-            bottom_neighbor = False
-        direct_neighbors = []
-        if top_neighbor is not False:
-            direct_neighbors.append(top_neighbor)
-        if bottom_neighbor is not False:
-            direct_neighbors.append(bottom_neighbor)
-        if left_neighbor is not False:
-            direct_neighbors.append(left_neighbor)
-        if right_neighbor is not False:
-            direct_neighbors.append(right_neighbor)
-        return direct_neighbors
-
-    # this function gives one side neighbors of a subcell.
-    def adjacent_subcells_of_a_subcell(self, neighbor_direction, large_neighbor_x, large_neighbor_y):
-        neighbor_large_cell_position = (large_neighbor_x, large_neighbor_y)
-        neighbor_large_cell_index = self.level1_position_index_dict[neighbor_large_cell_position]
-        neighbors = self.subcell_neighbor_of_large_cell(neighbor_large_cell_index, neighbor_direction)
-        return neighbors
-
-    #
-    def get_adjacent_cells(self, cell_index1: int, x_bins: np.ndarray, y_bins: np.ndarray):
-        x_bin_number = x_bins.size - 1
-        y_bin_number = y_bins.size - 1
-        x_index = cell_index1 // y_bin_number
-        y_index = cell_index1 % y_bin_number
-        adjacent_cells = {}
-        west_neighbor_x_index = x_index - 1
-        east_neighbor_x_index = x_index + 1
-        south_neighbor_y_index = y_index - 1
-        north_neighbor_y_index = y_index + 1
-        # check if neighbor exist in west
-        if west_neighbor_x_index >= 0:
-            cell_position = np.array([west_neighbor_x_index, y_index])
-            adjacent_cells['w'] = cell_position
-        else:
-            adjacent_cells['w'] = False
-        # east
-        if east_neighbor_x_index < x_bin_number:
-            cell_position = np.array([east_neighbor_x_index, y_index])
-            adjacent_cells['e'] = cell_position
-        else:
-            adjacent_cells['e'] = False
-        # south
-        if south_neighbor_y_index >= 0:
-            cell_position = np.array([x_index, south_neighbor_y_index])
-            adjacent_cells['s'] = cell_position
-        else:
-            adjacent_cells['s'] = False
-        # north
-        if north_neighbor_y_index < y_bin_number:
-            cell_position = np.array([x_index, north_neighbor_y_index])
-            adjacent_cells['n'] = cell_position
-        else:
-            adjacent_cells['n'] = False
-        return adjacent_cells
+    # this function gives neighbor subcells of a subcell
+    def subcell_neighbors(self, subcell_index):
+        adjacency = self.subcell_adjacency
+        return adjacency.indices[adjacency.indptr[subcell_index]: adjacency.indptr[subcell_index + 1]]
 
     #
     def subcell_direction(self, subcell1_index, subcell2_index):
@@ -780,24 +707,22 @@ class Grid:
     def calculate_index_array_by_point_array(self, x_point_array: np.ndarray, y_point_array: np.ndarray,
                                              level1_array: np.ndarray):
         general_tool1 = GeneralTools()
-        point_number = x_point_array.shape[0]
-        index_array = np.zeros(point_number, dtype=int) - 1
-        large_cell_set = np.unique(level1_array)
-        for big_cell_index in large_cell_set:
-            in_index = (level1_array == big_cell_index)
-            x_in_array = x_point_array[in_index]
-            y_in_array = y_point_array[in_index]
-            x_bin = self.level2_x_bin_dict[big_cell_index]
-            y_bin = self.level2_y_bin_dict[big_cell_index]
-            x_position_in_big_cell = general_tool1.get_bin_index(x_in_array, x_bin, outlier_handling='label')
-            y_position_in_big_cell = general_tool1.get_bin_index(y_in_array, y_bin, outlier_handling='label')
-            index_array_array = np.zeros(x_position_in_big_cell.size, dtype=int)
-            for index_in_index_array in range(x_position_in_big_cell.size):
-                x_p = x_position_in_big_cell[index_in_index_array]
-                y_p = y_position_in_big_cell[index_in_index_array]
-                small_cell_index = self.level2_position_index_dict[(big_cell_index, x_p, y_p)]
-                index_array_array[index_in_index_array] = small_cell_index
-            index_array[in_index] = index_array_array
+        level1_array = np.asarray(level1_array, dtype=int)
+        x_offsets = self.level2_x_bin_offsets
+        y_offsets = self.level2_y_bin_offsets
+        x_position_in_big_cell = general_tool1.get_segmented_bin_index(
+            x_point_array, self.level2_x_bin_array, x_offsets[level1_array], x_offsets[level1_array + 1])
+        y_position_in_big_cell = general_tool1.get_segmented_bin_index(
+            y_point_array, self.level2_y_bin_array, y_offsets[level1_array], y_offsets[level1_array + 1])
+        subdividing_parameter = self.get_level2_parameter()[level1_array]
+        out_of_subcells = (x_position_in_big_cell < 0) | (x_position_in_big_cell >= subdividing_parameter) | \
+                          (y_position_in_big_cell < 0) | (y_position_in_big_cell >= subdividing_parameter)
+        if out_of_subcells.any():
+            wrong_point = np.flatnonzero(out_of_subcells)[0]
+            raise KeyError((level1_array[wrong_point], x_position_in_big_cell[wrong_point],
+                            y_position_in_big_cell[wrong_point]))
+        index_array = self.level2_index_base[level1_array] + x_position_in_big_cell * subdividing_parameter + \
+            y_position_in_big_cell
         return index_array
 
     # this function transform point array in a trajectory into cell index trajectory
@@ -810,21 +735,36 @@ class Grid:
         trajectory1.level2_cell_index_sequence = index_array
 
     # this function calculates subcell index array for every trajectory
+    # all points of the set are located at once, see calculate_index_array_for_trajectory
     def calculate_index_array_for_set(self, trajectory_set1: TrajectorySet):
-        trajectory_number = trajectory_set1.get_trajectory_number()
-        for trajectory_index in range(trajectory_number):
-            trajectory1 = trajectory_set1.give_trajectory_by_index(trajectory_index)
-            self.calculate_index_array_for_trajectory(trajectory1)
+        point_array = trajectory_set1.trajectory_array.reshape((-1, 2))
+        level1_array = trajectory_set1.level1_cell_index_sequence
+        index_array = self.calculate_index_array_by_point_array(point_array[:, 0], point_array[:, 1], level1_array)
+        trajectory_set1.level2_cell_index_sequence = index_array
 
     # this function calculates density for level2 cells
     def get_non_noisy_level2_density(self, trajectory_set1: TrajectorySet) -> None:
-        subcell_number = self.subcell_number
-        density_array = np.zeros(subcell_number)
-        for trajectory1 in trajectory_set1.trajectory_list:
-            single_density = self.get_single_trajectory_level2_density(trajectory1)
-            density_array = density_array + single_density
+        density_array = np.zeros(self.subcell_number)
+        density_array = self.add_non_noisy_level2_density(trajectory_set1, density_array)
         self.level2_real_density = density_array
 
+    # this function adds the level2 densities of the trajectories of a set to density_array, one after another, see
+    # add_level1_density
+    def add_non_noisy_level2_density(self, trajectory_set1: TrajectorySet, density_array: np.ndarray) -> np.ndarray:
+        general_tool1 = GeneralTools()
+        trajectory_positions = trajectory_set1.give_trajectory_position_of_points()
+        subcell_indices, frequency = general_tool1.grouped_frequency(
+            trajectory_positions, trajectory_set1.level2_cell_index_sequence, trajectory_set1.give_point_numbers())
+        wrong_subcell_index = (subcell_indices >= self.subcell_number)
+        if wrong_subcell_index.any():
+            wrong_position = trajectory_positions[np.flatnonzero(
+                trajectory_set1.level2_cell_index_sequence >= self.subcell_number)[0]]
+            raise IndexError('trajectory {} has wrong subcell index'.format(
+                trajectory_set1.trajectory_index[wrong_position]))
+        density_array = np.array(density_array, dtype=float)
+        np.add.at(density_array, subcell_indices, frequency)
+        return density_array
+
     #
     def get_single_trajectory_level2_density(self, trajectory1: Trajectory) -> np.ndarray:
         subcell_number = self.subcell_number
@@ -833,27 +773,127 @@ class Grid:
 
     def state_pruning(self) -> None:
         usable_indicator = np.ones(self.subcell_number, dtype=bool)
+        if self.cc.state_pruning != 'none':
+            usable_indicator = self.give_pruned_usable_indicator()
         usable_number = int(np.sum(usable_indicator))
+        if usable_number < self.subcell_number:
+            matrix_size = 8 / 1024 ** 2
+            log.info(f"State pruning keeps {usable_number} of {self.subcell_number} states, a transition matrix "
+                     f"shrinks from {(self.subcell_number + 2) ** 2 * matrix_size:.1f} MB to "
+                     f"{(usable_number + 2) ** 2 * matrix_size:.1f} MB")
         real_to_usable = np.zeros(self.subcell_number, dtype=int) - 1
         real_to_usable[usable_indicator] = np.arange(usable_number)
         self.real_subcell_index_to_usable_index_dict = real_to_usable
         self.usable_to_real_dict(usable_number, real_to_usable)
         self.usable_state_number = usable_number
+        self.give_subcell_to_kept_subcell_dict(usable_indicator)
+
+    # this function gives which subcells stay usable states. Subcells of large cells without noisy density are dropped
+    # and of the others only the largest connected set is kept. If it has more than max_state_number states, the
+    # states are taken from it by a search from its densest state that always takes the densest state next to those
+    # taken, so the kept states are connected and fill the budget. Only the noisy level1 density is used, so no
+    # privacy budget is spent.
+    def give_pruned_usable_indicator(self) -> np.ndarray:
+        large_cells = self.level2_subcell_to_large_cell_dict.astype(int)
+        subdividing_parameter = self.get_level2_parameter()[large_cells]
+        subcell_density = self.get_level1_noisy_density()[large_cells] / subdividing_parameter ** 2
+        usable_indicator = subcell_density > 0
+        if not usable_indicator.any():
+            return np.ones(self.subcell_number, dtype=bool)
+        usable_indicator = self.largest_connected_states(usable_indicator)
+        max_state_number = self.cc.max_state_number
+        if 0 < max_state_number < np.sum(usable_indicator):
+            usable_indicator = self.densest_connected_states(usable_indicator, subcell_density, max_state_number)
+        return usable_indicator
+
+    # this function keeps the largest set of connected states, every usable state must be reachable from every other one
+    def largest_connected_states(self, usable_indicator: np.ndarray) -> np.ndarray:
+        kept_subcells = np.flatnonzero(usable_indicator)
+        kept_adjacency = self.subcell_adjacency[kept_subcells][:, kept_subcells]
+        _, components = csgraph.connected_components(kept_adjacency, directed=False)
+        largest_component = np.argmax(np.bincount(components))
+        connected_indicator = np.zeros(self.subcell_number, dtype=bool)
+        connected_indicator[kept_subcells[components == largest_component]] = True
+        return connected_indicator
+
+    # this function takes state_number connected states of the connected states of usable_indicator. Starting from the
+    # densest one, the densest state next to the taken states is taken until there are state_number states, ties go
+    # to the lower subcell index
+    def densest_connected_states(self, usable_indicator: np.ndarray, subcell_density: np.ndarray,
+                                 state_number: int) -> np.ndarray:
+        candidates = np.flatnonzero(usable_indicator)
+        first_state = candidates[np.argmax(subcell_density[candidates])]
+        taken_indicator = np.zeros(self.subcell_number, dtype=bool)
+        seen_indicator = ~usable_indicator
+        seen_indicator[first_state] = True
+        heap = [(-subcell_density[first_state], first_state)]
+        taken_number = 0
+        while heap and taken_number < state_number:
+            _, state = heapq.heappop(heap)
+            taken_indicator[state] = True
+            taken_number = taken_number + 1
+            for neighbor in self.subcell_neighbors(state):
+                if not seen_indicator[neighbor]:
+                    seen_indicator[neighbor] = True
+                    heapq.heappush(heap, (-subcell_density[neighbor], int(neighbor)))
+        return taken_indicator
+
+    # this function maps every subcell dropped by state pruning to the kept subcell with the nearest central point
+    def give_subcell_to_kept_subcell_dict(self, usable_indicator: np.ndarray) -> None:
+        subcell_to_kept = np.arange(self.subcell_number)
+        dropped_subcells = np.flatnonzero(~usable_indicator)
+        kept_subcells = np.flatnonzero(usable_indicator)
+        if dropped_subcells.size > 0 and kept_subcells.size > 0:
+            central_points = np.empty((self.subcell_number, 2))
+            central_points[:, 0] = (self.level2_borders[:, 0] + self.level2_borders[:, 1]) / 2
+            central_points[:, 1] = (self.level2_borders[:, 2] + self.level2_borders[:, 3]) / 2
+            _, nearest = cKDTree(central_points[kept_subcells]).query(central_points[dropped_subcells])
+            subcell_to_kept[dropped_subcells] = kept_subcells[nearest]
+        self.subcell_to_kept_subcell_dict = subcell_to_kept
 
     # this function gives usable to real index dict
     def usable_to_real_dict(self, usable_number: int, real_to_usable: np.ndarray) -> None:
         gt1 = GeneralTools()
         usable_to_real = gt1.inverse_index_dict(usable_number, real_to_usable)
         self.usable_subcell_index_to_real_index_dict = usable_to_real
+        self.give_usable_state_central_points()
 
     #
     def usable_array_of_set(self, trajectory_set1: TrajectorySet) -> None:
-        for trajectory1 in trajectory_set1.trajectory_list:
-            self.usable_array_of_trajectory(trajectory1)
+        self.move_points_to_kept_subcells(trajectory_set1)
+        usable_index = self.real_subcell_index_to_usable_index_dict[trajectory_set1.level2_cell_index_sequence]
+        trajectory_positions = trajectory_set1.give_trajectory_position_of_points()
+        not_usable_number = np.bincount(trajectory_positions[usable_index < 0],
+                                        minlength=trajectory_set1.trajectory_number)
+        # like usable_array_of_trajectory, trajectories with a not usable point get no usable sequence
+        trajectory_set1.give_point_field('usable_sequence', usable_index, not_usable_number > 0)
+        trajectory_set1.has_not_usable_index = trajectory_set1.has_not_usable_index | (not_usable_number > 0)
+
+    # this function moves the points in subcells dropped by state pruning to the nearest kept subcell, see
+    # give_subcell_to_kept_subcell_dict, so their trajectories are still counted in the model
+    def move_points_to_kept_subcells(self, trajectory_set1: TrajectorySet) -> None:
+        level2_sequence = trajectory_set1.level2_cell_index_sequence
+        in_subcell = level2_sequence >= 0
+        moved = np.zeros(level2_sequence.size, dtype=bool)
+        moved[in_subcell] = self.subcell_to_kept_subcell_dict[level2_sequence[in_subcell]] != level2_sequence[in_subcell]
+        if not moved.any():
+            return
+        trajectory_positions = trajectory_set1.give_trajectory_position_of_points()
+        moved_trajectory_number = np.unique(trajectory_positions[moved]).size
+        log.info(f"State pruning moves {int(np.sum(moved))} of {level2_sequence.size} points of "
+                 f"{moved_trajectory_number} of {trajectory_set1.trajectory_number} trajectories to the nearest "
+                 f"kept state")
+        moved_sequence = level2_sequence.copy()
+        moved_sequence[moved] = self.subcell_to_kept_subcell_dict[level2_sequence[moved]]
+        trajectory_set1.level2_cell_index_sequence = moved_sequence
 
     #
     def usable_array_of_trajectory(self, trajectory1: Trajectory) -> None:
         index_array = trajectory1.level2_cell_index_sequence
+        in_subcell = index_array >= 0
+        index_array = index_array.copy()
+        index_array[in_subcell] = self.subcell_to_kept_subcell_dict[index_array[in_subcell]]
+        trajectory1.level2_cell_index_sequence = index_array
         usable_index = self.real_subcell_index_to_usable_index_dict[index_array]
         has_not_usable = (usable_index < 0).any()
         if not has_not_usable:
@@ -863,24 +903,20 @@ class Grid:
 
     #
     def usable_state_central_points(self):
-        state_number = self.usable_state_number
-        central_points_gps = np.zeros((state_number, 2)) - 1
-        for usable_state_index in range(state_number):
-            real_subcell_state_index = self.usable_subcell_index_to_real_index_dict[usable_state_index]
-            real_subcell_borders = self.level2_borders[real_subcell_state_index, :]
-            north = real_subcell_borders[0]
-            south = real_subcell_borders[1]
-            west = real_subcell_borders[2]
-            east = real_subcell_borders[3]
-            central_latitude = (north + south) / 2
-            central_longitude = (west + east) / 2
-            central_points_gps[usable_state_index, 0] = central_latitude
-            central_points_gps[usable_state_index, 1] = central_longitude
-        return central_points_gps
+        return self.usable_state_central_point_array.copy()
+
+    # this function calculates the central points of all usable states once, when the usable states are set
+    def give_usable_state_central_points(self):
+        real_subcell_borders = self.level2_borders[np.asarray(self.usable_subcell_index_to_real_index_dict, dtype=int)]
+        central_points_gps = np.empty((real_subcell_borders.shape[0], 2))
+        central_points_gps[:, 0] = (real_subcell_borders[:, 0] + real_subcell_borders[:, 1]) / 2
+        central_points_gps[:, 1] = (real_subcell_borders[:, 2] + real_subcell_borders[:, 3]) / 2
+        self.usable_state_central_point_array = central_points_gps
 
     #
     def usable_state_neighbors(self, usable_state):
-        neighbors = self.subcell_neighbors_usable_index[usable_state]
+        adjacency = self.usable_state_adjacency
+        neighbors = adjacency.indices[adjacency.indptr[usable_state]: adjacency.indptr[usable_state + 1]]
         return neighbors
 
     #
@@ -891,6 +927,11 @@ class Grid:
         non_repeat = gt1.unreapted_int_array(large_cell_array)[0]
         return non_repeat
 
+    # this function gives the large cells of usable states
+    def large_cell_array_from_usable(self, usable_array):
+        subcell_array = self.usable_subcell_index_to_real_index_dict[usable_array]
+        return self.level2_subcell_to_large_cell_dict[subcell_array]
+
     #
     def large_neighbor_or_same_by_subcell_index(self, subcell1, subcell2):
         subcell_to_large_dict = self.level2_subcell_to_large_cell_dict
@@ -906,34 +947,39 @@ class Grid:
         else:
             return False
 
-    #
+    # this function sets every entry (i, j) of a distribution over usable states to indicator if i is a neighbor of a
+    # state i1 with positive entry (i1, j), or j a neighbor of a state j1 with positive entry (i, j1). With adjacency A
+    # and X the positive entries, these are the entries of A * X + X * A^T. The result is a sparse matrix.
     def add_neighbors_to_distribution(self, original_distribution, indicator=1):
-        result_distribution = cop.deepcopy(original_distribution)
-        neighbors_list = []
-        for i in range(original_distribution.shape[0]):
-            for j in range(original_distribution.shape[1]):
-                if original_distribution[i, j] > 0:
-                    neighbors_of_row_state = self.subcell_neighbors_real_index[i]
-                    neighbors_of_col_state = self.subcell_neighbors_real_index[j]
-                    for nei_state in neighbors_of_row_state:
-                        neighbors_list.append((nei_state, j))
-                    for nei_state in neighbors_of_col_state:
-                        neighbors_list.append((i, nei_state))
-        for distribution_neighbor_pairs in neighbors_list:
-            row_index = distribution_neighbor_pairs[0]
-            col_index = distribution_neighbor_pairs[1]
-            result_distribution[row_index, col_index] = indicator
+        distribution = sparse.csr_matrix(original_distribution)
+        adjacency = self.usable_state_adjacency
+        support = (distribution > 0).astype(bool)
+        neighbor_entries = (adjacency @ support + support @ adjacency.T).tocoo()
+        original_entries = distribution.tocoo()
+        column_number = distribution.shape[1]
+        neighbor_keys = neighbor_entries.row.astype(np.int64) * column_number + neighbor_entries.col
+        original_keys = original_entries.row.astype(np.int64) * column_number + original_entries.col
+        kept = ~np.isin(original_keys, neighbor_keys)
+        rows = np.concatenate((original_entries.row[kept], neighbor_entries.row))
+        columns = np.concatenate((original_entries.col[kept], neighbor_entries.col))
+        values = np.concatenate((original_entries.data[kept],
+                                 np.full(neighbor_entries.nnz, indicator, dtype=distribution.dtype)))
+        result_distribution = sparse.csr_matrix((values, (rows, columns)), shape=distribution.shape)
         return result_distribution
 
     #
     def find_state_within_given_border(self, border):
-        gt1 = GeneralTools()
-        in_border_states = []
-        for state_index in range(self.subcell_number):
-            this_state_border = self.level2_borders[state_index, :]
-            if gt1.rec_overlap(this_state_border, border):
-                in_border_states.append(state_index)
-        return in_border_states
+        in_border_states = self.spatial_index.query_rectangle(border)
+        return in_border_states.tolist()
+
+    # this function gives the subcells overlapping every border of an array of borders, see
+    # SubcellSpatialIndex.query_rectangles
+    def find_states_within_given_borders(self, borders):
+        return self.spatial_index.query_rectangles(borders)
+
+    # this function gives the subcells of points, -1 for points outside of the grid
+    def find_states_of_points(self, point_array):
+        return self.spatial_index.locate_points(point_array)
 
     def get_grid(self, trajectory_set1: TrajectorySet) -> None:
         cc1 = self.cc
@@ -941,6 +987,7 @@ class Grid:
         level1_epsilon_partition = cc1.epsilon_partition[0]
         level1_epsilon = total_epsilon * level1_epsilon_partition
         self.border(trajectory_set1)
+        self.process_outliers(trajectory_set1)
         self.give_point_number(trajectory_set1)
         self.level1_divide()
         self.level1_cells()
@@ -951,10 +998,58 @@ class Grid:
 
         self.calculate_index_array_for_set(trajectory_set1)
 
+    # this function is the first pass of the streaming mode, it builds the grid from TrajectoryChunks. Border and
+    # point number come from the store, level1 densities are added chunk by chunk, see get_grid.
+    def get_grid_in_chunks(self, trajectory_chunks) -> None:
+        self.level1_grid_of_chunks(trajectory_chunks)
+        density = np.zeros(self.get_level1_cell_number())
+        for trajectory_set1 in trajectory_chunks:
+            self.process_outliers(trajectory_set1)
+            self.level1_trajectory_set_point_to_cell(trajectory_set1)
+            density = self.add_level1_density(trajectory_set1, density)
+        self.level2_grid_of_level1_density(density)
+
+    # this function builds the level1 cells from the sidecar of the store of TrajectoryChunks. A border from quantiles
+    # takes two passes over the chunks, and one more to count the points and trajectories left by process_outliers.
+    def level1_grid_of_chunks(self, trajectory_chunks) -> None:
+        if self.cc.border_quantile > 0:
+            self.border_of_bounding_box(trajectory_chunks.give_quantile_bounding_box(self.cc.border_quantile))
+            point_number = 0
+            trajectory_number = 0
+            for trajectory_set1 in trajectory_chunks:
+                self.process_outliers(trajectory_set1)
+                point_number += int(trajectory_set1.offsets[-1])
+                trajectory_number += trajectory_set1.trajectory_number
+            self.give_point_and_trajectory_number(point_number, trajectory_number)
+        else:
+            self.border_of_bounding_box(trajectory_chunks.bounding_box)
+            self.give_point_and_trajectory_number(trajectory_chunks.point_number, trajectory_chunks.trajectory_number)
+        self.level1_divide()
+        self.level1_cells()
+
+    # this function adds noise to the real level1 density and subdivides the level1 cells
+    def level2_grid_of_level1_density(self, density: np.ndarray) -> None:
+        cc1 = self.cc
+        total_epsilon = cc1.total_epsilon
+        level1_epsilon_partition = cc1.epsilon_partition[0]
+        level1_epsilon = total_epsilon * level1_epsilon_partition
+        self.give_level1_real_density(density)
+        self.noisy_frequency(level1_epsilon)
+        self.subdividing()
+
+    # this function gives level1 and level2 cell indices and usable states of the points of a chunk, and the
+    # simple trajectories, see get_grid and set_up_state
+    def discretize_chunk(self, trajectory_set1: TrajectorySet) -> None:
+        self.process_outliers(trajectory_set1)
+        self.level1_trajectory_set_point_to_cell(trajectory_set1)
+        self.calculate_index_array_for_set(trajectory_set1)
+        self.usable_array_of_set(trajectory_set1)
+        trajectory_set1.get_simple_trajectory(self.real_subcell_index_to_usable_index_dict)
+
     def set_up_state(self, trajectory_set1: TrajectorySet) -> None:
-        self.get_non_noisy_level2_density(trajectory_set1)
-        # self.get_noisy_level2_density()
         self.state_pruning()
         self.usable_array_of_set(trajectory_set1)
-        self.construct_real_index_neighbors()
+        # the density counts points moved by state pruning in their kept subcell, like in the streaming mode
+        self.get_non_noisy_level2_density(trajectory_set1)
+        # self.get_noisy_level2_density()
         self.construct_usable_index_neighbors()
\ No newline at end of file
@@ -0,0 +1,108 @@
+import numpy as np
+
+from tools.general_tools import GeneralTools
+
+# large cells within this distance of a query are searched too, as subdividing bins may end slightly beyond the border
+# of their large cell, see GeneralTools.get_bin
+LARGE_CELL_TOLERANCE = 0.0001
+
+
+# This class answers rectangle and point queries over the subcells of a subdivided grid. A query first finds the range
+# of large cells it touches by a binary search in the level1 bins, then the range of subcells in each of these large
+# cells by a binary search in the subdividing bins of the cell. Subcells of a large cell are numbered x by x, see
+# Grid.subcell_tables, so the ranges give the subcell indices directly and a query takes time proportional to its
+# result. Many queries are answered together.
+class SubcellSpatialIndex:
+
+    def __init__(self, grid):
+        self.x_divide_bins = grid.get_x_divide_bins()
+        self.y_divide_bins = grid.get_y_divide_bins()
+        self.row_number = self.y_divide_bins.size - 1
+        self.subdividing_parameter = grid.get_level2_parameter().astype(int)
+        self.index_base = grid.level2_index_base
+        self.x_bin_array = grid.level2_x_bin_array
+        self.y_bin_array = grid.level2_y_bin_array
+        self.x_bin_offsets = grid.level2_x_bin_offsets
+        self.y_bin_offsets = grid.level2_y_bin_offsets
+
+    # this function gives the subcells overlapping a border [north, south, west, east] in ascending order, like
+    # GeneralTools.rec_overlap the rectangles must share an area
+    def query_rectangle(self, border) -> np.ndarray:
+        subcells, _ = self.query_rectangles(np.asarray(border, dtype=float).reshape((1, 4)))
+        return subcells
+
+    # this function gives the subcells overlapping every border of an array of borders, the subcells of border i are
+    # subcells[offsets[i]: offsets[i + 1]] in ascending order
+    def query_rectangles(self, borders: np.ndarray):
+        borders = np.asarray(borders, dtype=float).reshape((-1, 4))
+        north = np.maximum(borders[:, 0], borders[:, 1])
+        south = np.minimum(borders[:, 0], borders[:, 1])
+        west = np.minimum(borders[:, 2], borders[:, 3])
+        east = np.maximum(borders[:, 2], borders[:, 3])
+        # large cells near the rectangles, cells of a rectangle are numbered column by column like in Grid.cell_borders
+        x_start, x_end = self.overlapping_range(self.x_divide_bins, west - LARGE_CELL_TOLERANCE,
+                                                east + LARGE_CELL_TOLERANCE)
+        y_start, y_end = self.overlapping_range(self.y_divide_bins, south - LARGE_CELL_TOLERANCE,
+                                                north + LARGE_CELL_TOLERANCE)
+        queries, x_index, y_index = self.expand_ranges(x_start, x_end, y_start, y_end)
+        large_cells = x_index * self.row_number + y_index
+        # subcells of the large cells overlapping the rectangles
+        parameters = self.subdividing_parameter[large_cells]
+        sub_x_start, sub_x_end = self.overlapping_range_in_cells(
+            self.x_bin_array, self.x_bin_offsets, large_cells, west[queries], east[queries])
+        sub_y_start, sub_y_end = self.overlapping_range_in_cells(
+            self.y_bin_array, self.y_bin_offsets, large_cells, south[queries], north[queries])
+        cell_pairs, sub_x_index, sub_y_index = self.expand_ranges(
+            sub_x_start, np.minimum(sub_x_end, parameters), sub_y_start, np.minimum(sub_y_end, parameters))
+        subcells = self.index_base[large_cells[cell_pairs]] + sub_x_index * parameters[cell_pairs] + sub_y_index
+        offsets = np.zeros(borders.shape[0] + 1, dtype=int)
+        np.cumsum(np.bincount(queries[cell_pairs], minlength=borders.shape[0]), out=offsets[1:])
+        return subcells, offsets
+
+    # this function gives the subcells of points (x, y), points outside of all subcells get -1
+    def locate_points(self, point_array: np.ndarray) -> np.ndarray:
+        gt1 = GeneralTools()
+        point_array = np.asarray(point_array, dtype=float).reshape((-1, 2))
+        level1_position = gt1.get_points_bin_index(point_array, self.x_divide_bins, self.y_divide_bins)
+        in_grid = (level1_position >= 0).all(axis=1)
+        large_cells = level1_position[in_grid, 1] * self.row_number + level1_position[in_grid, 0]
+        x_position = gt1.get_segmented_bin_index(point_array[in_grid, 0], self.x_bin_array,
+                                                 self.x_bin_offsets[large_cells], self.x_bin_offsets[large_cells + 1])
+        y_position = gt1.get_segmented_bin_index(point_array[in_grid, 1], self.y_bin_array,
+                                                 self.y_bin_offsets[large_cells], self.y_bin_offsets[large_cells + 1])
+        parameters = self.subdividing_parameter[large_cells]
+        in_subcell = (x_position >= 0) & (x_position < parameters) & (y_position >= 0) & (y_position < parameters)
+        subcells = np.full(point_array.shape[0], -1, dtype=int)
+        subcells[np.flatnonzero(in_grid)[in_subcell]] = self.index_base[large_cells[in_subcell]] + \
+            x_position[in_subcell] * parameters[in_subcell] + y_position[in_subcell]
+        return subcells
+
+    # this function gives the range [start, end) of bins sharing an interval with (low, high)
+    def overlapping_range(self, bins: np.ndarray, low: np.ndarray, high: np.ndarray):
+        start = np.maximum(np.searchsorted(bins, low, side='right') - 1, 0)
+        end = np.minimum(np.searchsorted(bins, high, side='left'), bins.size - 1)
+        return start, np.maximum(end, start)
+
+    # this function gives the range [start, end) of subdividing bins of large cells sharing an interval with
+    # (low, high), see overlapping_range
+    def overlapping_range_in_cells(self, bin_array: np.ndarray, bin_offsets: np.ndarray, large_cells: np.ndarray,
+                                   low: np.ndarray, high: np.ndarray):
+        gt1 = GeneralTools()
+        bin_starts = bin_offsets[large_cells]
+        bin_ends = bin_offsets[large_cells + 1]
+        start = gt1.get_segmented_sorted_index(low, bin_array, bin_starts, bin_ends, side='right') - 1
+        end = gt1.get_segmented_sorted_index(high, bin_array, bin_starts, bin_ends, side='left')
+        start = np.maximum(start, 0)
+        end = np.minimum(end, bin_ends - bin_starts - 1)
+        return start, np.maximum(end, start)
+
+    # this function gives all pairs (x, y) of the ranges [x_start[i], x_end[i]) and [y_start[i], y_end[i]), x by x,
+    # and the range i of every pair
+    def expand_ranges(self, x_start: np.ndarray, x_end: np.ndarray, y_start: np.ndarray, y_end: np.ndarray):
+        y_numbers = y_end - y_start
+        pair_numbers = (x_end - x_start) * y_numbers
+        ranges = np.repeat(np.arange(pair_numbers.size), pair_numbers)
+        inner_index = np.arange(ranges.size) - (np.cumsum(pair_numbers) - pair_numbers)[ranges]
+        x_index = x_start[ranges] + inner_index // y_numbers[ranges]
+        y_index = y_start[ranges] + inner_index % y_numbers[ranges]
+        return ranges, x_index, y_index
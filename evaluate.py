@@ -12,6 +12,7 @@ import config.folder_and_file_names as fname
 from config.parameter_carrier import ParameterCarrier
 from config.parameter_setter import ParSetter
 from data_preparation.data_preparer import DataPreparer
+from data_preparation.trajectory_chunks import TrajectoryChunks
 from discretization.get_discretization import DisData
 from generator.state_trajectory_generation import StateGeneration
 from generator.to_real_translator import RealLocationTranslator
@@ -54,6 +55,7 @@ log = logging.getLogger(__name__)
 def run(dataset: str, fold: int, epsilon: float = EPSILON,
         level_1_parameter: bool = LEVEL_1_PARAMETER,
         level_2_parameter: bool = LEVEL_2_PARAMETER,
+        streaming: bool = False,
         ) -> None:
     # Copy of main.py
     if level_1_parameter:
@@ -82,7 +84,6 @@ def run(dataset: str, fold: int, epsilon: float = EPSILON,
     # Start Timer
     start = timer()
 
-    writer = DataWriter()
     print('begin all')
     print(datetime.datetime.now())
     par = ParSetter().set_up_args(
@@ -94,18 +95,27 @@ def run(dataset: str, fold: int, epsilon: float = EPSILON,
         # We use the default values as the code and the paper are not consistent
         c_parameter=c_param if level_1_parameter else False,  # c parameter
         pop=pop_param if level_2_parameter else False,  # Population density
+        streaming=streaming,  # Read the dataset in chunks instead of keeping it in memory
     )
 
     pc = ParameterCarrier(par)
+    writer = DataWriter(precision=par['output_precision'])
 
     # Load Data
-    data_preparer = DataPreparer(par)
-    trajectory_set = data_preparer.get_trajectory_set()
+    if pc.streaming:
+        trajectory_chunks = TrajectoryChunks(pc, pc.chunk_size)
+        trajectory_set = None
+    else:
+        data_preparer = DataPreparer(par)
+        trajectory_set = data_preparer.get_trajectory_set()
     log.info("Preparing data finished")
 
     # Step 1: Discretisation
     disdata1 = DisData(pc)
-    grid = disdata1.get_discrete_data(trajectory_set)
+    if pc.streaming:
+        grid = disdata1.get_discrete_data_in_chunks(trajectory_chunks)
+    else:
+        grid = disdata1.get_discrete_data(trajectory_set)
     log.info("Discretization finished")
     log.info(f"Usable State Number: {grid.usable_state_number}")
     # Print the size of the grid
@@ -113,7 +123,10 @@ def run(dataset: str, fold: int, epsilon: float = EPSILON,
 
     # Step 2: Learn Markov Models
     mb1 = ModelBuilder(pc)
-    mo1 = mb1.build_model(grid, trajectory_set)
+    if pc.streaming:
+        mo1 = mb1.build_model_in_chunks(grid, trajectory_chunks)
+    else:
+        mo1 = mb1.build_model(grid, trajectory_set)
     log.info("Markov model building finished")
     mb1 = ModelBuilder(pc)
     mo1 = mb1.filter_model(trajectory_set, grid, mo1)
@@ -126,7 +139,7 @@ def run(dataset: str, fold: int, epsilon: float = EPSILON,
     rlt1 = RealLocationTranslator(pc)
     real_tra_list = rlt1.translate_trajectories(grid, st_tra_list)
     log.info("Real trajectory generation finished")
-    writer.save_trajectory_data_in_list_to_file(real_tra_list, par['output'])
+    writer.save_trajectories(real_tra_list, par['output'], par['output_format'])
     print('end all')
     print(datetime.datetime.now())
 
@@ -153,6 +166,8 @@ def get_parser() -> ArgumentParser:
     parser.add_argument('-c', '--custom-c', action='store_true', help='Use custom c/K parameter')
     # Enable Manual mode
     parser.add_argument('-m', '--manual', action='store_true', help='Enable manual mode')
+    # Read the dataset twice in chunks instead of keeping it in memory
+    parser.add_argument('-s', '--streaming', action='store_true', help='Enable streaming mode')
     return parser
 
 
@@ -164,7 +179,8 @@ if __name__ == "__main__":
         # Only run geolife dataset with fold 1 and epsilon 10.0
         run(dataset="GEOLIFE", fold=6, epsilon=1000.0)
     elif args.manual:
-        run(dataset=args.dataset, fold=args.fold, epsilon=args.epsilon, level_1_parameter=args.custom_c)
+        run(dataset=args.dataset, fold=args.fold, epsilon=args.epsilon, level_1_parameter=args.custom_c,
+            streaming=args.streaming)
     else:
         processes = []
         for dataset in DATASETS:
@@ -176,6 +192,7 @@ if __name__ == "__main__":
                             "dataset": dataset,
                             "fold": fold,
                             "epsilon": epsilon,
+                            "streaming": args.streaming,
                         },
                     )
                     processes.append(p)
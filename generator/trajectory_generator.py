@@ -39,15 +39,17 @@ class Generator:
         self.average_subdividing_number = np.average(subdividing_para[-5:])
         self.level1_length_threshold()
         self.simple_whole_trajectory_len_threshold(self.level1_length_threshold_value)
-        self.total_in_degree = np.sum(self.markov_model.noisy_markov_matrix[0:-2, 0:-2], axis=0)
-        self.total_out_degree = np.sum(self.markov_model.noisy_markov_matrix[0:-2, 0:-2], axis=1)
+        gt1 = GeneralTools()
+        self.total_in_degree = gt1.give_matrix_sums(self.markov_model.noisy_markov_matrix[0:-2, 0:-2], 0)
+        self.total_out_degree = gt1.give_matrix_sums(self.markov_model.noisy_markov_matrix[0:-2, 0:-2], 1)
         self.find_neighbors_for_strong_end()
 
     #
     def find_neighbors_for_strong_end(self):
         cc1 = self.cc
         grid = self.markov_model.grid
-        end_weights = self.markov_model.noisy_markov_matrix[:-2, -1]
+        gt1 = GeneralTools()
+        end_weights = gt1.give_matrix_column(self.markov_model.noisy_markov_matrix, -1)[:-2]
         big_shot_indicator = (end_weights > 0.1 * np.sum(end_weights))
         strong_end = np.arange(big_shot_indicator.size)[big_shot_indicator]
         self.strong_end = strong_end
@@ -76,7 +78,8 @@ class Generator:
     #
     def check_if_neighbor(self, this_step, step_to_check):
         neighbor_matrix = self.markov_model.neighboring_matrix
-        if_neighbor = neighbor_matrix[this_step, step_to_check]
+        neighbors = neighbor_matrix.indices[neighbor_matrix.indptr[this_step]: neighbor_matrix.indptr[this_step + 1]]
+        if_neighbor = step_to_check in neighbors
         return if_neighbor
 
     #
@@ -126,7 +129,7 @@ class Generator:
         # neighbor_multiplier = cc1.neighbor_multiplier
         to_know_my_neighbor = np.array([end_state], dtype=int)
         for i in range(3):
-            neighbors = gt1.neighbors_usable_indices_of_states(to_know_my_neighbor, grid.subcell_neighbors_usable_index)
+            neighbors = gt1.neighbors_usable_indices_of_states(to_know_my_neighbor, grid.usable_state_adjacency)
             multilayer_neighbors.append(neighbors)
             to_know_my_neighbor = neighbors
         return multilayer_neighbors
@@ -163,7 +166,7 @@ class Generator:
                 return False
             else:
                 return True
-        different_large_cell_number = np.unique(grid.level2_subcell_to_large_cell_dict[trajectory]).size
+        different_large_cell_number = np.unique(grid.large_cell_array_from_usable(trajectory)).size
         try_to_drop = False
         if different_large_cell_number / level1_step_number > 0.6:
             if level1_step_number > level1_len_threshold:
@@ -213,7 +216,7 @@ class Generator:
             step_number_now = len(trajectory)
             grid = self.markov_model.grid
             level1_step_number = gt1.level1_array_length(trajectory, grid)
-            this_step_large_cell = int(grid.level2_subcell_to_large_cell_dict[this_step])
+            this_step_large_cell = int(grid.large_cell_array_from_usable(this_step))
             this_large_cell_dividing_number = grid.level2_subdividing_parameter[this_step_large_cell]
             if level1_step_number != level1_step_before:
                 if level1_step_before != -1:
@@ -308,7 +311,9 @@ class Generator:
 
     def check_large_neighbor(self, this_step, last_step):
         grid = self.markov_model.grid
-        neighbor_relation = grid.large_neighbor_or_same_by_subcell_index(this_step, last_step)
+        usable_to_real = grid.usable_subcell_index_to_real_index_dict
+        neighbor_relation = grid.large_neighbor_or_same_by_subcell_index(usable_to_real[this_step],
+                                                                         usable_to_real[last_step])
         if neighbor_relation is True:
             return True
         elif neighbor_relation == 'same':
@@ -332,7 +337,7 @@ class Generator:
                 probability[-1] = probability[-1] * 0.2
         probability[-1] = probability[-1] * 0.8
         if np.sum(probability) <= 0:
-            neighbors_of_this_step = grid.subcell_neighbors_usable_index[this_step]
+            neighbors_of_this_step = grid.usable_state_neighbors(this_step)
             weights = self.total_in_degree[neighbors_of_this_step]
             if np.sum(weights) == 0:
                 this_step1 = int(gt1.random_pick_element(neighbors_of_this_step))
@@ -5,6 +5,7 @@ import datetime
 from config.parameter_carrier import ParameterCarrier
 from config.parameter_setter import ParSetter
 from data_preparation.data_preparer import DataPreparer
+from data_preparation.trajectory_chunks import TrajectoryChunks
 from discretization.get_discretization import DisData
 from generator.state_trajectory_generation import StateGeneration
 from generator.to_real_translator import RealLocationTranslator
@@ -12,24 +13,31 @@ from primarkov.build_markov_model import ModelBuilder
 from tools.data_writer import DataWriter
 
 if __name__ == "__main__":
-    writer = DataWriter()
     print('begin all')
     print(datetime.datetime.now())
     par = ParSetter().set_up_args()
     pc = ParameterCarrier(par)
-    data_preparer = DataPreparer(par)
-    trajectory_set = data_preparer.get_trajectory_set()
+    writer = DataWriter(precision=par['output_precision'])
     disdata1 = DisData(pc)
-    grid = disdata1.get_discrete_data(trajectory_set)
     mb1 = ModelBuilder(pc)
-    mo1 = mb1.build_model(grid, trajectory_set)
+    if pc.streaming:
+        # the trajectory set is never in memory, the model keeps the counts of the second pass
+        trajectory_chunks = TrajectoryChunks(pc, pc.chunk_size)
+        trajectory_set = None
+        grid = disdata1.get_discrete_data_in_chunks(trajectory_chunks)
+        mo1 = mb1.build_model_in_chunks(grid, trajectory_chunks)
+    else:
+        data_preparer = DataPreparer(par)
+        trajectory_set = data_preparer.get_trajectory_set()
+        grid = disdata1.get_discrete_data(trajectory_set)
+        mo1 = mb1.build_model(grid, trajectory_set)
     mb1 = ModelBuilder(pc)
     mo1 = mb1.filter_model(trajectory_set, grid, mo1)
     sg1 = StateGeneration(pc)
     st_tra_list = sg1.generate_tra(mo1)
     rlt1 = RealLocationTranslator(pc)
     real_tra_list = rlt1.translate_trajectories(grid, st_tra_list)
-    writer.save_trajectory_data_in_list_to_file(real_tra_list, par['output'])
+    writer.save_trajectories(real_tra_list, par['output'], par['output_format'])
     print('end all')
     print(datetime.datetime.now())
     pass
\ No newline at end of file
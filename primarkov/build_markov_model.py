@@ -1,7 +1,11 @@
+import numpy as np
+
 from primarkov.mar_model import MarkovModel
 from config.parameter_carrier import ParameterCarrier
 from data_preparation.trajectory_set import TrajectorySet
 from discretization.grid import Grid
+from data_preparation.trajectory_chunks import TrajectoryChunks
+from primarkov.partial_statistics import ShardCounter
 
 
 class ModelBuilder:
@@ -14,6 +18,30 @@ class ModelBuilder:
         mo1.model_building(trajectory_set1, grid)
         return mo1
 
+    # this function is the second pass of the streaming mode. Every chunk is discretized on the grid of the first pass
+    # and dropped after its densities and transitions are added, see DisData.get_discrete_data_in_chunks.
+    def build_model_in_chunks(self, grid: Grid, trajectory_chunks: TrajectoryChunks):
+        mo1 = MarkovModel(self.cc)
+        mo1.set_up_for_model(grid)
+        mo1.give_neighboring_matrix(grid)
+        mo1.set_up_for_chunks()
+        if self.cc.shard_number > 1:
+            # the shards are counted by their own processes and merged before noise is added
+            partial1 = ShardCounter(self.cc.shard_number, self.cc.shard_number).count(grid, trajectory_chunks)
+            grid.level2_real_density = partial1.give_sum('level2_density')
+            mo1.real_markov_matrix = partial1.give_transition_counter(mo1.all_state_number).give_markov_matrix()
+            mo1.order2_counter = partial1.give_order2_counter(mo1.all_state_number)
+        else:
+            level2_density = np.zeros(grid.subcell_number)
+            for trajectory_set1 in trajectory_chunks:
+                grid.discretize_chunk(trajectory_set1)
+                level2_density = grid.add_non_noisy_level2_density(trajectory_set1, level2_density)
+                mo1.add_chunk_to_model(trajectory_set1)
+            grid.level2_real_density = level2_density
+            mo1.real_markov_matrix = mo1.transition_counter.give_markov_matrix()
+        mo1.noisy_markov()
+        return mo1
+
     def filter_model(self, trajectory_set1, grid, mo1):
         mo1.model_filtering(trajectory_set1, grid)
         return mo1
\ No newline at end of file
@@ -13,6 +13,10 @@ class GuidePost:
         self.this_state = state_index
         self.last_step = np.array([])
         self.next_step = np.array([])
+        # order 2 values of the transitions last state -> this state -> next state, rows of last_states and columns of
+        # next_states
+        self.last_states = np.array([], dtype=int)
+        self.next_states = np.array([], dtype=int)
         self.order2_trans_matrix = np.array([])
         self.all_state_number = -1
         self.start_state = -1
@@ -26,14 +30,64 @@ class GuidePost:
     def give_next_step(self, next_steps):
         self.next_step = next_steps
 
-    #
+    # this function sets up the order 2 matrix of the guidepost. Rows are the states and the start state, columns the
+    # states and the end state, both sorted as the start and end state are the last states. With guidepost_states
+    # 'neighbors' the states are only the neighbors, else all states.
     def guidepost_set_up(self, neighbors, all_state_number, start_state_number, end_state_number):
+        neighbors = np.sort(np.asarray(neighbors, dtype=int))
         self.give_last_step(neighbors)
         self.give_next_step(neighbors)
         self.start_state = start_state_number
         self.end_state = end_state_number
         self.all_state_number = all_state_number
-        self.order2_trans_matrix = np.zeros((all_state_number, all_state_number), dtype=np.float16)
+        if self.cc.guidepost_states == 'neighbors':
+            states = neighbors
+        else:
+            states = np.arange(all_state_number - 2)
+        self.last_states = np.append(states, start_state_number)
+        self.next_states = np.append(states, end_state_number)
+        self.order2_trans_matrix = np.zeros((self.last_states.size, self.next_states.size), dtype=np.float16)
+
+    # this function gives the positions of states in sorted states, states that are not there get -1
+    def give_positions(self, sorted_states, states):
+        states = np.asarray(states, dtype=int)
+        positions = np.minimum(np.searchsorted(sorted_states, states), sorted_states.size - 1)
+        return np.where(sorted_states[positions] == states, positions, -1)
+
+    # this function gives the rows of last states in the order 2 matrix, -1 for states that are not kept
+    def give_last_positions(self, last_states):
+        return self.give_positions(self.last_states, last_states)
+
+    # this function gives the columns of next states in the order 2 matrix, -1 for states that are not kept
+    def give_next_positions(self, next_states):
+        return self.give_positions(self.next_states, next_states)
+
+    # this function sets the order 2 values of transitions, transitions from or to states that are not kept are left
+    # out
+    def give_order2_values(self, last_states, next_states, values):
+        last_positions = self.give_last_positions(last_states)
+        next_positions = self.give_next_positions(next_states)
+        kept = (last_positions >= 0) & (next_positions >= 0)
+        self.order2_trans_matrix[last_positions[kept], next_positions[kept]] = values[kept]
+
+    # this function adds increments to the order 2 values of transitions one after another, transitions from or to
+    # states that are not kept are left out. Like add_to_order2_value, every addition is done in float64 and rounded to
+    # float16.
+    def add_order2_values(self, last_states, next_states, increments):
+        last_positions = self.give_last_positions(last_states)
+        next_positions = self.give_next_positions(next_states)
+        kept = (last_positions >= 0) & (next_positions >= 0)
+        np.add.at(self.order2_trans_matrix, (last_positions[kept], next_positions[kept]),
+                  np.asarray(increments, dtype=np.float64)[kept])
+
+    # this function adds 1 / divider to the order 2 value of last state -> next state if both are in the matrix. The
+    # float16 value is added in float64 and rounded once, which numpy before and after NEP 50 both do for a float64.
+    def add_to_order2_value(self, last_state, next_state, divider):
+        last_position = int(self.give_last_positions(last_state))
+        next_position = int(self.give_next_positions(next_state))
+        if last_position >= 0 and next_position >= 0:
+            self.order2_trans_matrix[last_position, next_position] = \
+                float(self.order2_trans_matrix[last_position, next_position]) + 1 / divider
 
     #
     def guidepost_add(self, last_step, next_step, trajectory_length):
@@ -51,8 +105,7 @@ class GuidePost:
             divider = int(trajectory_length)
             if divider < 1:
                 divider = 1
-            self.order2_trans_matrix[last_step, next_step] =\
-                self.order2_trans_matrix[last_step, next_step] + 1 / divider
+            self.add_to_order2_value(last_step, next_step, divider)
 
     #
     def choose_direction(self, last_step, step_number_now, return_probability=False):
@@ -65,10 +118,11 @@ class GuidePost:
                 raise TypeError('start point should  be start')
         else:
             inner_last = last_step
-        candidates = np.arange(self.order2_trans_matrix.shape[0])
-        probability = self.order2_trans_matrix[inner_last, :]
-        probability = probability.copy()
-        probability = probability.astype(float)
+        candidates = np.arange(self.all_state_number)
+        probability = np.zeros(self.all_state_number)
+        last_position = int(self.give_last_positions(inner_last))
+        if last_position >= 0:
+            probability[self.next_states] = self.order2_trans_matrix[last_position, :]
         if return_probability:
             return probability
         inner_result = gt1.draw_by_probability_without_an_element(candidates, probability, -2)
@@ -79,26 +133,13 @@ class GuidePost:
     def add_start(self, next_state, trajectory_length):
         if next_state == 'end':
             next_state = self.end_state
-        self.order2_trans_matrix[self.start_state, next_state] = \
-            self.order2_trans_matrix[self.start_state, next_state] + 1 / trajectory_length
+        self.add_to_order2_value(self.start_state, next_state, trajectory_length)
 
     #
     def add_end(self, last_state, trajectory_length):
         if last_state == 'start':
             last_state = self.start_state
-        self.order2_trans_matrix[last_state, self.end_state] = \
-            self.order2_trans_matrix[last_state, self.end_state] + 1 / trajectory_length
-
-    #
-    def add_noise(self):
-        cc1 = self.cc
-        noise1 = Noise()
-        epsilon = cc1.total_epsilon * cc1.epsilon_partition[2]
-        noisy_matrix = noise1.add_laplace(self.order2_trans_matrix, epsilon, 1, if_regularize=False)
-        noisy_matrix[:, self.start_state] = np.zeros(self.all_state_number)
-        noisy_matrix[self.end_state, :] = np.zeros(self.all_state_number)
-        noisy_matrix = noise1.positive_regulation_for_markov_matrix(noisy_matrix)
-        self.order2_trans_matrix = noisy_matrix.astype(int)
+        self.add_to_order2_value(last_state, self.end_state, trajectory_length)
 
     #
     def give_total_ends_value(self):
@@ -108,3 +149,15 @@ class GuidePost:
     #
     def multiply_ends(self, multiplier):
         self.order2_trans_matrix[:, -1] = self.order2_trans_matrix[:, -1] * multiplier
+
+    # this function gives the order 2 matrix with laplace noise, regulated by rows. Transitions to the start state and
+    # from the end state are not in the matrix, so the noise covers exactly the transitions kept. The noise comes from
+    # a generator keyed on (seed, state of the guidepost), so it does not depend on the other guideposts or on the
+    # process the guidepost is noised in.
+    def give_noisy_order2_matrix(self, epsilon, seed):
+        noise1 = Noise()
+        generator1 = noise1.give_keyed_generator(seed, int(self.this_state))
+        noisy_matrix = self.order2_trans_matrix + generator1.laplace(scale=1 / epsilon,
+                                                                     size=self.order2_trans_matrix.shape)
+        noisy_matrix = noise1.positive_regulation_for_markov_matrix(noisy_matrix)
+        return noisy_matrix.astype(int)
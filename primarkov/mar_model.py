@@ -1,7 +1,10 @@
 import datetime
+import functools
 import logging
+import multiprocessing
 
 import numpy as np
+from scipy import sparse
 from tqdm import tqdm, trange
 
 from config.parameter_carrier import ParameterCarrier
@@ -9,8 +12,11 @@ from data_preparation.trajectory import Trajectory
 from data_preparation.trajectory_set import TrajectorySet
 from discretization.grid import Grid
 from primarkov.guidepost import GuidePost
+from primarkov.order2_counter import Order2Counter
 from primarkov.sensitive_filter import Filter
+from primarkov.transition_counter import TransitionCounter
 from primarkov.start_end_calibrator import StartEndCalibrator
+from tools.general_tools import GeneralTools
 from tools.noise import Noise
 
 log = logging.getLogger(__name__)
@@ -41,6 +47,10 @@ class MarkovModel:
         self.level1_length_threshold = np.array([])
         self.whole_length_thresholds = []
         self.large_trans_indicator = np.array([])
+        # order 2 values of all states, collected in the streaming mode instead of keeping the trajectory set
+        self.order2_counter = None
+        # first order transitions of the chunks of the streaming mode
+        self.transition_counter = None
 
         #
 
@@ -79,38 +89,61 @@ class MarkovModel:
 
         return markov_matrix
 
-    # this function calculate markov transformation probability, usually first order.
+    # this function calculate markov transformation probability, usually first order. The transitions of all
+    # trajectories are counted at once into a sparse matrix, see TransitionCounter
     def calculate_markov_probability(self, trajectory_set: TrajectorySet) -> None:
-        state_number1 = self.all_state_number
-        markov_matrix = np.zeros((state_number1, state_number1))
-        trajectory_list = trajectory_set.trajectory_list
         print('begin calculating matrix')
         print(datetime.datetime.now())
-        for trajectory1 in tqdm(trajectory_list, desc="Calculating Markov Matrix"):
-            not_out_of_usable = not trajectory1.has_not_usable_index
-            if not_out_of_usable:
-                markov_matrix1 = self.trajectory_markov_probability(trajectory1)
-                markov_matrix += markov_matrix1
+        transition_counter = TransitionCounter(self.all_state_number)
+        transition_counter.add_trajectory_set(trajectory_set)
         print('calculating ends')
         print(datetime.datetime.now())
-        self.real_markov_matrix = markov_matrix
+        self.real_markov_matrix = transition_counter.give_markov_matrix()
 
     # this function add noise to real markov matrix
     def noisy_markov(self):
         noise1 = Noise()
         cc1 = self.cc
-        real_markov = self.real_markov_matrix
         total_epsilon = cc1.total_epsilon
         epsilon_partition_for_markov = cc1.epsilon_partition[1]
         epsilon_for_markov = total_epsilon * epsilon_partition_for_markov
         sensitivity = 1
+        if cc1.noisy_markov_mode == 'rows':
+            self.noisy_markov_matrix = self.noisy_markov_by_rows(epsilon_for_markov, sensitivity)
+            return
+        real_markov = self.real_markov_matrix.toarray()
         noisy_markov = noise1.add_laplace(real_markov, epsilon_for_markov, sensitivity, if_regularize=False)
         noisy_markov[:, self.start_state_index] = np.zeros(self.all_state_number)
         noisy_markov[self.end_state_index, :] = np.zeros(self.all_state_number)
         noisy_markov[self.start_state_index, self.end_state_index] = 0
-        noisy_markov = noise1.positive_regulation_for_markov_matrix(noisy_markov, 'queue_minus')
+        noisy_markov = noise1.positive_regulation_for_markov_matrix(noisy_markov, 'queue_minus',
+                                                                   worker_number=cc1.regulation_worker_number)
         self.noisy_markov_matrix = noisy_markov
 
+    # this function adds noise to the real markov matrix block by block of rows like noisy_markov. Every block is
+    # regulated at once and kept as sparse matrix, so only one block of rows is dense at a time. The noise of a row
+    # only depends on the seed and the row, see Noise.give_keyed_generator.
+    def noisy_markov_by_rows(self, epsilon_for_markov, sensitivity) -> sparse.csr_matrix:
+        noise1 = Noise()
+        cc1 = self.cc
+        seed = cc1.noisy_markov_seed
+        if seed < 0:
+            seed = int(np.random.randint(0, 2 ** 62))
+        row_block = max(cc1.noisy_markov_row_block, 1)
+        noisy_blocks = []
+        for start_row in range(0, self.all_state_number, row_block):
+            end_row = min(start_row + row_block, self.all_state_number)
+            noisy_rows = noise1.add_laplace_to_rows(self.real_markov_matrix[start_row: end_row].toarray(), start_row,
+                                                    epsilon_for_markov, sensitivity, seed)
+            noisy_rows[:, self.start_state_index] = 0
+            if start_row <= self.end_state_index < end_row:
+                noisy_rows[self.end_state_index - start_row, :] = 0
+            if start_row <= self.start_state_index < end_row:
+                noisy_rows[self.start_state_index - start_row, self.end_state_index] = 0
+            noisy_rows = noise1.positive_regulation_for_markov_matrix(noisy_rows, 'queue_minus')
+            noisy_blocks.append(sparse.csr_matrix(noisy_rows))
+        return sparse.vstack(noisy_blocks, format='csr')
+
     #
     def get_filtered_sensitive_states(self):
         filter1 = Filter(self.cc)
@@ -143,7 +176,7 @@ class MarkovModel:
             if_sensitive = self.guidepost_indicator[index]
             if if_sensitive:
                 guidepost1 = GuidePost(index, self.cc)
-                neighbors = grid.subcell_neighbors_usable_index[index]
+                neighbors = grid.usable_state_neighbors(index)
                 guidepost1.guidepost_set_up(neighbors, self.all_state_number, self.start_state_index, self.end_state_index)
                 self.guidepost_set.append(guidepost1)
                 index_dict[index] = gp_counter
@@ -151,51 +184,62 @@ class MarkovModel:
         self.index_dict = index_dict
 
     #
+    # this function adds the (last state, state, next state) transitions of all usable trajectories to the guideposts
+    # of the states. The transitions are found at once by Order2Counter, start and end are the start and end state,
+    # and every guidepost adds its transitions in trajectory order like GuidePost.guidepost_add.
     def give_guidepost_order2_info(self, trajectory_set1: TrajectorySet):
-        for trajectory1 in tqdm(trajectory_set1.trajectory_list, desc="Processing guidepost order 2 info"):
-            sequence = trajectory1.usable_simple_sequence
-            trajectory_length = sequence.size
-            for index_in_sequence in tqdm(range(sequence.size), desc="Processing trajectory sequence"):
-                state_now = sequence[index_in_sequence]
-                if index_in_sequence == 0:
-                    state_previous = 'start'
-                else:
-                    previous_step_index = index_in_sequence - 1
-                    state_previous = sequence[previous_step_index]
-                if index_in_sequence == sequence.size - 1:
-                    state_next = 'end'
-                else:
-                    next_step_index = index_in_sequence + 1
-                    state_next = sequence[next_step_index]
-                if_sensitive = self.guidepost_indicator[state_now]
-                if if_sensitive:
-                    guidepost_index = self.index_dict[state_now]
-                    guidepost1 = self.guidepost_set[guidepost_index]
-                    guidepost1.guidepost_add(state_previous, state_next, trajectory_length)
-
-    #
+        order2_counter = Order2Counter(self.all_state_number)
+        keys, increments = order2_counter.give_keys_and_increments(trajectory_set1)
+        square_number = self.all_state_number ** 2
+        guidepost_indices = self.index_dict[keys // square_number]
+        in_guidepost = guidepost_indices >= 0
+        keys = keys[in_guidepost]
+        increments = increments[in_guidepost]
+        guidepost_indices = guidepost_indices[in_guidepost]
+        order = np.argsort(guidepost_indices, kind='stable')
+        guidepost_offsets = np.zeros(len(self.guidepost_set) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(guidepost_indices, minlength=len(self.guidepost_set)), out=guidepost_offsets[1:])
+        for guidepost_index in tqdm(range(len(self.guidepost_set)), desc="Processing guidepost order 2 info"):
+            positions = order[guidepost_offsets[guidepost_index]: guidepost_offsets[guidepost_index + 1]]
+            state_keys = keys[positions] % square_number
+            self.guidepost_set[guidepost_index].add_order2_values(
+                state_keys // self.all_state_number, state_keys % self.all_state_number, increments[positions])
+
+    # this function fills the guideposts from the order 2 values of all states, see give_guidepost_order2_info
+    def give_guidepost_order2_info_from_counter(self, order2_counter: Order2Counter):
+        for guidepost1 in tqdm(self.guidepost_set, desc="Processing guidepost order 2 info"):
+            last_states, next_states, values = order2_counter.give_order2_values_of_state(guidepost1.this_state)
+            guidepost1.give_order2_values(last_states, next_states, values)
+
+    # this function gives the sparse adjacency of usable states, see Grid.usable_state_adjacency
     def give_neighboring_matrix(self, grid:Grid):
-        subcell_number = self.subcell_number
-        neighbors = grid.subcell_neighbors_usable_index
-        matrix = np.empty((subcell_number, subcell_number), dtype=bool)
-        for subcell_index1 in trange(subcell_number, desc="Building neighboring matrix"):
-            for subcell_index2 in range(subcell_number):
-                matrix[subcell_index1, subcell_index2] = False
-        for subcell_index in trange(subcell_number, desc="Processing neighbors"):
-            neeighbors_of_this_subcell = neighbors[subcell_index]
-            for neighbor in neeighbors_of_this_subcell:
-                matrix[subcell_index, neighbor] = True
-        self.neighboring_matrix = matrix
+        self.neighboring_matrix = grid.usable_state_adjacency
 
     #
     def get_noisy_tran_pro_of_step_i(self, step_i):
-        pro = self.noisy_markov_matrix[step_i, :]
-        return pro.copy()
-
-    #
+        gt1 = GeneralTools()
+        pro = gt1.give_matrix_row(self.noisy_markov_matrix, step_i)
+        return pro
+
+    # this function adds noise to all guideposts one guidepost after another, see GuidePost.give_noisy_order2_matrix.
+    # Every noisy matrix replaces the order 2 matrix of its guidepost before the next one is made, so only one noisy
+    # matrix per process is in memory. With regulation_worker_number > 1 the guideposts are noised by a pool of that
+    # many processes.
     def add_noise_to_guidepost(self):
-        for guidepost in tqdm(self.guidepost_set, desc="Adding noise to guideposts"):
-            guidepost.add_noise()
+        cc1 = self.cc
+        seed = cc1.guidepost_noise_seed
+        if seed < 0:
+            seed = int(np.random.randint(0, 2 ** 62))
+        epsilon = cc1.total_epsilon * cc1.epsilon_partition[2]
+        give_noisy_matrix = functools.partial(GuidePost.give_noisy_order2_matrix, epsilon=epsilon, seed=seed)
+        if cc1.regulation_worker_number > 1 and len(self.guidepost_set) > 1:
+            with multiprocessing.Pool(min(cc1.regulation_worker_number, len(self.guidepost_set))) as pool:
+                noisy_matrices = pool.imap(give_noisy_matrix, self.guidepost_set)
+                for guidepost1, noisy_matrix in zip(self.guidepost_set, noisy_matrices):
+                    guidepost1.order2_trans_matrix = noisy_matrix
+        else:
+            for guidepost1 in self.guidepost_set:
+                guidepost1.order2_trans_matrix = give_noisy_matrix(guidepost1)
 
     #
     def order1_and_2_end_consistency(self):
@@ -205,6 +249,19 @@ class MarkovModel:
             order2_end_value = gp.give_total_ends_value()
             gp.multiply_ends(order1_end_value / order2_end_value * 1.5)
 
+    # this function sets the start distribution to the calibrated one at start_indices and raises the ends of
+    # end_indices. A sparse noisy markov matrix stays sparse, it is changed in list of lists format.
+    def give_calibrated_start_and_end(self, start_indices, start_distribution, end_indices):
+        gt1 = GeneralTools()
+        noisy_markov = self.noisy_markov_matrix
+        if sparse.issparse(noisy_markov):
+            noisy_markov = noisy_markov.tolil()
+        noisy_markov[-2, start_indices] = start_distribution
+        noisy_markov[end_indices, -1] = gt1.give_matrix_column(noisy_markov, -1)[end_indices] * 1.3
+        if sparse.issparse(noisy_markov):
+            noisy_markov = noisy_markov.tocsr()
+        self.noisy_markov_matrix = noisy_markov
+
     #
     def start_end_trip_distribution_calibration(self):
         sec1 = StartEndCalibrator(self.cc)
@@ -218,8 +275,8 @@ class MarkovModel:
         inner_end_index_to_usable = sec1.non_zero_end_indices
         optimized_start_distribution = np.sum(optimized_distribution, axis=1)
         optimized_end_distribution = np.sum(optimized_distribution, axis=0)
-        self.noisy_markov_matrix[-2, inner_start_index_to_usable] = optimized_start_distribution
-        self.noisy_markov_matrix[inner_end_index_to_usable, -1] = self.noisy_markov_matrix[inner_end_index_to_usable, -1] * 1.3
+        self.give_calibrated_start_and_end(inner_start_index_to_usable, optimized_start_distribution,
+                                           inner_end_index_to_usable)
         self.optimized_start_end_distribution = np.zeros(
             (self.grid.usable_state_number, self.grid.usable_state_number))
         for inner_row_index in trange(inner_start_index_to_usable.size, desc="Inner Row"):
@@ -348,6 +405,17 @@ class MarkovModel:
         log.debug("Noisy Markov matrix generated.")
 
     #
+    # this function prepares the second pass of the streaming mode, the transitions of all chunks are added up
+    def set_up_for_chunks(self) -> None:
+        self.transition_counter = TransitionCounter(self.all_state_number)
+        self.order2_counter = Order2Counter(self.all_state_number)
+
+    # this function adds the transitions of a chunk whose simple trajectories are set up, see Grid.discretize_chunk
+    def add_chunk_to_model(self, trajectory_set1: TrajectorySet) -> None:
+        self.transition_counter.add_trajectory_set(trajectory_set1)
+        self.order2_counter.add_trajectory_set(trajectory_set1)
+
+    # without trajectory set (streaming mode) the guideposts are filled from order2_counter
     def model_filtering(self, trajectory_set1: TrajectorySet, grid: Grid):
         self.start_end_trip_distribution_calibration()
         log.debug("Start-end trip distribution calibration completed.")
@@ -361,7 +429,10 @@ class MarkovModel:
         self.set_up_guideposts(grid)
         log.debug("Guideposts set up.")
 
-        self.give_guidepost_order2_info(trajectory_set1)
+        if trajectory_set1 is None:
+            self.give_guidepost_order2_info_from_counter(self.order2_counter)
+        else:
+            self.give_guidepost_order2_info(trajectory_set1)
         log.debug("Guidepost order 2 information added.")
 
         self.add_noise_to_guidepost()
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+# This class collects the order 2 transition values of all states, i.e. what MarkovModel.give_guidepost_order2_info
+# adds to the guidepost of a state, before the guideposts are known. A value is kept for every (state, last state,
+# next state) triple that occurs. Trajectories must be added in the same order as in give_guidepost_order2_info. The
+# values are float16 like the guidepost matrices, every addition is done in float64 and rounded to float16 once, as
+# GuidePost.guidepost_add does, so they are identical to them whatever the casting rules of numpy.
+class Order2Counter:
+
+    def __init__(self, all_state_number: int):
+        self.all_state_number = all_state_number
+        self.start_state_index = all_state_number - 2
+        self.end_state_index = all_state_number - 1
+        # sorted keys state * all_state_number ** 2 + last state * all_state_number + next state and their values
+        self.keys = np.array([], dtype=np.int64)
+        self.values = np.array([], dtype=np.float16)
+
+    # this function adds the usable simple trajectories of a trajectory set
+    def add_trajectory_set(self, trajectory_set1) -> None:
+        keys, increments = self.give_keys_and_increments(trajectory_set1)
+        self.add_values(keys, increments)
+
+    # this function gives the key and the increment of every element of the simple trajectories of a set in order
+    def give_keys_and_increments(self, trajectory_set1):
+        sequence = trajectory_set1.usable_simple_sequence
+        if sequence is None or sequence.size == 0:
+            return np.array([], dtype=np.int64), np.array([])
+        sequence = sequence.astype(np.int64)
+        simple_offsets = trajectory_set1.simple_offsets
+        lengths = np.diff(simple_offsets)
+        trajectory_positions = np.repeat(np.arange(lengths.size), lengths)
+        is_first = np.zeros(sequence.size, dtype=bool)
+        is_first[simple_offsets[:-1][lengths > 0]] = True
+        is_last = np.zeros(sequence.size, dtype=bool)
+        is_last[simple_offsets[1:][lengths > 0] - 1] = True
+        last_states = np.empty_like(sequence)
+        last_states[1:] = sequence[:-1]
+        last_states[is_first] = self.start_state_index
+        next_states = np.empty_like(sequence)
+        next_states[:-1] = sequence[1:]
+        next_states[is_last] = self.end_state_index
+        # like in markov matrices, trajectories with a not usable state do not contribute
+        in_usable_state = (sequence >= 0) & ~trajectory_set1.has_not_usable_index[trajectory_positions]
+        keys = (sequence * self.all_state_number + last_states % self.all_state_number) * self.all_state_number + \
+            next_states % self.all_state_number
+        keys = keys[in_usable_state]
+        increments = 1 / lengths[trajectory_positions[in_usable_state]]
+        return keys, increments
+
+    # this function adds increments to the values of keys, one after another. The float16 values and the increments
+    # are added in float64 and rounded to float16 after every addition.
+    def add_values(self, keys: np.ndarray, increments: np.ndarray) -> None:
+        new_keys = np.setdiff1d(keys, self.keys)
+        if new_keys.size > 0:
+            all_keys = np.union1d(self.keys, new_keys)
+            all_values = np.zeros(all_keys.size, dtype=np.float16)
+            all_values[np.searchsorted(all_keys, self.keys)] = self.values
+            self.keys = all_keys
+            self.values = all_values
+        np.add.at(self.values, np.searchsorted(self.keys, keys), np.asarray(increments, dtype=np.float64))
+
+    # this function gives the last states, next states and values of the order 2 transitions through state
+    def give_order2_values_of_state(self, state: int):
+        square_number = self.all_state_number ** 2
+        start = np.searchsorted(self.keys, state * square_number)
+        end = np.searchsorted(self.keys, (state + 1) * square_number)
+        state_keys = self.keys[start: end] - state * square_number
+        return state_keys // self.all_state_number, state_keys % self.all_state_number, self.values[start: end]
@@ -0,0 +1,314 @@
+import multiprocessing
+import os
+import pickle
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+
+from data_preparation.trajectory_chunks import TrajectoryChunks
+from primarkov.order2_counter import Order2Counter
+from primarkov.transition_counter import TransitionCounter
+from tools.general_tools import GeneralTools
+
+PARTIAL_FORMAT_VERSION = 2
+VALUE_DTYPES = {'level1_density': np.float64, 'level2_density': np.float64, 'markov': np.float64,
+                'order2': np.float16}
+
+
+# This class holds the counts of a shard, i.e. of the trajectories start, ..., end - 1 of a dataset, as a sum for
+# every key that occurs. The contributions of the trajectories are added to the sums in trajectory order, so a single
+# shard gives the same sums as Grid.level1_density, Grid.get_non_noisy_level2_density,
+# MarkovModel.calculate_markov_probability and MarkovModel.give_guidepost_order2_info. A shard file grows with the
+# number of keys, not with the number of trajectories. Partial statistics of adjacent shards are merged by adding
+# their sums in shard order. Sums of floating point numbers depend on where the additions start, so the sums of
+# several shards may differ from the single process in the last bits, and by the rounding of float16 for the order 2
+# values.
+class PartialStatistics:
+
+    def __init__(self, start: int = 0, end: int = 0):
+        self.start = start
+        self.end = end
+        # number of keys of every statistic, e.g. level1 cell number or all state number ** 2 for the markov matrix
+        self.sizes = {}
+        # sorted keys of every statistic and their sums, see give_keys and give_values
+        self.keys = {}
+        self.values = {}
+
+    # this function gives the statistics counted on grid and their sizes. A grid that is not subdivided yet gives
+    # level1 densities, a subdivided grid the statistics of the model.
+    def give_statistic_sizes(self, grid) -> dict:
+        if grid.subcell_number < 0:
+            return {'level1_density': grid.get_level1_cell_number()}
+        all_state_number = grid.usable_state_number + 2
+        return {'level2_density': grid.subcell_number, 'markov': all_state_number ** 2,
+                'order2': all_state_number ** 3}
+
+    # this function prepares counting on grid, every statistic of the grid is there even if no trajectory is counted
+    def set_up_for_grid(self, grid) -> None:
+        for name, size in self.give_statistic_sizes(grid).items():
+            self.add_contributions(name, size, np.array([], dtype=np.int64), np.array([]))
+
+    # this function counts the trajectories of a set, it must follow the trajectories counted before
+    def add_trajectory_set(self, grid, trajectory_set1) -> None:
+        sizes = self.give_statistic_sizes(grid)
+        grid.process_outliers(trajectory_set1)
+        point_numbers = trajectory_set1.give_point_numbers()
+        trajectory_positions = trajectory_set1.give_trajectory_position_of_points()
+        if 'level1_density' in sizes:
+            grid.level1_trajectory_set_point_to_cell(trajectory_set1)
+            self.add_contributions('level1_density', sizes['level1_density'], *self.give_grouped_contributions(
+                trajectory_positions, trajectory_set1.level1_cell_index_sequence, point_numbers))
+            return
+        grid.discretize_chunk(trajectory_set1)
+        self.add_contributions('level2_density', sizes['level2_density'], *self.give_grouped_contributions(
+            trajectory_positions, trajectory_set1.level2_cell_index_sequence, point_numbers))
+        all_state_number = grid.usable_state_number + 2
+        transition_counter = TransitionCounter(all_state_number)
+        self.add_contributions('markov', sizes['markov'],
+                               *transition_counter.give_keys_and_increments(trajectory_set1))
+        order2_counter = Order2Counter(all_state_number)
+        self.add_contributions('order2', sizes['order2'], *order2_counter.give_keys_and_increments(trajectory_set1))
+
+    # this function adds contributions to the sums of statistic name one after another
+    def add_contributions(self, name: str, size: int, keys: np.ndarray, values: np.ndarray) -> None:
+        if name in self.sizes and self.sizes[name] != size:
+            raise ValueError('partial statistics of {} have different sizes'.format(name))
+        self.sizes[name] = size
+        if name not in self.keys:
+            self.keys[name] = np.array([], dtype=np.int64)
+            self.values[name] = np.array([], dtype=VALUE_DTYPES[name])
+        self.keys[name], self.values[name] = add_to_key_sums(self.keys[name], self.values[name], keys, values)
+
+    # this function gives the sorted keys of statistic name
+    def give_keys(self, name: str) -> np.ndarray:
+        return self.keys[name]
+
+    # this function gives the sums of the keys of statistic name
+    def give_values(self, name: str) -> np.ndarray:
+        return self.values[name]
+
+    # this function gives, for every trajectory in order, how often each key occurs in it divided by the divisor of the
+    # trajectory, e.g. the regularized cell density of the trajectory
+    def give_grouped_contributions(self, trajectory_positions: np.ndarray, keys: np.ndarray, divisors: np.ndarray):
+        gt1 = GeneralTools()
+        return gt1.grouped_frequency(trajectory_positions, keys, divisors)
+
+    # this function gives the sum of all contributions to statistic name
+    def give_sum(self, name: str) -> np.ndarray:
+        total = np.zeros(self.sizes[name], dtype=VALUE_DTYPES[name])
+        total[self.give_keys(name)] = self.give_values(name)
+        return total
+
+    # this function gives the first order transitions of all states
+    def give_transition_counter(self, all_state_number: int) -> TransitionCounter:
+        transition_counter = TransitionCounter(all_state_number)
+        transition_counter.add_values(self.give_keys('markov'), self.give_values('markov'))
+        return transition_counter
+
+    # this function gives the order 2 values of all states
+    def give_order2_counter(self, all_state_number: int) -> Order2Counter:
+        order2_counter = Order2Counter(all_state_number)
+        order2_counter.add_values(self.give_keys('order2'), self.give_values('order2'))
+        return order2_counter
+
+    # this function writes the partial statistics into an uncompressed .npz file
+    def save(self, file_name: str) -> None:
+        arrays = {'format_version': np.array(PARTIAL_FORMAT_VERSION), 'start': np.array(self.start),
+                  'end': np.array(self.end)}
+        for name in self.sizes:
+            arrays[name + '_size'] = np.array(self.sizes[name])
+            arrays[name + '_keys'] = self.give_keys(name)
+            arrays[name + '_values'] = self.give_values(name)
+        with open(file_name, 'wb') as f:
+            np.savez(f, **arrays)
+
+    # this function reads partial statistics written by save
+    def load(self, file_name: str) -> None:
+        with np.load(file_name) as arrays:
+            if int(arrays['format_version']) != PARTIAL_FORMAT_VERSION:
+                raise ValueError('{} has an unknown partial statistics format'.format(file_name))
+            self.start = int(arrays['start'])
+            self.end = int(arrays['end'])
+            for name in VALUE_DTYPES:
+                if name + '_size' in arrays:
+                    self.sizes[name] = int(arrays[name + '_size'])
+                    self.keys[name] = arrays[name + '_keys']
+                    self.values[name] = arrays[name + '_values']
+
+
+# This class adds up the partial statistics of adjacent shards one shard after another, in trajectory order. It holds
+# the sums of every key that occurs and gives the same sums as PartialStatistics.give_sum, give_transition_counter and
+# give_order2_counter of the merged shards.
+class StatisticSums:
+
+    def __init__(self):
+        self.start = 0
+        self.end = None
+        self.sizes = {}
+        # sums of the densities
+        self.sums = {}
+        # TransitionCounter of 'markov' and Order2Counter of 'order2'
+        self.counters = {}
+
+    # this function adds the partial statistics of the shard following the shards added before
+    def add_partial_statistics(self, partial1: PartialStatistics) -> None:
+        if self.end is None:
+            self.start = partial1.start
+        elif partial1.start != self.end:
+            raise ValueError('shard {}-{} does not follow shard ending at {}'.format(partial1.start, partial1.end,
+                                                                                    self.end))
+        for name in partial1.sizes:
+            if name in self.sizes and self.sizes[name] != partial1.sizes[name]:
+                raise ValueError('partial statistics of {} have different sizes'.format(name))
+            self.sizes[name] = partial1.sizes[name]
+            keys = partial1.give_keys(name)
+            values = partial1.give_values(name)
+            if name in ['markov', 'order2']:
+                self.give_counter(name).add_values(keys, values)
+            else:
+                self.sums.setdefault(name, np.zeros(self.sizes[name], dtype=VALUE_DTYPES[name]))
+                np.add.at(self.sums[name], keys, values)
+        self.end = partial1.end
+
+    # this function adds partial statistics files, the shards are added in trajectory order
+    def add_partial_statistics_files(self, file_names: list) -> None:
+        partial_ranges = []
+        for file_name in file_names:
+            with np.load(file_name) as arrays:
+                partial_ranges.append((int(arrays['start']), int(arrays['end']), file_name))
+        for _, _, file_name in sorted(partial_ranges):
+            partial1 = PartialStatistics()
+            partial1.load(file_name)
+            self.add_partial_statistics(partial1)
+
+    # this function gives the counter of statistic 'markov' or 'order2'
+    def give_counter(self, name: str):
+        if name not in self.counters:
+            # the markov statistic has all_state_number ** 2 keys, the order 2 one all_state_number ** 3
+            power = 2 if name == 'markov' else 3
+            all_state_number = int(round(self.sizes[name] ** (1 / power)))
+            if all_state_number ** power != self.sizes[name]:
+                raise ValueError('{} has no valid size {}'.format(name, self.sizes[name]))
+            counter_class = TransitionCounter if name == 'markov' else Order2Counter
+            self.counters[name] = counter_class(all_state_number)
+        return self.counters[name]
+
+    # this function gives the sum of all contributions to a density
+    def give_sum(self, name: str) -> np.ndarray:
+        return self.sums.get(name, np.zeros(self.sizes[name], dtype=VALUE_DTYPES[name]))
+
+    # this function gives the first order transitions of all states
+    def give_transition_counter(self, all_state_number: int) -> TransitionCounter:
+        if self.give_counter('markov').all_state_number != all_state_number:
+            raise ValueError('the markov statistic is not one of {} states'.format(all_state_number))
+        return self.give_counter('markov')
+
+    # this function gives the order 2 values of all states
+    def give_order2_counter(self, all_state_number: int) -> Order2Counter:
+        if self.give_counter('order2').all_state_number != all_state_number:
+            raise ValueError('the order 2 statistic is not one of {} states'.format(all_state_number))
+        return self.give_counter('order2')
+
+
+# this function merges partial statistics of adjacent shards, in any order. The sums are added in shard order, see
+# StatisticSums for adding up shard files one after another.
+def merge_partial_statistics(partial_statistics_list: list) -> PartialStatistics:
+    partial_statistics_list = sorted(partial_statistics_list, key=lambda partial1: (partial1.start, partial1.end))
+    merged = PartialStatistics(partial_statistics_list[0].start, partial_statistics_list[0].start)
+    for partial1 in partial_statistics_list:
+        if partial1.start != merged.end:
+            raise ValueError('shard {}-{} does not follow shard ending at {}'.format(partial1.start, partial1.end,
+                                                                                    merged.end))
+        for name in partial1.sizes:
+            merged.add_contributions(name, partial1.sizes[name], partial1.give_keys(name), partial1.give_values(name))
+        merged.end = partial1.end
+    return merged
+
+
+# this function is the worker entry point, it counts trajectories start, ..., end - 1 of the dataset of a frozen grid
+# and writes the partial statistics, see ShardCounter
+def count_shard(grid_file_name: str, start: int, end: int, partial_file_name: str) -> None:
+    with open(grid_file_name, 'rb') as f:
+        grid = pickle.load(f)
+    trajectory_chunks = TrajectoryChunks(grid.cc, grid.cc.chunk_size)
+    partial1 = PartialStatistics(start, end)
+    partial1.set_up_for_grid(grid)
+    for trajectory_set1 in trajectory_chunks.iterate_range(start, end):
+        partial1.add_trajectory_set(grid, trajectory_set1)
+    partial1.save(partial_file_name)
+
+
+# this function adds increments to the sums of sorted keys one after another, it gives the sorted keys and sums of both.
+# The additions are done in float64 and rounded to the dtype of the sums, so float16 sums round once per addition.
+def add_to_key_sums(keys: np.ndarray, sums: np.ndarray, new_keys: np.ndarray, increments: np.ndarray):
+    new_keys = np.asarray(new_keys, dtype=np.int64)
+    all_keys = np.union1d(keys, new_keys)
+    all_sums = np.zeros(all_keys.size, dtype=sums.dtype)
+    all_sums[np.searchsorted(all_keys, keys)] = sums
+    np.add.at(all_sums, np.searchsorted(all_keys, new_keys), np.asarray(increments, dtype=np.float64))
+    return all_keys, all_sums
+
+
+# This class splits the trajectories of a dataset into shards, counts every shard in its own process and adds up the
+# partial statistics one shard after another. The grid is frozen (pickled) once and read by every worker.
+class ShardCounter:
+
+    def __init__(self, shard_number: int = 1, worker_number: int = 1):
+        self.shard_number = max(shard_number, 1)
+        self.worker_number = max(worker_number, 1)
+
+    # this function gives the trajectory ranges of the shards
+    def give_shard_ranges(self, trajectory_number: int) -> list:
+        bounds = np.linspace(0, trajectory_number, self.shard_number + 1).astype(np.int64).tolist()
+        return [(bounds[i], bounds[i + 1]) for i in range(self.shard_number)]
+
+    # this function writes a grid for count_shard
+    def freeze_grid(self, grid, grid_file_name: str) -> None:
+        with open(grid_file_name, 'wb') as f:
+            pickle.dump(grid, f)
+
+    # this function counts all trajectories of trajectory_chunks on grid
+    def count(self, grid, trajectory_chunks: TrajectoryChunks) -> StatisticSums:
+        with tempfile.TemporaryDirectory() as folder:
+            grid_file_name = os.path.join(folder, 'grid.pickle')
+            self.freeze_grid(grid, grid_file_name)
+            tasks = [(grid_file_name, start, end, os.path.join(folder, 'shard_{}.npz'.format(shard_index)))
+                     for shard_index, (start, end) in enumerate(self.give_shard_ranges(
+                         trajectory_chunks.trajectory_number))]
+            if self.worker_number > 1 and len(tasks) > 1:
+                with multiprocessing.Pool(min(self.worker_number, len(tasks))) as pool:
+                    pool.starmap(count_shard, tasks)
+            else:
+                for task in tasks:
+                    count_shard(*task)
+            sums1 = StatisticSums()
+            sums1.add_partial_statistics_files([task[3] for task in tasks])
+        return sums1
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(description="Count a shard of trajectories or merge partial statistics")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    count_parser = subparsers.add_parser('count', help='Count trajectories start, ..., end - 1 on a frozen grid')
+    count_parser.add_argument('grid', type=str, help='Grid written by ShardCounter.freeze_grid')
+    count_parser.add_argument('start', type=int)
+    count_parser.add_argument('end', type=int)
+    count_parser.add_argument('output', type=str, help='Partial statistics file')
+    merge_parser = subparsers.add_parser('merge', help='Merge partial statistics of adjacent shards')
+    merge_parser.add_argument('output', type=str, help='Merged partial statistics file')
+    merge_parser.add_argument('inputs', type=str, nargs='+', help='Partial statistics files')
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    if args.command == 'count':
+        count_shard(args.grid, args.start, args.end, args.output)
+    else:
+        input_statistics = []
+        for input_name in args.inputs:
+            input_partial = PartialStatistics()
+            input_partial.load(input_name)
+            input_statistics.append(input_partial)
+        merge_partial_statistics(input_statistics).save(args.output)
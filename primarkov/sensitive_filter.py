@@ -1,6 +1,8 @@
 import numpy as np
+from scipy import sparse
 import config.folder_and_file_names as config
 from config.parameter_carrier import ParameterCarrier
+from tools.general_tools import GeneralTools
 
 
 class Filter:
@@ -18,7 +20,7 @@ class Filter:
 
         self.distribution_threshold = 5
 
-    #
+    # the markov matrix is a dense array or a sparse matrix, see MarkovModel.noisy_markov
     def find_sensitive_state(self, markov_matrix):
         cc1 = self.cc
         self.real_state_number = markov_matrix.shape[0] - 2
@@ -36,14 +38,16 @@ class Filter:
 
     #
     def end_sensitivity(self, matrix):
-        end_distribution = matrix[:, -1]
+        gt1 = GeneralTools()
+        end_distribution = gt1.give_matrix_column(matrix, -1)
         end_distribution = end_distribution[:-2]
         end_indicator = (end_distribution > np.sum(end_distribution) * self.end_percentage)
         return end_indicator
 
     #
     def begin_sensitivity(self, matrix):
-        begin_distribution = matrix[-2, :]
+        gt1 = GeneralTools()
+        begin_distribution = gt1.give_matrix_row(matrix, -2)
         begin_distribution = begin_distribution[:-2]
         begin_indicator = (begin_distribution > np.sum(begin_distribution) * self.begin_percentage)
         return begin_indicator
@@ -51,7 +55,8 @@ class Filter:
     #
     def extremely_large_out_degree_sensitivity(self, matrix):
         cc1 = self.cc
-        out_degrees = matrix.sum(axis=1)
+        gt1 = GeneralTools()
+        out_degrees = gt1.give_matrix_sums(matrix, 1)
         total_degree = np.sum(out_degrees)
         threshold = total_degree * 0.02
         indicator = (out_degrees > threshold)
@@ -60,8 +65,9 @@ class Filter:
 
     #
     def degree_amount_sensitivity(self, matrix):
+        gt1 = GeneralTools()
         matrix = matrix[0: -2, 0: -2]
-        degree_amount_of_states = np.sum(matrix, axis=1)
+        degree_amount_of_states = gt1.give_matrix_sums(matrix, 1)
         amount_threshold = self.real_state_number * 1.414 / (self.cc.total_epsilon * self.cc.epsilon_partition[1])
         indicator = (degree_amount_of_states > amount_threshold)
         indicator = indicator[:self.real_state_number]
@@ -69,6 +75,8 @@ class Filter:
 
     #
     def degree_distribution_sensitivity(self, matrix):
+        if sparse.issparse(matrix):
+            return self.sparse_degree_distribution_sensitivity(matrix)
         indicator = np.empty(self.real_state_number, dtype=bool)
         for state_index in range(self.real_state_number):
             indicator[state_index] = False
@@ -79,3 +87,26 @@ class Filter:
                     if sorted_degree[0] / sorted_degree[1] < self.distribution_threshold:
                         indicator[state_index] = True
         return indicator
+
+    # this function is degree_distribution_sensitivity for a sparse matrix. The two largest out degrees of every state
+    # are taken from its stored entries and, if the row has entries that are not stored, from zero.
+    def sparse_degree_distribution_sensitivity(self, matrix):
+        gt1 = GeneralTools()
+        real_state_number = self.real_state_number
+        degrees = sparse.csr_matrix(matrix)[:real_state_number, :real_state_number]
+        stored_numbers = np.diff(degrees.indptr)
+        rows = np.repeat(np.arange(real_state_number), stored_numbers)
+        sorted_data = degrees.data[np.lexsort((-degrees.data, rows))]
+        candidates = np.full((real_state_number, 4), -np.inf)
+        has_one = stored_numbers >= 1
+        has_two = stored_numbers >= 2
+        candidates[has_one, 0] = sorted_data[degrees.indptr[:-1][has_one]]
+        candidates[has_two, 1] = sorted_data[degrees.indptr[:-1][has_two] + 1]
+        candidates[stored_numbers <= real_state_number - 1, 2] = 0
+        candidates[stored_numbers <= real_state_number - 2, 3] = 0
+        sorted_degree = - np.sort(-candidates, axis=1)
+        indicator = gt1.give_matrix_sums(degrees, 1) > 0
+        indicator &= sorted_degree[:, 1] > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            indicator &= sorted_degree[:, 0] / sorted_degree[:, 1] < self.distribution_threshold
+        return indicator
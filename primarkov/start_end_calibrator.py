@@ -43,6 +43,7 @@ class StartEndCalibrator:
         central_point_gps = grid.usable_state_central_points()
         self.state_number = grid.usable_state_number
         self.total_trajectory_number = grid.trajectory_number
+        self.distance_network.add_nodes_from(range(self.state_number))
         for state_index in trange(self.state_number, desc="Setting up distance network"):
             neighbors = grid.usable_state_neighbors(state_index)
             for neighbor_state in neighbors:
@@ -82,8 +83,8 @@ class StartEndCalibrator:
         gt1 = GeneralTools()
         self.setup_network(grid)
         self.large_trans_indicator = large_trans_indicator
-        start_states_value = noisy_matrix[-2, :-2]
-        end_states_value = noisy_matrix[:-2, -1]
+        start_states_value = gt1.give_matrix_row(noisy_matrix, -2)[:-2]
+        end_states_value = gt1.give_matrix_column(noisy_matrix, -1)[:-2]
         non_zero_start_values = start_states_value
         non_zero_end_values = end_states_value
         non_zero_start_indices = np.arange(start_states_value.size)
@@ -351,7 +352,7 @@ class StartEndCalibrator:
     #
     def distribution_optimization_cvxpy2(self, loose_parameter=20):
         lengths = self.inner_indices_shortest_path_lengths
-        lengths = lengths * self.large_trans_indicator
+        lengths = self.large_trans_indicator.multiply(lengths).toarray()
         lengths[lengths < 0.01] = 0.01
         distribution = cp.Variable((self.non_zero_start_indices.size, self.non_zero_end_indices.size))
         start_error = cp.norm(cp.sum(cp.multiply(distribution, 1 / lengths), axis=1) - self.non_zero_start_values)
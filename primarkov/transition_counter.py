@@ -0,0 +1,71 @@
+import numpy as np
+from scipy import sparse
+
+from tools.general_tools import GeneralTools
+
+
+# This class collects the first order transitions of trajectories, i.e. the sum of the matrices of
+# MarkovModel.trajectory_markov_probability, without a dense matrix per trajectory. The transitions of a whole
+# trajectory set are found at once as (key, increment) pairs, key is from state * all_state_number + to state. A value
+# is kept for every key that occurs, and increments are added one after another in trajectory order, so the values are
+# identical to adding up the dense matrices.
+class TransitionCounter:
+
+    def __init__(self, all_state_number: int):
+        self.all_state_number = all_state_number
+        self.start_state_index = all_state_number - 2
+        self.end_state_index = all_state_number - 1
+        # sorted keys and their values
+        self.keys = np.array([], dtype=np.int64)
+        self.values = np.array([])
+
+    # this function adds the usable simple trajectories of a trajectory set
+    def add_trajectory_set(self, trajectory_set1) -> None:
+        keys, increments = self.give_keys_and_increments(trajectory_set1)
+        self.add_values(keys, increments)
+
+    # this function gives the transitions of every trajectory of a set in trajectory order, i.e. how often the
+    # trajectory makes a transition divided by its transition number. Trajectories with a not usable state do not
+    # contribute.
+    def give_keys_and_increments(self, trajectory_set1):
+        gt1 = GeneralTools()
+        sequence = trajectory_set1.usable_simple_sequence
+        if sequence is None or sequence.size == 0:
+            return np.array([], dtype=np.int64), np.array([])
+        sequence = sequence.astype(np.int64)
+        simple_offsets = trajectory_set1.simple_offsets
+        lengths = np.diff(simple_offsets)
+        trajectory_positions = np.repeat(np.arange(lengths.size), lengths)
+        is_last = np.zeros(sequence.size, dtype=bool)
+        is_last[simple_offsets[1:][lengths > 0] - 1] = True
+        next_states = np.append(sequence[1:], self.end_state_index)
+        next_states[is_last] = self.end_state_index
+        first_states = sequence[simple_offsets[:-1][lengths > 0]]
+        # transitions to the next state or the end state, and from the start state to the first one
+        keys = np.concatenate((sequence * self.all_state_number + next_states,
+                               self.start_state_index * self.all_state_number + first_states))
+        positions = np.concatenate((trajectory_positions, np.flatnonzero(lengths > 0)))
+        usable = ~trajectory_set1.has_not_usable_index[positions]
+        return gt1.grouped_frequency(positions[usable], keys[usable], lengths + 1)
+
+    # this function adds increments to the values of keys, one after another
+    def add_values(self, keys: np.ndarray, increments: np.ndarray) -> None:
+        if self.keys.size == 0:
+            # the first values are summed by bincount, it adds the increments of a key in their order as well
+            self.keys, key_positions = np.unique(keys, return_inverse=True)
+            self.values = np.bincount(key_positions, weights=increments, minlength=self.keys.size)
+            return
+        new_keys = np.setdiff1d(keys, self.keys)
+        if new_keys.size > 0:
+            all_keys = np.union1d(self.keys, new_keys)
+            all_values = np.zeros(all_keys.size)
+            all_values[np.searchsorted(all_keys, self.keys)] = self.values
+            self.keys = all_keys
+            self.values = all_values
+        np.add.at(self.values, np.searchsorted(self.keys, keys), increments)
+
+    # this function gives the transitions as sparse matrix
+    def give_markov_matrix(self) -> sparse.csr_matrix:
+        rows = self.keys // self.all_state_number
+        columns = self.keys % self.all_state_number
+        return sparse.csr_matrix((self.values, (rows, columns)), shape=(self.all_state_number, self.all_state_number))
@@ -0,0 +1,68 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.parameter_carrier import ParameterCarrier  # noqa: E402
+from config.parameter_setter import ParSetter  # noqa: E402
+from data_preparation.trajectory_set import TrajectorySet  # noqa: E402
+from discretization.get_discretization import DisData  # noqa: E402
+from tools.data_reader import DataReader  # noqa: E402
+
+
+# this fixture writes a small data set of random walks once per test session
+@pytest.fixture(scope='session')
+def walk_file(tmp_path_factory):
+    generator1 = np.random.default_rng(11)
+    lines = []
+    for i in range(4000):
+        steps = generator1.normal(0, 0.4, (generator1.integers(2, 25), 2))
+        # half of the walks start in a dense spot, so that its large cells are subdivided
+        start = generator1.normal(2, 0.3, 2) if i % 2 == 0 else generator1.uniform(0, 10, 2)
+        points = np.clip(start + np.cumsum(steps, axis=0), 0, 10)
+        lines.append('#{}:\n>0:'.format(i) + ''.join('{:.4f},{:.4f};'.format(*point) for point in points) + '\n')
+    file_name = str(tmp_path_factory.mktemp('walks') / 'walks.dat')
+    with open(file_name, 'w') as stream:
+        stream.write(''.join(lines))
+    return file_name
+
+
+# this fixture gives the data set of random walks and works in a temporary folder, so parse caches are not written
+# into the repository
+@pytest.fixture
+def trajectory_file(walk_file, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return walk_file
+
+
+# this fixture gives a function making the parameters of a run on a data file, options are set on the carrier
+@pytest.fixture(scope='session')
+def make_carrier(tmp_path_factory):
+    output_file_name = str(tmp_path_factory.mktemp('output') / 'out.dat')
+
+    def give_carrier(file_name, **options):
+        args = ParSetter().set_up_args(dataset_file_name=file_name, output_file_name=output_file_name, out_size=50)
+        cc = ParameterCarrier(args)
+        for option_name, value in options.items():
+            setattr(cc, option_name, value)
+        return cc
+    return give_carrier
+
+
+# this function reads a data file into a trajectory set without a parse cache
+def read_trajectory_set(file_name) -> TrajectorySet:
+    trajectory_set1 = TrajectorySet()
+    trajectory_set1.give_points_and_offsets(*DataReader(use_cache=False).read_tra_data_in_bulk(file_name))
+    return trajectory_set1
+
+
+# this fixture gives the grid and the discretized trajectory set of the random walks, tests must not change them
+@pytest.fixture(scope='session')
+def discretized_walks(walk_file, make_carrier):
+    np.random.seed(0)
+    trajectory_set1 = read_trajectory_set(walk_file)
+    grid = DisData(make_carrier(walk_file)).get_discrete_data(trajectory_set1)
+    return grid, trajectory_set1
@@ -0,0 +1,27 @@
+import bz2
+import gzip
+import lzma
+
+import numpy as np
+import pytest
+
+from tools.data_reader import DataReader
+
+
+TRAJECTORY_TEXT = ''.join('#{0}:\n>0:{0}.5,1.25;2,{0};\n'.format(i) for i in range(50)).encode()
+
+
+@pytest.mark.parametrize('file_opener', [gzip.open, bz2.open, lzma.open])
+def test_compressed_file_matches_plain_file(tmp_path, file_opener):
+    plain_file_name = str(tmp_path / 'trajectories.dat')
+    compressed_file_name = str(tmp_path / 'trajectories.dat.compressed')
+    with open(plain_file_name, 'wb') as stream:
+        stream.write(TRAJECTORY_TEXT)
+    with file_opener(compressed_file_name, 'wb') as stream:
+        stream.write(TRAJECTORY_TEXT)
+    reader1 = DataReader(block_size=32, use_cache=False)
+    assert reader1.give_file_opener(compressed_file_name) is file_opener
+    plain_points, plain_offsets = reader1.read_tra_data_in_bulk(plain_file_name)
+    points, offsets = reader1.read_tra_data_in_bulk(compressed_file_name)
+    assert np.array_equal(plain_points, points)
+    assert np.array_equal(plain_offsets, offsets)
@@ -0,0 +1,66 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from tools.data_reader import DataReader
+
+
+TRAJECTORY_TEXT = ('#0:\n>0:5.7,5.2;5.1,5.0;\n'
+                   '#1:\n>0:-1.25,0.5;1e3,-2;-0.0,7;\n'
+                   '#2:\n>0:\n'
+                   '#3:\n>0:1,,2;;3||4**;\n'
+                   '#4:\n>0:12345678901234.5,0.000000000000001;\n')
+
+
+def write_file(folder, text, name='trajectories.dat', opener=open):
+    file_name = str(folder / name)
+    with opener(file_name, 'wb') as stream:
+        stream.write(text.encode())
+    return file_name
+
+
+def assert_same_trajectories(reference_list, trajectory_list):
+    assert len(reference_list) == len(trajectory_list)
+    for reference, trajectory in zip(reference_list, trajectory_list):
+        assert reference.shape == trajectory.shape
+        assert np.array_equal(reference.view(np.int64), trajectory.view(np.int64))
+
+
+@pytest.mark.parametrize('block_size', [7, 64, 16 * 1024 * 1024])
+def test_bulk_reader_matches_line_by_line(tmp_path, block_size):
+    file_name = write_file(tmp_path, TRAJECTORY_TEXT)
+    reader1 = DataReader(block_size=block_size, use_cache=False)
+    assert_same_trajectories(reader1.read_tra_data_line_by_line(file_name), reader1.read_tra_data(file_name))
+
+
+def test_random_trajectories_match_line_by_line(tmp_path):
+    generator1 = np.random.default_rng(0)
+    lines = []
+    for i in range(200):
+        points = generator1.uniform(-180, 180, (generator1.integers(0, 20), 2))
+        lines.append('#{}:\n>0:'.format(i) + ''.join('{:.6f},{:.6f};'.format(*point) for point in points) + '\n')
+    file_name = write_file(tmp_path, ''.join(lines))
+    reader1 = DataReader(block_size=1024, use_cache=False)
+    assert_same_trajectories(reader1.read_tra_data_line_by_line(file_name), reader1.read_tra_data(file_name))
+
+
+def test_parallel_and_compressed_readers_match(tmp_path):
+    file_name = write_file(tmp_path, TRAJECTORY_TEXT * 20)
+    compressed_file_name = write_file(tmp_path, TRAJECTORY_TEXT * 20, 'trajectories.dat.gz', gzip.open)
+    reference_list = DataReader(use_cache=False).read_tra_data_line_by_line(file_name)
+    assert_same_trajectories(reference_list, DataReader(use_cache=False, worker_number=3).read_tra_data(file_name))
+    assert_same_trajectories(reference_list, DataReader(use_cache=False).read_tra_data(compressed_file_name))
+
+
+def test_block_parser_keeps_non_decimal_values():
+    points, lengths = DataReader().parse_tra_block(b'>0:1e3,-2;nan,inf;\n')
+    assert lengths.tolist() == [2]
+    assert points[0].tolist() == [1000.0, -2.0]
+    assert np.isnan(points[1, 0]) and np.isinf(points[1, 1])
+
+
+@pytest.mark.parametrize('block', [b'>0:1,2,3;\n', b'>0:1,a;\n', b'>0:;1,2;\n'])
+def test_block_parser_rejects_malformed_lines(block):
+    with pytest.raises(ValueError):
+        DataReader().parse_tra_block(block)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from tools.data_reader import DataReader
+from tools.data_sampler import DataSampler
+
+
+def write_numbered_file(folder, trajectory_number=120):
+    # the first coordinate of every point is the trajectory number
+    lines = ['#{0}:\n>0:'.format(i) + '{0},1;{0},2;'.format(i) * (i % 3 + 1) + '\n' for i in range(trajectory_number)]
+    file_name = str(folder / 'trajectories.dat')
+    with open(file_name, 'w') as stream:
+        stream.write(''.join(lines))
+    return file_name
+
+
+def sample_one_by_one(trajectory_number: int, sample_size: int, seed: int) -> list:
+    # algorithm R with one random draw per trajectory after the reservoir is full
+    rng = np.random.default_rng(seed)
+    reservoir = list(range(min(sample_size, trajectory_number)))
+    for number in range(sample_size, trajectory_number):
+        slot = int(rng.integers(0, number + 1))
+        if slot < sample_size:
+            reservoir[slot] = number
+    return sorted(reservoir)
+
+
+@pytest.mark.parametrize('block_size', [40, 300, 1 << 20])
+def test_reservoir_sample_matches_one_by_one_sampling(tmp_path, block_size):
+    file_name = write_numbered_file(tmp_path)
+    sampler1 = DataSampler(sample_size=25, seed=3, reader=DataReader(block_size=block_size, use_cache=False))
+    trajectory_numbers, trajectory_list = sampler1.sample_data_file(file_name)
+    assert trajectory_numbers.tolist() == sample_one_by_one(120, 25, 3)
+    for number, trajectory in zip(trajectory_numbers, trajectory_list):
+        assert trajectory.shape == (2 * (number % 3 + 1), 2) and (trajectory[:, 0] == number).all()
+
+
+def test_streaming_folds_match_sampled_folds(tmp_path):
+    file_name = write_numbered_file(tmp_path)
+    reader1 = DataReader(block_size=64, use_cache=False)
+    streamed_names = DataSampler(fold_number=3, reader=reader1).split_data_file(file_name, str(tmp_path / 'streamed'))
+    sampled_names = DataSampler(sample_size=1000, fold_number=3, reader=reader1).split_data_file(
+        file_name, str(tmp_path / 'sampled'))
+    fold_sizes = []
+    for streamed_name, sampled_name in zip(streamed_names, sampled_names):
+        with open(streamed_name, 'rb') as streamed_file, open(sampled_name, 'rb') as sampled_file:
+            assert streamed_file.read() == sampled_file.read()
+        fold_sizes.append(len(reader1.read_tra_data(streamed_name)))
+    assert sum(fold_sizes) == 120 and min(fold_sizes) > 0
+
+
+def test_folds_keep_the_input_coordinates(tmp_path):
+    generator1 = np.random.default_rng(8)
+    trajectory_list = [generator1.normal(0, 10, (int(generator1.integers(1, 6)), 2)) for _ in range(40)]
+    trajectory_list[0][0] = [5.732, -8.618643]
+    trajectory_list[1][0] = [1e-05, 2.5e+20]
+    file_name = str(tmp_path / 'trajectories.dat')
+    with open(file_name, 'w') as stream:
+        for i, trajectory in enumerate(trajectory_list):
+            stream.write('#{}:\n>0:'.format(i) + ''.join('{!r},{!r};'.format(x, y) for x, y in trajectory.tolist())
+                         + '\n')
+    reader1 = DataReader(use_cache=False)
+    for sample_size in (-1, 1000):
+        fold_names = DataSampler(sample_size=sample_size, fold_number=2).split_data_file(
+            file_name, str(tmp_path / 'folds{}'.format(sample_size)))
+        written_list = [trajectory for fold_name in fold_names for trajectory in reader1.read_tra_data(fold_name)]
+        assert len(written_list) == len(trajectory_list)
+        for trajectory in trajectory_list:
+            assert any(np.array_equal(trajectory, written) for written in written_list)
+        assert '5.732,-8.618643;' in open(fold_names[0]).read() + open(fold_names[1]).read()
@@ -0,0 +1,32 @@
+import numpy as np
+
+from tools.data_reader import DataReader
+from tools.data_writer import DataWriter
+from tools.trajectory_store import TrajectoryStore
+
+
+TRAJECTORY_LIST = [np.array([[1.234, 5.678], [-0.004, 12.5]]), np.empty((0, 2)), np.array([]),
+                   np.array([[100.125, -3.0]])]
+
+
+def test_batch_writer_matches_point_by_point_writer(tmp_path):
+    writer1 = DataWriter(batch_size=3)
+    writer1.save_trajectory_data_in_list_to_file_point_by_point(TRAJECTORY_LIST, str(tmp_path / 'reference.dat'))
+    writer1.save_trajectories(TRAJECTORY_LIST, str(tmp_path / 'batch.dat'))
+    assert (tmp_path / 'reference.dat').read_bytes() == (tmp_path / 'batch.dat').read_bytes()
+
+
+def test_store_writer_keeps_full_precision(tmp_path):
+    store_name = str(tmp_path / 'trajectories')
+    DataWriter().save_trajectories(TRAJECTORY_LIST, store_name, output_format='store')
+    points, offsets, _ = TrajectoryStore().read_store(store_name)
+    assert offsets.tolist() == [0, 2, 2, 2, 3]
+    assert np.array_equal(points, np.concatenate([TRAJECTORY_LIST[0], TRAJECTORY_LIST[3]]))
+
+
+def test_written_file_reads_back(tmp_path):
+    file_name = str(tmp_path / 'batch.dat')
+    DataWriter().save_trajectories(TRAJECTORY_LIST, file_name)
+    trajectory_list = DataReader(use_cache=False).read_tra_data(file_name)
+    assert [tr.shape[0] for tr in trajectory_list] == [2, 0, 0, 1]
+    assert np.array_equal(trajectory_list[0], np.round(TRAJECTORY_LIST[0], 2))
@@ -0,0 +1,60 @@
+import numpy as np
+
+from primarkov.guidepost import GuidePost
+from primarkov.mar_model import MarkovModel
+from tools.noise import Noise
+
+
+# this function is the noise of one guidepost, every row of the noisy matrix is regulated by the queue
+def noisy_order2_matrix_by_queue(order2_matrix, state, epsilon, seed):
+    noise1 = Noise()
+    generator1 = noise1.give_keyed_generator(seed, state)
+    noisy_matrix = order2_matrix + generator1.laplace(scale=1 / epsilon, size=order2_matrix.shape)
+    noisy_matrix = np.array([noise1.positive_regulation_by_queue(row) for row in noisy_matrix])
+    return noisy_matrix.astype(int)
+
+
+# this function gives a markov model with guideposts on every fourth state and their order 2 values
+def model_with_guideposts(discretized_walks, make_carrier, walk_file, **options):
+    grid, trajectory_set1 = discretized_walks
+    mo1 = MarkovModel(make_carrier(walk_file, guidepost_noise_seed=5, **options))
+    mo1.set_up_for_model(grid)
+    mo1.guidepost_indicator = (np.arange(mo1.all_state_number) % 4 == 1) & \
+        (np.arange(mo1.all_state_number) < mo1.subcell_number)
+    mo1.sensitive_indices()
+    mo1.set_up_guideposts(grid)
+    mo1.give_guidepost_order2_info(trajectory_set1)
+    return mo1
+
+
+def test_guidepost_noise_matches_queue(discretized_walks, make_carrier, walk_file):
+    mo1 = model_with_guideposts(discretized_walks, make_carrier, walk_file)
+    epsilon = mo1.cc.total_epsilon * mo1.cc.epsilon_partition[2]
+    reference = [noisy_order2_matrix_by_queue(guidepost1.order2_trans_matrix, guidepost1.this_state, epsilon, 5)
+                 for guidepost1 in mo1.guidepost_set]
+    mo1.add_noise_to_guidepost()
+    assert len(mo1.guidepost_set) > 3
+    for guidepost1, reference_matrix in zip(mo1.guidepost_set, reference):
+        assert np.array_equal(guidepost1.order2_trans_matrix, reference_matrix)
+        assert (guidepost1.order2_trans_matrix >= 0).all()
+
+
+def test_guidepost_noise_does_not_depend_on_worker_number(discretized_walks, make_carrier, walk_file):
+    noisy_matrices = []
+    for regulation_worker_number in (1, 3):
+        mo1 = model_with_guideposts(discretized_walks, make_carrier, walk_file,
+                                    regulation_worker_number=regulation_worker_number)
+        mo1.add_noise_to_guidepost()
+        noisy_matrices.append([guidepost1.order2_trans_matrix for guidepost1 in mo1.guidepost_set])
+    for noisy_matrix, other_matrix in zip(*noisy_matrices):
+        assert np.array_equal(noisy_matrix, other_matrix)
+
+
+def test_noise_of_a_guidepost_does_not_depend_on_others(make_carrier, walk_file):
+    guidepost1 = GuidePost(4, make_carrier(walk_file))
+    guidepost1.guidepost_set_up([1, 3, 5], 9, 7, 8)
+    guidepost1.order2_trans_matrix[1, 2] = 12
+    noisy_matrix = guidepost1.give_noisy_order2_matrix(0.2, 3)
+    assert noisy_matrix.shape == (8, 8)
+    assert np.array_equal(noisy_matrix, guidepost1.give_noisy_order2_matrix(0.2, 3))
+    assert not np.array_equal(noisy_matrix, guidepost1.give_noisy_order2_matrix(0.2, 4))
@@ -0,0 +1,99 @@
+import numpy as np
+
+from primarkov.mar_model import MarkovModel
+from primarkov.order2_counter import Order2Counter
+
+
+# this function is the original loop, every state gets an all_state_number x all_state_number order 2 matrix and every
+# element of a usable trajectory adds 1 / trajectory length to last state -> next state in float64
+def order2_matrices_by_loop(trajectory_set1, all_state_number):
+    matrices = np.zeros((all_state_number, all_state_number, all_state_number), dtype=np.float16)
+    for trajectory1 in trajectory_set1.trajectory_list:
+        if trajectory1.has_not_usable_index:
+            continue
+        sequence = trajectory1.usable_simple_sequence
+        for index_in_sequence in range(sequence.size):
+            state_previous = sequence[index_in_sequence - 1] if index_in_sequence > 0 else all_state_number - 2
+            state_next = sequence[index_in_sequence + 1] if index_in_sequence < sequence.size - 1 else \
+                all_state_number - 1
+            matrices[sequence[index_in_sequence], state_previous, state_next] = \
+                float(matrices[sequence[index_in_sequence], state_previous, state_next]) + 1 / sequence.size
+    return matrices
+
+
+# this function gives a markov model with a guidepost on every state
+def model_with_all_guideposts(discretized_walks, make_carrier, walk_file, guidepost_states):
+    grid = discretized_walks[0]
+    mo1 = MarkovModel(make_carrier(walk_file, guidepost_states=guidepost_states))
+    mo1.set_up_for_model(grid)
+    mo1.guidepost_indicator = np.arange(mo1.all_state_number) < mo1.subcell_number
+    mo1.sensitive_indices()
+    mo1.set_up_guideposts(grid)
+    return mo1
+
+
+def test_guideposts_of_all_states_match_loop(discretized_walks, make_carrier, walk_file):
+    trajectory_set1 = discretized_walks[1]
+    mo1 = model_with_all_guideposts(discretized_walks, make_carrier, walk_file, 'all')
+    mo1.give_guidepost_order2_info(trajectory_set1)
+    mo2 = model_with_all_guideposts(discretized_walks, make_carrier, walk_file, 'all')
+    order2_counter = Order2Counter(mo2.all_state_number)
+    order2_counter.add_trajectory_set(trajectory_set1)
+    mo2.give_guidepost_order2_info_from_counter(order2_counter)
+    reference = order2_matrices_by_loop(trajectory_set1, mo1.all_state_number)
+    for guidepost1, guidepost2 in zip(mo1.guidepost_set, mo2.guidepost_set):
+        state_reference = reference[guidepost1.this_state]
+        # nothing goes to the start state or comes from the end state, the matrix has all other cells
+        assert np.array_equal(guidepost1.order2_trans_matrix,
+                              state_reference[np.ix_(guidepost1.last_states, guidepost1.next_states)])
+        assert np.sum(guidepost1.order2_trans_matrix, dtype=float) == np.sum(state_reference, dtype=float)
+        assert np.array_equal(guidepost2.order2_trans_matrix, guidepost1.order2_trans_matrix)
+        for last_state in ('start', guidepost1.last_states[0], guidepost1.last_states[-2]):
+            last_row = mo1.start_state_index if last_state == 'start' else last_state
+            assert np.array_equal(guidepost1.choose_direction(last_state, 0, return_probability=True),
+                                  state_reference[last_row])
+
+
+def test_guideposts_of_neighbors_leave_out_other_states(discretized_walks, make_carrier, walk_file):
+    trajectory_set1 = discretized_walks[1]
+    mo1 = model_with_all_guideposts(discretized_walks, make_carrier, walk_file, 'neighbors')
+    mo1.give_guidepost_order2_info(trajectory_set1)
+    reference = order2_matrices_by_loop(trajectory_set1, mo1.all_state_number)
+    left_out = 0
+    for guidepost1 in mo1.guidepost_set:
+        state_reference = reference[guidepost1.this_state]
+        assert np.array_equal(guidepost1.last_states[:-1], np.sort(mo1.grid.usable_state_neighbors(
+            guidepost1.this_state)))
+        assert np.array_equal(guidepost1.order2_trans_matrix,
+                              state_reference[np.ix_(guidepost1.last_states, guidepost1.next_states)])
+        left_out += np.sum(state_reference, dtype=float) - np.sum(guidepost1.order2_trans_matrix, dtype=float)
+    assert left_out > 0
+
+
+def test_noise_covers_all_cells_of_guideposts(discretized_walks, make_carrier, walk_file):
+    mo1 = model_with_all_guideposts(discretized_walks, make_carrier, walk_file, 'all')
+    for guidepost1 in mo1.guidepost_set[:3]:
+        noisy_matrix = guidepost1.give_noisy_order2_matrix(0.5, 11)
+        assert noisy_matrix.shape == (mo1.subcell_number + 1, mo1.subcell_number + 1)
+        assert (noisy_matrix >= 0).all()
+        assert noisy_matrix.any()
+
+
+def test_both_layouts_give_the_same_counts_of_neighbors(discretized_walks, make_carrier, walk_file):
+    trajectory_set1 = discretized_walks[1]
+    guidepost_sets = []
+    for guidepost_states in ('all', 'neighbors'):
+        mo1 = model_with_all_guideposts(discretized_walks, make_carrier, walk_file, guidepost_states)
+        mo1.give_guidepost_order2_info(trajectory_set1)
+        guidepost_sets.append(mo1.guidepost_set)
+    for all_guidepost, neighbor_guidepost in zip(*guidepost_sets):
+        assert neighbor_guidepost.order2_trans_matrix.size < all_guidepost.order2_trans_matrix.size
+        last_positions = all_guidepost.give_last_positions(neighbor_guidepost.last_states)
+        next_positions = all_guidepost.give_next_positions(neighbor_guidepost.next_states)
+        assert np.array_equal(all_guidepost.order2_trans_matrix[np.ix_(last_positions, next_positions)],
+                              neighbor_guidepost.order2_trans_matrix)
+        for last_state in neighbor_guidepost.last_states[:-1]:
+            assert np.array_equal(
+                all_guidepost.choose_direction(last_state, 0, return_probability=True)[neighbor_guidepost.next_states],
+                neighbor_guidepost.choose_direction(last_state, 0, return_probability=True)[
+                    neighbor_guidepost.next_states])
@@ -0,0 +1,70 @@
+import numpy as np
+
+from primarkov.mar_model import MarkovModel
+from primarkov.order2_counter import Order2Counter
+
+
+# this function is the original walk over every step of every trajectory, the guidepost of a state gets the step
+# through guidepost_add with 'start' and 'end' at the ends of the trajectory
+def add_trigrams_by_loop(mo1, trajectory_set1):
+    for trajectory1 in trajectory_set1.trajectory_list:
+        if trajectory1.has_not_usable_index:
+            continue
+        sequence = trajectory1.usable_simple_sequence
+        for index_in_sequence in range(sequence.size):
+            state_previous = sequence[index_in_sequence - 1] if index_in_sequence > 0 else 'start'
+            state_next = sequence[index_in_sequence + 1] if index_in_sequence < sequence.size - 1 else 'end'
+            guidepost_index = mo1.index_dict[sequence[index_in_sequence]]
+            if guidepost_index >= 0:
+                mo1.guidepost_set[guidepost_index].guidepost_add(state_previous, state_next, sequence.size)
+
+
+# this function gives a markov model with guideposts on every third state
+def model_with_guideposts(discretized_walks, make_carrier, walk_file, guidepost_states):
+    grid = discretized_walks[0]
+    mo1 = MarkovModel(make_carrier(walk_file, guidepost_states=guidepost_states))
+    mo1.set_up_for_model(grid)
+    mo1.guidepost_indicator = (np.arange(mo1.all_state_number) % 3 == 0) & \
+        (np.arange(mo1.all_state_number) < mo1.subcell_number)
+    mo1.sensitive_indices()
+    mo1.set_up_guideposts(grid)
+    return mo1
+
+
+def test_guidepost_trigrams_match_loop(discretized_walks, make_carrier, walk_file):
+    trajectory_set1 = discretized_walks[1]
+    for guidepost_states in ('all', 'neighbors'):
+        mo1 = model_with_guideposts(discretized_walks, make_carrier, walk_file, guidepost_states)
+        mo1.give_guidepost_order2_info(trajectory_set1)
+        reference = model_with_guideposts(discretized_walks, make_carrier, walk_file, guidepost_states)
+        add_trigrams_by_loop(reference, trajectory_set1)
+        assert len(mo1.guidepost_set) == len(reference.guidepost_set) > 0
+        for guidepost1, reference_guidepost in zip(mo1.guidepost_set, reference.guidepost_set):
+            assert guidepost1.this_state == reference_guidepost.this_state
+            assert np.array_equal(guidepost1.order2_trans_matrix, reference_guidepost.order2_trans_matrix)
+        assert any(guidepost1.order2_trans_matrix.any() for guidepost1 in mo1.guidepost_set)
+
+
+def test_order2_values_round_like_the_loop(discretized_walks):
+    trajectory_set1 = discretized_walks[1]
+    all_state_number = discretized_walks[0].usable_state_number + 2
+    # every step adds in float64 and rounds to float16, written out so that it does not depend on numpy casting
+    reference = {}
+    for trajectory1 in trajectory_set1.trajectory_list:
+        if trajectory1.has_not_usable_index:
+            continue
+        sequence = trajectory1.usable_simple_sequence.tolist()
+        last_states = [all_state_number - 2] + sequence[:-1]
+        next_states = sequence[1:] + [all_state_number - 1]
+        for state, last_state, next_state in zip(sequence, last_states, next_states):
+            key = (state * all_state_number + last_state) * all_state_number + next_state
+            reference[key] = np.float16(float(reference.get(key, np.float16(0))) + 1 / len(sequence))
+    order2_counter = Order2Counter(all_state_number)
+    keys, increments = order2_counter.give_keys_and_increments(trajectory_set1)
+    assert increments.dtype == np.float64
+    half = keys.size // 2
+    order2_counter.add_values(keys[:half], increments[:half])
+    order2_counter.add_values(keys[half:], increments[half:])
+    assert order2_counter.keys.tolist() == sorted(reference)
+    assert np.array_equal(order2_counter.values.view(np.uint16),
+                          np.array([reference[key] for key in sorted(reference)], dtype=np.float16).view(np.uint16))
@@ -0,0 +1,37 @@
+import numpy as np
+
+from data_preparation.trajectory import Trajectory
+
+
+def give_single_trajectory(trajectory1) -> Trajectory:
+    single_trajectory = Trajectory()
+    single_trajectory.give_trajectory_list(np.array(trajectory1.trajectory_array))
+    return single_trajectory
+
+
+def test_level1_cells_of_set_match_single_trajectories(discretized_walks):
+    grid, trajectory_set1 = discretized_walks
+    for trajectory1 in trajectory_set1.trajectory_list[:500]:
+        single_trajectory = give_single_trajectory(trajectory1)
+        grid.level1_trajectory_point_to_cell(single_trajectory)
+        assert np.array_equal(single_trajectory.level1_cell_index_sequence, trajectory1.level1_cell_index_sequence)
+
+
+def test_level1_cells_contain_their_points(discretized_walks):
+    grid, trajectory_set1 = discretized_walks
+    # rows of the border dict are north, south, west, east
+    borders = grid.get_level1_index_border_dict()[trajectory_set1.level1_cell_index_sequence]
+    points = trajectory_set1.trajectory_array
+    assert ((points[:, 0] >= borders[:, 2]) & (points[:, 0] <= borders[:, 3])).all()
+    assert ((points[:, 1] >= borders[:, 1]) & (points[:, 1] <= borders[:, 0])).all()
+
+
+def test_level1_density_matches_sum_of_trajectory_densities(discretized_walks):
+    grid, trajectory_set1 = discretized_walks
+    cell_number = grid.get_level1_cell_number()
+    density = np.zeros(cell_number)
+    for trajectory1 in trajectory_set1.trajectory_list:
+        single_trajectory = give_single_trajectory(trajectory1)
+        single_trajectory.give_level1_index_array(np.array(trajectory1.level1_cell_index_sequence))
+        density = density + single_trajectory.give_regularized_trajectory_cell_density(cell_number)
+    assert np.array_equal(density, grid.get_level1_real_density())
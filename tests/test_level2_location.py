@@ -0,0 +1,38 @@
+import numpy as np
+
+from tools.general_tools import GeneralTools
+
+
+# this function is the original subcell lookup, one large cell after another through the position index dict
+def locate_by_position_dict(grid, x_point_array, y_point_array, level1_array):
+    general_tool1 = GeneralTools()
+    index_array = np.zeros(x_point_array.shape[0], dtype=int) - 1
+    for big_cell_index in np.unique(level1_array):
+        in_index = (level1_array == big_cell_index)
+        x_position_in_big_cell = general_tool1.get_bin_index(x_point_array[in_index],
+                                                             grid.level2_x_bin_dict[big_cell_index])
+        y_position_in_big_cell = general_tool1.get_bin_index(y_point_array[in_index],
+                                                             grid.level2_y_bin_dict[big_cell_index])
+        index_array[in_index] = [grid.level2_position_index_dict[(big_cell_index, x_p, y_p)]
+                                 for x_p, y_p in zip(x_position_in_big_cell, y_position_in_big_cell)]
+    return index_array
+
+
+def test_offset_table_lookup_matches_position_dict(discretized_walks):
+    grid, trajectory_set1 = discretized_walks
+    points = trajectory_set1.trajectory_array
+    level1_array = trajectory_set1.level1_cell_index_sequence
+    reference = locate_by_position_dict(grid, points[:, 0], points[:, 1], level1_array)
+    assert np.array_equal(reference, trajectory_set1.level2_cell_index_sequence)
+    assert np.array_equal(reference, grid.calculate_index_array_by_point_array(points[:, 0], points[:, 1],
+                                                                               level1_array))
+
+
+def test_level2_density_matches_sum_of_trajectory_densities(discretized_walks):
+    grid, trajectory_set1 = discretized_walks
+    density = np.zeros(grid.subcell_number)
+    for trajectory1 in trajectory_set1.trajectory_list:
+        density = density + grid.get_single_trajectory_level2_density(trajectory1)
+    real_density = np.zeros(grid.subcell_number)
+    real_density = grid.add_non_noisy_level2_density(trajectory_set1, real_density)
+    assert np.array_equal(density, real_density)
@@ -0,0 +1,35 @@
+import copy
+
+import numpy as np
+from scipy import sparse
+
+
+# this function is the original loop, it sets the entries next to every positive entry to indicator
+def add_neighbors_by_loop(grid, original_distribution, indicator=1):
+    result_distribution = copy.deepcopy(original_distribution)
+    neighbors_list = []
+    for i in range(original_distribution.shape[0]):
+        for j in range(original_distribution.shape[1]):
+            if original_distribution[i, j] > 0:
+                for nei_state in grid.usable_state_neighbors(i):
+                    neighbors_list.append((nei_state, j))
+                for nei_state in grid.usable_state_neighbors(j):
+                    neighbors_list.append((i, nei_state))
+    for row_index, col_index in neighbors_list:
+        result_distribution[row_index, col_index] = indicator
+    return result_distribution
+
+
+def test_neighbor_distribution_matches_loop(discretized_walks):
+    grid = discretized_walks[0]
+    generator1 = np.random.default_rng(3)
+    state_number = grid.usable_state_number
+    for indicator in (1, 0.5, -2):
+        distribution = generator1.uniform(-1, 3, (state_number, state_number))
+        distribution[generator1.uniform(size=distribution.shape) < 0.97] = 0
+        reference = add_neighbors_by_loop(grid, distribution, indicator)
+        result = grid.add_neighbors_to_distribution(distribution, indicator)
+        assert sparse.issparse(result)
+        assert np.array_equal(result.toarray(), reference)
+        result = grid.add_neighbors_to_distribution(sparse.csr_matrix(distribution), indicator)
+        assert np.array_equal(result.toarray(), reference)
@@ -0,0 +1,25 @@
+import numpy as np
+
+from generator.trajectory_generator import Generator
+
+
+# this function is the original dense boolean matrix, it is True where a usable state is a neighbor of another one
+def neighboring_matrix_by_loop(grid):
+    state_number = grid.usable_state_number
+    matrix = np.zeros((state_number, state_number), dtype=bool)
+    for state in range(state_number):
+        for neighbor in grid.usable_state_neighbors(state):
+            matrix[state, neighbor] = True
+    return matrix
+
+
+def test_sparse_neighboring_matrix_matches_dense(discretized_walks, make_carrier, walk_file):
+    grid = discretized_walks[0]
+    reference = neighboring_matrix_by_loop(grid)
+    generator1 = Generator(make_carrier(walk_file))
+    generator1.markov_model.set_up_for_model(grid)
+    generator1.markov_model.give_neighboring_matrix(grid)
+    assert np.array_equal(generator1.markov_model.neighboring_matrix.toarray(), reference)
+    for this_step in range(grid.usable_state_number):
+        for step_to_check in range(grid.usable_state_number):
+            assert generator1.check_if_neighbor(this_step, step_to_check) == reference[this_step, step_to_check]
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from tools.noise import Noise
+
+
+# this function gives noisy rows, rows with only positive or only negative values, rows of integers whose negative sum
+# runs out exactly at a positive value and rows whose positive values are all used up
+def noisy_rows(generator1):
+    rows = generator1.laplace(size=(40, 30)) * generator1.uniform(0.1, 5, (40, 1))
+    rows[generator1.uniform(size=rows.shape) < 0.2] = 0
+    rows[:3] = np.abs(rows[:3])
+    rows[3:6] = - np.abs(rows[3:6])
+    rows[6:16] = np.round(rows[6:16])
+    rows[16] = [-3, 1, 2] + [0] * 27
+    rows[17] = [-3, 1, 1, 1] + [0] * 26
+    rows[18] = 0
+    return rows
+
+
+def test_regulation_of_rows_matches_queue():
+    noise1 = Noise()
+    generator1 = np.random.default_rng(5)
+    for _ in range(20):
+        rows = noisy_rows(generator1)
+        reference = np.array([noise1.positive_regulation_by_queue(row.copy()) for row in rows])
+        for row_block in (1, 7, 256):
+            result = noise1.positive_regulation_for_markov_matrix(rows.copy(), 'queue_minus', row_block=row_block)
+            assert np.array_equal(result, reference)
+            assert (result >= 0).all()
+        assert np.array_equal(noise1.positive_regulation(rows[10].copy()), reference[10])
+
+
+def test_regulation_of_long_rows_matches_queue():
+    noise1 = Noise()
+    generator1 = np.random.default_rng(9)
+    # rows longer than the blocks of the pairwise sums of numpy
+    rows = generator1.laplace(size=(30, 700)) * generator1.uniform(0.1, 5, (30, 1))
+    rows[:, :5] += 40
+    reference = np.array([noise1.positive_regulation_by_queue(row.copy()) for row in rows])
+    assert np.array_equal(noise1.positive_regulation_for_markov_matrix(rows.copy()), reference)
+
+
+def test_regulation_by_processes_matches_one_process():
+    noise1 = Noise()
+    rows = noisy_rows(np.random.default_rng(7))
+    reference = noise1.positive_regulation_for_markov_matrix(rows.copy(), 'queue_minus')
+    result = noise1.positive_regulation_for_markov_matrix(rows.copy(), 'queue_minus', worker_number=3, row_block=8)
+    assert np.array_equal(result, reference)
+    with pytest.raises(ValueError):
+        noise1.positive_regulation_for_markov_matrix(rows.copy(), 'queue_minus', row_block=0)
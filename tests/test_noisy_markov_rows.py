@@ -0,0 +1,59 @@
+import numpy as np
+from scipy import sparse
+
+from primarkov.mar_model import MarkovModel
+from primarkov.sensitive_filter import Filter
+
+
+# this function gives a markov model of the discretized random walks with a noisy markov matrix made by rows
+def noisy_model_by_rows(discretized_walks, make_carrier, walk_file, row_block):
+    grid, trajectory_set1 = discretized_walks
+    mo1 = MarkovModel(make_carrier(walk_file, noisy_markov_mode='rows', noisy_markov_row_block=row_block,
+                                   noisy_markov_seed=7))
+    mo1.set_up_for_model(grid)
+    mo1.calculate_markov_probability(trajectory_set1)
+    mo1.noisy_markov()
+    return mo1
+
+
+def test_noisy_rows_are_sparse_and_do_not_depend_on_the_block(discretized_walks, make_carrier, walk_file):
+    mo1 = noisy_model_by_rows(discretized_walks, make_carrier, walk_file, 256)
+    assert sparse.isspmatrix_csr(mo1.noisy_markov_matrix)
+    assert (mo1.noisy_markov_matrix.data >= 0).all()
+    mo2 = noisy_model_by_rows(discretized_walks, make_carrier, walk_file, 7)
+    assert np.array_equal(mo1.noisy_markov_matrix.toarray(), mo2.noisy_markov_matrix.toarray())
+
+
+def test_sparse_noisy_matrix_is_used_like_the_dense_one(discretized_walks, make_carrier, walk_file):
+    sparse_model = noisy_model_by_rows(discretized_walks, make_carrier, walk_file, 256)
+    dense_model = noisy_model_by_rows(discretized_walks, make_carrier, walk_file, 256)
+    dense_model.noisy_markov_matrix = dense_model.noisy_markov_matrix.toarray()
+    filter1 = Filter(sparse_model.cc)
+    assert np.array_equal(filter1.find_sensitive_state(sparse_model.noisy_markov_matrix),
+                          filter1.find_sensitive_state(dense_model.noisy_markov_matrix))
+    for state in (0, 5, sparse_model.start_state_index):
+        assert np.array_equal(sparse_model.get_noisy_tran_pro_of_step_i(state),
+                              dense_model.get_noisy_tran_pro_of_step_i(state))
+    start_indices = np.arange(0, sparse_model.subcell_number, 3)
+    start_distribution = np.linspace(1, 2, start_indices.size)
+    end_indices = np.arange(1, sparse_model.subcell_number, 2)
+    for mo1 in (sparse_model, dense_model):
+        mo1.give_calibrated_start_and_end(start_indices, start_distribution, end_indices)
+    assert sparse.isspmatrix_csr(sparse_model.noisy_markov_matrix)
+    assert np.array_equal(sparse_model.noisy_markov_matrix.toarray(), dense_model.noisy_markov_matrix)
+
+
+def test_sparse_degree_distribution_matches_dense(make_carrier, walk_file):
+    generator1 = np.random.default_rng(4)
+    matrix = generator1.uniform(0, 1, (60, 60))
+    matrix[generator1.uniform(size=matrix.shape) < 0.9] = 0
+    # rows with no, one and two entries, rows with only ties, and a full row
+    matrix[:4] = 0
+    matrix[1, 3] = 1
+    matrix[2, [3, 7]] = [1, 0.1]
+    matrix[3, [3, 7]] = 2
+    matrix[4, :58] = generator1.uniform(0.5, 1, 58)
+    filter1 = Filter(make_carrier(walk_file))
+    filter1.real_state_number = 58
+    assert np.array_equal(filter1.degree_distribution_sensitivity(sparse.csr_matrix(matrix)),
+                          filter1.degree_distribution_sensitivity(matrix))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from tools.data_reader import DataReader
+
+
+def write_random_file(folder, trajectory_number=300):
+    generator1 = np.random.default_rng(1)
+    lines = []
+    for i in range(trajectory_number):
+        points = generator1.uniform(0, 50, (generator1.integers(0, 12), 2))
+        lines.append('#{}:\n>0:'.format(i) + ''.join('{:.3f},{:.3f};'.format(*point) for point in points) + '\n')
+    file_name = str(folder / 'trajectories.dat')
+    with open(file_name, 'w') as stream:
+        stream.write(''.join(lines))
+    return file_name
+
+
+@pytest.mark.parametrize('worker_number', [2, 5, 64])
+def test_parallel_reader_matches_line_by_line(tmp_path, worker_number):
+    file_name = write_random_file(tmp_path)
+    reader1 = DataReader(block_size=256, use_cache=False, worker_number=worker_number)
+    reference_list = reader1.read_tra_data_line_by_line(file_name)
+    trajectory_list = reader1.read_tra_data(file_name)
+    assert len(reference_list) == len(trajectory_list)
+    for reference, trajectory in zip(reference_list, trajectory_list):
+        assert np.array_equal(reference.reshape((-1, 2)), trajectory)
+
+
+def test_file_ranges_start_at_records(tmp_path):
+    file_name = write_random_file(tmp_path)
+    with open(file_name, 'rb') as stream:
+        content = stream.read()
+    byte_ranges = DataReader().split_file_at_records(file_name, 7)
+    assert byte_ranges[0][0] == 0 and byte_ranges[-1][1] == len(content)
+    for (_, end), (start, _) in zip(byte_ranges[:-1], byte_ranges[1:]):
+        assert end == start
+        assert content[start: start + 1] == b'#' and content[start - 1: start] == b'\n'
@@ -0,0 +1,84 @@
+import numpy as np
+
+from data_preparation.trajectory_chunks import TrajectoryChunks
+from discretization.get_discretization import DisData
+from primarkov.partial_statistics import PartialStatistics, ShardCounter, StatisticSums, merge_partial_statistics
+from test_streaming_pipeline import assert_same_models, run_in_chunks, run_in_memory
+
+
+# this function gives the grid of the first streaming pass and the sums of shard_number shards counted on it
+def count_in_shards(trajectory_file, make_carrier, shard_number):
+    cc = make_carrier(trajectory_file, streaming=True, chunk_size=500)
+    trajectory_chunks = TrajectoryChunks(cc, cc.chunk_size)
+    np.random.seed(0)
+    grid = DisData(cc).get_discrete_data_in_chunks(trajectory_chunks)
+    return grid, ShardCounter(shard_number).count(grid, trajectory_chunks)
+
+
+def test_one_shard_matches_in_memory_pipeline(trajectory_file, make_carrier):
+    reference_grid, reference_model = run_in_chunks(make_carrier(trajectory_file, streaming=True, chunk_size=700))
+    assert_same_models(run_in_memory(make_carrier(trajectory_file)), (reference_grid, reference_model))
+    grid, sums1 = count_in_shards(trajectory_file, make_carrier, 1)
+    all_state_number = grid.usable_state_number + 2
+    assert np.array_equal(sums1.give_sum('level2_density'), reference_grid.level2_real_density)
+    assert np.array_equal(sums1.give_transition_counter(all_state_number).give_markov_matrix().toarray(),
+                          reference_model.real_markov_matrix.toarray())
+    order2_counter = sums1.give_order2_counter(all_state_number)
+    assert np.array_equal(order2_counter.keys, reference_model.order2_counter.keys)
+    assert np.array_equal(order2_counter.values.view(np.uint16), reference_model.order2_counter.values.view(np.uint16))
+
+
+def test_sums_of_shards_are_close_to_one_shard(trajectory_file, make_carrier):
+    grid, reference = count_in_shards(trajectory_file, make_carrier, 1)
+    all_state_number = grid.usable_state_number + 2
+    _, sums1 = count_in_shards(trajectory_file, make_carrier, 3)
+    assert np.allclose(sums1.give_sum('level2_density'), reference.give_sum('level2_density'), rtol=1e-12, atol=0)
+    assert np.allclose(sums1.give_transition_counter(all_state_number).give_markov_matrix().toarray(),
+                       reference.give_transition_counter(all_state_number).give_markov_matrix().toarray(),
+                       rtol=1e-12, atol=0)
+    order2_counter = sums1.give_order2_counter(all_state_number)
+    reference_counter = reference.give_order2_counter(all_state_number)
+    assert np.array_equal(order2_counter.keys, reference_counter.keys)
+    # float16 values round at every addition, the shards start their sums from zero
+    assert np.allclose(order2_counter.values, reference_counter.values, rtol=1e-2, atol=0)
+
+
+def test_shard_files_grow_with_keys(trajectory_file, make_carrier):
+    cc = make_carrier(trajectory_file, streaming=True, chunk_size=500)
+    trajectory_chunks = TrajectoryChunks(cc, cc.chunk_size)
+    np.random.seed(0)
+    grid = DisData(cc).get_discrete_data_in_chunks(trajectory_chunks)
+    partial1 = PartialStatistics(0, trajectory_chunks.trajectory_number)
+    partial1.set_up_for_grid(grid)
+    for trajectory_set1 in trajectory_chunks:
+        partial1.add_trajectory_set(grid, trajectory_set1)
+    for name in partial1.sizes:
+        assert partial1.give_keys(name).size == np.unique(partial1.give_keys(name)).size
+        assert partial1.give_keys(name).size == partial1.give_values(name).size
+    assert partial1.give_keys('level2_density').size <= grid.subcell_number
+
+
+def test_statistic_sums_match_merged_shards(trajectory_file, make_carrier):
+    cc = make_carrier(trajectory_file, streaming=True, chunk_size=500)
+    trajectory_chunks = TrajectoryChunks(cc, cc.chunk_size)
+    np.random.seed(0)
+    grid = DisData(cc).get_discrete_data_in_chunks(trajectory_chunks)
+    partial_statistics_list = []
+    for start, end in ShardCounter(4).give_shard_ranges(trajectory_chunks.trajectory_number):
+        partial1 = PartialStatistics(start, end)
+        partial1.set_up_for_grid(grid)
+        for trajectory_set1 in trajectory_chunks.iterate_range(start, end):
+            partial1.add_trajectory_set(grid, trajectory_set1)
+        partial_statistics_list.append(partial1)
+    merged = merge_partial_statistics(partial_statistics_list[::-1])
+    sums1 = StatisticSums()
+    for partial1 in partial_statistics_list:
+        sums1.add_partial_statistics(partial1)
+    all_state_number = grid.usable_state_number + 2
+    assert np.array_equal(merged.give_sum('level2_density'), sums1.give_sum('level2_density'))
+    assert np.array_equal(merged.give_transition_counter(all_state_number).give_markov_matrix().toarray(),
+                          sums1.give_transition_counter(all_state_number).give_markov_matrix().toarray())
+    merged_order2 = merged.give_order2_counter(all_state_number)
+    order2_counter = sums1.give_order2_counter(all_state_number)
+    assert np.array_equal(merged_order2.keys, order2_counter.keys)
+    assert np.array_equal(merged_order2.values.view(np.uint16), order2_counter.values.view(np.uint16))
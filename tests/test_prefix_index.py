@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from data_preparation.trajectory import Trajectory
+from data_preparation.trajectory_set import TrajectorySet
+
+
+def give_set(sequences):
+    trajectory_set1 = TrajectorySet()
+    for sequence in sequences:
+        trajectory1 = Trajectory()
+        trajectory1.give_trajectory_list(np.zeros((len(sequence), 2)))
+        trajectory_set1.add_trajectory(trajectory1)
+    for trajectory1, sequence in zip(trajectory_set1.trajectory_list, sequences):
+        trajectory1.usable_simple_sequence = np.array(sequence, dtype=int)
+    return trajectory_set1
+
+
+def give_random_sequences(number: int, minimal_length: int):
+    generator1 = np.random.default_rng(7)
+    return [generator1.integers(0, 6, generator1.integers(minimal_length, 8)).tolist() for _ in range(number)]
+
+
+def assert_same_answer(reference, answer):
+    reference_tras, reference_states_tran, reference_end_weights = reference
+    tras, states_tran, end_weights = answer
+    assert [tr.tolist() for tr in reference_tras] == [tr.tolist() for tr in tras]
+    assert np.array_equal(reference_states_tran, states_tran)
+    assert reference_end_weights == end_weights
+
+
+@pytest.mark.parametrize('prefix', [[], [0], [3], [1, 2], [4, 4, 0]])
+def test_prefix_index_matches_scan(prefix):
+    # the original scan is only well defined if no sequence is shorter than the prefix
+    trajectory_set1 = give_set(give_random_sequences(300, len(prefix)))
+    prefix = np.array(prefix, dtype=int)
+    assert_same_answer(trajectory_set1.find_trajectories_with_given_prefix_by_scan(prefix),
+                       trajectory_set1.find_trajectories_with_given_prefix(prefix))
+
+
+def test_batched_queries_match_single_queries():
+    trajectory_set1 = give_set(give_random_sequences(300, 2))
+    prefix_list = [[0], [1, 2], [5, 5], [2]]
+    answers = trajectory_set1.find_trajectories_with_given_prefixes(prefix_list)
+    for prefix, answer in zip(prefix_list, answers):
+        assert_same_answer(trajectory_set1.find_trajectories_with_given_prefix(prefix), answer)
+
+
+def test_scan_counts_large_and_skips_negative_next_states():
+    sequences = [[1, 1200], [1, 1200, 3], [1, -1], [1], [], [2, 1, 5], [1, 1500]]
+    trajectory_set1 = give_set(sequences)
+    for prefix in [np.array([1]), np.array([1, 1200]), np.array([2, 1, 5, 0])]:
+        answer = trajectory_set1.find_trajectories_with_given_prefix(prefix)
+        assert_same_answer(trajectory_set1.find_trajectories_with_given_prefix_by_scan(prefix), answer)
+    _, states_tran, end_weights = trajectory_set1.find_trajectories_with_given_prefix(np.array([1]))
+    assert states_tran.size == 1501 and states_tran[1200] == 2 and states_tran[1500] == 1
+    assert np.sum(states_tran) == 3 and end_weights == 1
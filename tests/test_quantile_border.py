@@ -0,0 +1,67 @@
+import numpy as np
+
+from data_preparation.trajectory_chunks import TrajectoryChunks
+from discretization.grid import Grid
+from tests.conftest import read_trajectory_set
+
+
+# this function gives [x_min, y_min, x_max, y_max] of the points between the quantile and the 1 - quantile quantile of
+# every coordinate by sorting them
+def quantile_bounding_box_by_sorting(points, quantile):
+    low_rank = int(np.floor(quantile * (points.shape[0] - 1)))
+    high_rank = points.shape[0] - 1 - low_rank
+    x_sorted = np.sort(points[:, 0])
+    y_sorted = np.sort(points[:, 1])
+    return [x_sorted[low_rank], y_sorted[low_rank], x_sorted[high_rank], y_sorted[high_rank]]
+
+
+# this function is the outlier handling one trajectory after another, it gives the kept trajectories as point arrays
+def process_outliers_by_loop(trajectories, border, outlier_policy):
+    north, south, west, east = border
+    kept_trajectories = []
+    for points in trajectories:
+        outside = [not (west <= x <= east and south <= y <= north) for x, y in points]
+        if outlier_policy == 'clamp':
+            points = np.stack((np.clip(points[:, 0], west, east), np.clip(points[:, 1], south, north)), axis=1)
+        elif outlier_policy == 'drop_point':
+            points = points[~np.array(outside, dtype=bool)]
+        elif any(outside):
+            continue
+        if points.shape[0] > 0:
+            kept_trajectories.append(points)
+    return kept_trajectories
+
+
+def test_quantile_border_matches_sorting(trajectory_file, make_carrier):
+    trajectory_set1 = read_trajectory_set(trajectory_file)
+    for quantile in (0.01, 0.2):
+        grid = Grid(make_carrier(trajectory_file, border_quantile=quantile))
+        grid.border(trajectory_set1)
+        reference_grid = Grid(make_carrier(trajectory_file))
+        reference_grid.border_of_bounding_box(quantile_bounding_box_by_sorting(trajectory_set1.trajectory_array,
+                                                                               quantile))
+        assert np.array_equal(grid.get_border('all'), reference_grid.get_border('all'))
+
+
+def test_streamed_quantile_bounding_box_matches_sorting(trajectory_file, make_carrier):
+    points = read_trajectory_set(trajectory_file).trajectory_array
+    trajectory_chunks = TrajectoryChunks(make_carrier(trajectory_file), 900)
+    for quantile in (0, 0.01, 0.2, 0.49):
+        reference = quantile_bounding_box_by_sorting(points, quantile)
+        for bin_number in (1, 16, 65536):
+            assert trajectory_chunks.give_quantile_bounding_box(quantile, bin_number) == reference
+
+
+def test_outlier_policies_match_loop(trajectory_file, make_carrier):
+    for outlier_policy in ('clamp', 'drop_point', 'drop_trajectory'):
+        trajectory_set1 = read_trajectory_set(trajectory_file)
+        trajectories = [trajectory_set1.trajectory_array[start: end]
+                        for start, end in zip(trajectory_set1.offsets[:-1], trajectory_set1.offsets[1:])]
+        grid = Grid(make_carrier(trajectory_file, border_quantile=0.1, outlier_policy=outlier_policy))
+        grid.border(trajectory_set1)
+        grid.process_outliers(trajectory_set1)
+        reference = process_outliers_by_loop(trajectories, grid.get_border('all'), outlier_policy)
+        assert trajectory_set1.trajectory_number == len(reference)
+        assert not np.array_equal(trajectory_set1.trajectory_array, np.concatenate(trajectories))
+        assert np.array_equal(trajectory_set1.trajectory_array, np.concatenate(reference))
+        assert np.array_equal(np.diff(trajectory_set1.offsets), [points.shape[0] for points in reference])
@@ -0,0 +1,77 @@
+import copy
+
+import numpy as np
+from scipy.sparse import csgraph
+
+from discretization.get_discretization import DisData
+from tests.conftest import read_trajectory_set
+
+
+# this function takes states one by one, the densest state next to the taken ones, ties go to the lower index
+def densest_connected_states_by_loop(grid, usable_indicator, subcell_density, state_number):
+    candidates = np.flatnonzero(usable_indicator)
+    taken = [candidates[np.argmax(subcell_density[candidates])]]
+    while len(taken) < state_number:
+        frontier = sorted({neighbor for state in taken for neighbor in grid.subcell_neighbors(state)
+                           if usable_indicator[neighbor] and neighbor not in taken})
+        if not frontier:
+            break
+        taken.append(frontier[int(np.argmax(subcell_density[frontier]))])
+    taken_indicator = np.zeros(grid.subcell_number, dtype=bool)
+    taken_indicator[taken] = True
+    return taken_indicator
+
+
+# this function gives a copy of the grid with state pruning to max_state_number states
+def pruned_grid(grid, state_pruning, max_state_number):
+    grid = copy.copy(grid)
+    grid.cc = copy.copy(grid.cc)
+    grid.cc.state_pruning = state_pruning
+    grid.cc.max_state_number = max_state_number
+    grid.state_pruning()
+    grid.construct_usable_index_neighbors()
+    return grid
+
+
+def test_pruned_states_fill_the_budget_and_are_connected(discretized_walks):
+    for max_state_number in (10, 40, 80):
+        grid = pruned_grid(discretized_walks[0], 'drop', max_state_number)
+        assert grid.usable_state_number == max_state_number
+        component_number, _ = csgraph.connected_components(grid.usable_state_adjacency, directed=False)
+        assert component_number == 1
+
+
+def test_densest_connected_states_match_loop(discretized_walks):
+    grid = discretized_walks[0]
+    subcell_density = np.random.default_rng(2).integers(0, 5, grid.subcell_number).astype(float)
+    usable_indicator = grid.largest_connected_states(subcell_density > 0)
+    for state_number in (1, 15, 50):
+        reference = densest_connected_states_by_loop(grid, usable_indicator, subcell_density, state_number)
+        assert np.array_equal(grid.densest_connected_states(usable_indicator, subcell_density, state_number),
+                              reference)
+
+
+def test_points_of_dropped_states_move_to_nearest_kept_state(trajectory_file, make_carrier):
+    np.random.seed(0)
+    trajectory_set1 = read_trajectory_set(trajectory_file)
+    grid = DisData(make_carrier(trajectory_file, state_pruning='drop', max_state_number=40)).get_discrete_data(
+        trajectory_set1)
+    assert grid.usable_state_number == 40
+    points = trajectory_set1.trajectory_array
+    original_sequence = grid.calculate_index_array_by_point_array(points[:, 0], points[:, 1],
+                                                                  trajectory_set1.level1_cell_index_sequence)
+    borders = grid.level2_borders
+    central_points = np.stack(((borders[:, 0] + borders[:, 1]) / 2, (borders[:, 2] + borders[:, 3]) / 2), axis=1)
+    kept_subcells = grid.usable_subcell_index_to_real_index_dict
+    moved_sequence = trajectory_set1.level2_cell_index_sequence
+    kept = grid.real_subcell_index_to_usable_index_dict[original_sequence] >= 0
+    assert not kept.all()
+    assert np.array_equal(moved_sequence[kept], original_sequence[kept])
+    # several kept subcells can be nearest, any of them will do
+    for subcell, moved_subcell in set(zip(original_sequence[~kept].tolist(), moved_sequence[~kept].tolist())):
+        distances = np.sum((central_points[kept_subcells] - central_points[subcell]) ** 2, axis=1)
+        assert grid.real_subcell_index_to_usable_index_dict[moved_subcell] >= 0
+        assert np.isclose(np.sum((central_points[moved_subcell] - central_points[subcell]) ** 2), np.min(distances))
+    assert not trajectory_set1.has_not_usable_index.any()
+    real_density = np.bincount(moved_sequence, minlength=grid.subcell_number)
+    assert np.array_equal(grid.level2_real_density > 0, real_density > 0)
@@ -0,0 +1,51 @@
+import numpy as np
+from scipy import sparse
+
+from data_preparation.data_preparer import DataPreparer
+from data_preparation.trajectory_chunks import TrajectoryChunks
+from discretization.get_discretization import DisData
+from primarkov.build_markov_model import ModelBuilder
+
+
+def dense(matrix):
+    if sparse.issparse(matrix):
+        return matrix.toarray()
+    return np.asarray(matrix)
+
+
+def run_in_memory(cc):
+    np.random.seed(0)
+    trajectory_set1 = DataPreparer(vars(cc)).get_trajectory_set()
+    grid = DisData(cc).get_discrete_data(trajectory_set1)
+    builder1 = ModelBuilder(cc)
+    mo1 = builder1.filter_model(trajectory_set1, grid, builder1.build_model(grid, trajectory_set1))
+    return grid, mo1
+
+
+def run_in_chunks(cc):
+    np.random.seed(0)
+    trajectory_chunks = TrajectoryChunks(cc, cc.chunk_size)
+    grid = DisData(cc).get_discrete_data_in_chunks(trajectory_chunks)
+    builder1 = ModelBuilder(cc)
+    mo1 = builder1.filter_model(None, grid, builder1.build_model_in_chunks(grid, trajectory_chunks))
+    return grid, mo1
+
+
+def assert_same_models(reference, result):
+    reference_grid, reference_model = reference
+    grid, mo1 = result
+    for field_name in ['level1_grid_real_density', 'level1_grid_noisy_density', 'level2_borders',
+                       'level2_real_density']:
+        assert np.array_equal(getattr(reference_grid, field_name), getattr(grid, field_name))
+    for field_name in ['real_markov_matrix', 'noisy_markov_matrix']:
+        assert np.array_equal(dense(getattr(reference_model, field_name)), dense(getattr(mo1, field_name)))
+    assert np.array_equal(reference_model.guidepost_indices, mo1.guidepost_indices)
+    for reference_guidepost, guidepost in zip(reference_model.guidepost_set, mo1.guidepost_set):
+        assert np.array_equal(dense(reference_guidepost.order2_trans_matrix), dense(guidepost.order2_trans_matrix))
+
+
+def test_streaming_pipeline_matches_in_memory_pipeline(trajectory_file, make_carrier):
+    reference = run_in_memory(make_carrier(trajectory_file))
+    assert reference[0].usable_state_number > 50 and len(reference[1].guidepost_set) > 1
+    result = run_in_chunks(make_carrier(trajectory_file, streaming=True, chunk_size=700))
+    assert_same_models(reference, result)
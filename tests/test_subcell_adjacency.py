@@ -0,0 +1,72 @@
+import copy
+
+import numpy as np
+
+
+# this function is the neighbor rule of the original position lists. Subcells of a large cell are neighbors if they share
+# a side, subcells of adjacent large cells are neighbors if both are at the common side, and if overlap_only is set only
+# if their sides along it overlap
+def neighbors_by_loop(grid, overlap_only=False):
+    subdividing_parameter = grid.get_level2_parameter()
+    positions = grid.level2_index_position_dict
+    borders = grid.level2_borders
+    neighbor_sets = [set() for _ in range(grid.subcell_number)]
+    for subcell1 in range(grid.subcell_number):
+        large_cell1, x1, y1 = positions[subcell1]
+        large_x1, large_y1 = grid.level1_cell_position[large_cell1]
+        for subcell2 in range(grid.subcell_number):
+            large_cell2, x2, y2 = positions[subcell2]
+            large_x2, large_y2 = grid.level1_cell_position[large_cell2]
+            if large_cell1 == large_cell2:
+                if abs(x1 - x2) + abs(y1 - y2) == 1:
+                    neighbor_sets[subcell1].add(subcell2)
+                continue
+            if large_x2 == large_x1 + 1 and large_y2 == large_y1:
+                at_side = (x1 == subdividing_parameter[large_cell1] - 1) and (x2 == 0)
+                low, high = 1, 0
+            elif large_x2 == large_x1 - 1 and large_y2 == large_y1:
+                at_side = (x1 == 0) and (x2 == subdividing_parameter[large_cell2] - 1)
+                low, high = 1, 0
+            elif large_y2 == large_y1 + 1 and large_x2 == large_x1:
+                at_side = (y1 == subdividing_parameter[large_cell1] - 1) and (y2 == 0)
+                low, high = 2, 3
+            elif large_y2 == large_y1 - 1 and large_x2 == large_x1:
+                at_side = (y1 == 0) and (y2 == subdividing_parameter[large_cell2] - 1)
+                low, high = 2, 3
+            else:
+                continue
+            if at_side and overlap_only:
+                overlap = min(borders[subcell1, high], borders[subcell2, high]) \
+                    - max(borders[subcell1, low], borders[subcell2, low])
+                side = min(borders[subcell1, high] - borders[subcell1, low],
+                           borders[subcell2, high] - borders[subcell2, low])
+                at_side = overlap > 1e-9 * side
+            if at_side:
+                neighbor_sets[subcell1].add(subcell2)
+    return [sorted(neighbor_set) for neighbor_set in neighbor_sets]
+
+
+def test_subcell_adjacency_matches_loop(discretized_walks):
+    grid = discretized_walks[0]
+    reference = neighbors_by_loop(grid)
+    assert [grid.subcell_neighbors(subcell).tolist() for subcell in range(grid.subcell_number)] == reference
+
+
+def test_overlapping_subcell_adjacency_matches_loop(discretized_walks):
+    grid = copy.copy(discretized_walks[0])
+    grid.cc = copy.copy(grid.cc)
+    grid.cc.neighbor_edge_matching = 'overlap'
+    grid.give_subcells_neighbors()
+    reference = neighbors_by_loop(grid, overlap_only=True)
+    assert reference != neighbors_by_loop(grid)
+    assert [grid.subcell_neighbors(subcell).tolist() for subcell in range(grid.subcell_number)] == reference
+
+
+def test_usable_state_adjacency_matches_loop(discretized_walks):
+    grid = discretized_walks[0]
+    reference = neighbors_by_loop(grid)
+    usable_index_dict = grid.real_subcell_index_to_usable_index_dict
+    for usable_state, real_state in enumerate(grid.usable_subcell_index_to_real_index_dict):
+        neighbors = [usable_index_dict[neighbor] for neighbor in reference[real_state]
+                     if usable_index_dict[neighbor] >= 0]
+        assert grid.usable_state_neighbors(usable_state).tolist() == sorted(neighbors)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from tools.general_tools import GeneralTools
+
+
+# this function is the original rectangle query, a loop over all subcells with rec_overlap
+def states_within_border_by_loop(grid, border):
+    gt1 = GeneralTools()
+    return [state_index for state_index in range(grid.subcell_number)
+            if gt1.rec_overlap(grid.level2_borders[state_index, :], border)]
+
+
+# this function gives random rectangles [north, south, west, east] around the grid, borders of subcells among them
+def random_borders(grid, number):
+    generator1 = np.random.default_rng(5)
+    x_bins = grid.get_x_divide_bins()
+    y_bins = grid.get_y_divide_bins()
+    ys = generator1.uniform(y_bins[0] - 1, y_bins[-1] + 1, (number, 2))
+    xs = generator1.uniform(x_bins[0] - 1, x_bins[-1] + 1, (number, 2))
+    small = generator1.uniform(0, 0.2, (number, 2))
+    borders = [np.stack((ys.max(axis=1), ys.min(axis=1), xs.min(axis=1), xs.max(axis=1)), axis=1),
+               np.stack((ys[:, 0] + small[:, 0], ys[:, 0], xs[:, 0], xs[:, 0] + small[:, 1]), axis=1),
+               grid.level2_borders[generator1.integers(0, grid.subcell_number, number)]]
+    return np.concatenate(borders)
+
+
+def test_rectangle_queries_match_loop(discretized_walks):
+    grid = discretized_walks[0]
+    borders = random_borders(grid, 100)
+    subcells, offsets = grid.find_states_within_given_borders(borders)
+    for border_index, border in enumerate(borders):
+        reference = states_within_border_by_loop(grid, border)
+        assert grid.find_state_within_given_border(border) == reference
+        assert subcells[offsets[border_index]: offsets[border_index + 1]].tolist() == reference
+
+
+def test_point_queries_match_set_sequence(discretized_walks):
+    grid, trajectory_set1 = discretized_walks
+    points = trajectory_set1.trajectory_array[:, :2]
+    assert np.array_equal(grid.find_states_of_points(points), trajectory_set1.level2_cell_index_sequence)
+    outside = np.array([[grid.get_x_divide_bins()[0] - 1, 5], [5, grid.get_y_divide_bins()[-1] + 1]])
+    assert grid.find_states_of_points(outside).tolist() == [-1, -1]
@@ -0,0 +1,69 @@
+import numpy as np
+
+from tools.general_tools import GeneralTools
+
+
+# this function is the original level1 table loop, cells are numbered column by column
+def level1_tables_by_loop(grid):
+    x_divide_bins = grid.get_x_divide_bins()
+    y_divide_bins = grid.get_y_divide_bins()
+    borders = []
+    positions = []
+    for x_index in range(x_divide_bins.size - 1):
+        for y_index in range(y_divide_bins.size - 1):
+            borders.append([y_divide_bins[y_index + 1], y_divide_bins[y_index], x_divide_bins[x_index],
+                            x_divide_bins[x_index + 1]])
+            positions.append([x_index, y_index])
+    return np.array(borders), np.array(positions)
+
+
+# this function is the original subdividing loop, one subcell after another through the subdividing bins
+def level2_tables_by_loop(grid):
+    subdividing_parameter = grid.get_level2_parameter()
+    borders = []
+    positions = []
+    for large_cell_index in range(subdividing_parameter.size):
+        this_cell_x_bin = grid.level2_x_bin_dict[large_cell_index]
+        this_cell_y_bin = grid.level2_y_bin_dict[large_cell_index]
+        for x_index in range(int(subdividing_parameter[large_cell_index])):
+            for y_index in range(int(subdividing_parameter[large_cell_index])):
+                borders.append([this_cell_y_bin[y_index + 1], this_cell_y_bin[y_index], this_cell_x_bin[x_index],
+                                this_cell_x_bin[x_index + 1]])
+                positions.append([large_cell_index, x_index, y_index])
+    return np.array(borders), np.array(positions)
+
+
+def test_level1_tables_match_loop(discretized_walks):
+    grid = discretized_walks[0]
+    borders, positions = level1_tables_by_loop(grid)
+    assert np.array_equal(borders, grid.get_level1_index_border_dict())
+    assert np.array_equal(positions, grid.get_level1_index_position_dict())
+    assert grid.level1_position_index_dictionary() == {tuple(position): index
+                                                       for index, position in enumerate(positions.tolist())}
+
+
+def test_level2_tables_match_loop(discretized_walks):
+    grid = discretized_walks[0]
+    borders, positions = level2_tables_by_loop(grid)
+    assert (grid.get_level2_parameter() > 1).any()
+    assert np.array_equal(borders, grid.level2_borders)
+    assert np.array_equal(positions, grid.level2_index_position_dict)
+    assert grid.level2_position_index_dict == {tuple(position): index
+                                               for index, position in enumerate(positions.tolist())}
+    assert np.array_equal(positions[:, 0], grid.level2_subcell_to_large_cell_dict)
+    assert grid.subcell_number == positions.shape[0]
+
+
+def test_usable_state_tables_match_loop(discretized_walks):
+    grid = discretized_walks[0]
+    real_index_dict = grid.usable_subcell_index_to_real_index_dict
+    central_points = np.array([[(grid.level2_borders[real_index, 0] + grid.level2_borders[real_index, 1]) / 2,
+                                (grid.level2_borders[real_index, 2] + grid.level2_borders[real_index, 3]) / 2]
+                               for real_index in real_index_dict]).reshape(-1, 2)
+    assert np.array_equal(central_points, grid.usable_state_central_points())
+    usable_index_dict = grid.real_subcell_index_to_usable_index_dict
+    inverse_dict = np.zeros(real_index_dict.size, dtype=int)
+    for real_index in range(usable_index_dict.size):
+        if usable_index_dict[real_index] >= 0:
+            inverse_dict[usable_index_dict[real_index]] = real_index
+    assert np.array_equal(inverse_dict, GeneralTools().inverse_index_dict(real_index_dict.size, usable_index_dict))
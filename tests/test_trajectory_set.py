@@ -0,0 +1,82 @@
+import numpy as np
+
+from data_preparation.trajectory import Trajectory
+from data_preparation.trajectory_set import TrajectorySet
+
+
+LEVEL2_SEQUENCES = [np.array([3, 3, 1, 1, 1, 4]), np.array([0]), np.array([2, 5, 5, 2])]
+USABLE_DICT = np.array([0, 1, -1, 2, 3, 4])
+
+
+def give_trajectories():
+    trajectory_list = []
+    for level2_sequence in LEVEL2_SEQUENCES:
+        trajectory1 = Trajectory()
+        trajectory1.give_trajectory_list(np.arange(level2_sequence.size * 2, dtype=float).reshape((-1, 2)))
+        trajectory1.level2_cell_index_sequence = level2_sequence
+        trajectory_list.append(trajectory1)
+    return trajectory_list
+
+
+def give_set():
+    trajectory_set1 = TrajectorySet()
+    for trajectory1 in give_trajectories():
+        trajectory_set1.add_trajectory(trajectory1)
+    return trajectory_set1
+
+
+def test_simple_trajectories_of_set_match_single_trajectories():
+    trajectory_set1 = give_set()
+    trajectory_set1.get_simple_trajectory(USABLE_DICT)
+    for trajectory1, view in zip(give_trajectories(), trajectory_set1.trajectory_list):
+        trajectory1.give_simple_trajectory(USABLE_DICT)
+        assert np.array_equal(trajectory1.cell_sequence, view.cell_sequence)
+        assert np.array_equal(trajectory1.cell_sequence_frequency, view.cell_sequence_frequency)
+        assert np.array_equal(trajectory1.usable_simple_sequence, view.usable_simple_sequence)
+
+
+def test_simple_trajectories_written_one_by_one_match_whole_set():
+    whole_set = give_set()
+    whole_set.get_simple_trajectory(USABLE_DICT)
+    trajectory_set1 = give_set()
+    for view in trajectory_set1.trajectory_list:
+        view.give_simple_trajectory(USABLE_DICT)
+        assert np.array_equal(view.usable_simple_sequence, USABLE_DICT[view.cell_sequence])
+    assert trajectory_set1.simple_writes
+    for field_name in ['simple_offsets', 'cell_sequence', 'cell_sequence_frequency', 'usable_simple_sequence']:
+        assert np.array_equal(getattr(whole_set, field_name), getattr(trajectory_set1, field_name))
+    assert not trajectory_set1.simple_writes
+
+
+def test_buffered_simple_field_of_another_size_resets_other_fields():
+    trajectory_set1 = give_set()
+    trajectory_set1.get_simple_trajectory(USABLE_DICT)
+    view = trajectory_set1.trajectory_list[0]
+    view.cell_sequence = np.array([7, 8])
+    assert view.cell_sequence_frequency.tolist() == [-1, -1]
+    view.cell_sequence_frequency[:] = [2, 4]
+    assert trajectory_set1.cell_sequence.tolist()[:2] == [7, 8]
+    assert trajectory_set1.cell_sequence_frequency.tolist()[:2] == [2, 4]
+    assert trajectory_set1.usable_simple_sequence.tolist()[:2] == [-1, -1]
+    assert trajectory_set1.simple_offsets.tolist() == [0, 2, 3, 6]
+
+
+def test_field_defaults_are_not_shared():
+    trajectory_set1 = give_set()
+    first, second = trajectory_set1.trajectory_list[:2]
+    assert first.cell_sequence is not second.cell_sequence
+    assert first.usable_sequence is not second.usable_sequence
+    assert first.usable_sequence.size == 0
+
+
+def test_point_field_of_missing_trajectories_stays_empty():
+    trajectory_set1 = give_set()
+    usable_index = USABLE_DICT[trajectory_set1.level2_cell_index_sequence]
+    missing_indicator = np.array([False, False, True])
+    trajectory_set1.give_point_field('usable_sequence', usable_index, missing_indicator)
+    trajectory_list = trajectory_set1.trajectory_list
+    assert np.array_equal(trajectory_list[0].usable_sequence, USABLE_DICT[LEVEL2_SEQUENCES[0]])
+    assert trajectory_list[2].usable_sequence.size == 0
+    trajectory_set1.add_trajectory(give_trajectories()[1])
+    assert trajectory_set1.trajectory_list[3].usable_sequence.size == 0
+    assert np.array_equal(trajectory_list[1].usable_sequence, USABLE_DICT[LEVEL2_SEQUENCES[1]])
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+import config.folder_and_file_names as config
+from tools.data_reader import DataReader
+from tools.trajectory_store import TrajectoryStore
+
+
+TRAJECTORY_TEXT = '#0:\n>0:5.7,5.2;5.1,5.0;\n#1:\n>0:\n#2:\n>0:-1.5,2.25;3,4;8,9.125;\n'
+
+
+def write_dataset(folder, text, file_n='trajectories.dat'):
+    data_folder = folder / config.trajectory_data_folder
+    data_folder.mkdir(exist_ok=True)
+    (data_folder / file_n).write_bytes(text.encode())
+    return file_n
+
+
+def assert_matches_line_by_line(file_name, points, offsets):
+    reference_list = DataReader().read_tra_data_line_by_line(file_name)
+    assert offsets.size == len(reference_list) + 1
+    for i, reference in enumerate(reference_list):
+        assert np.array_equal(reference.reshape((-1, 2)), points[offsets[i]: offsets[i + 1]])
+
+
+def test_cached_store_matches_line_by_line(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    file_n = write_dataset(tmp_path, TRAJECTORY_TEXT)
+    file_name = os.path.join('.', config.trajectory_data_folder, file_n)
+    reader1 = DataReader(block_size=16)
+    points, offsets = reader1.read_trajectory_points_from_data_file(file_n)
+    assert isinstance(points, np.memmap)
+    assert_matches_line_by_line(file_name, points, offsets)
+    cache_name = reader1.give_cache_name(file_name)
+    assert TrajectoryStore().read_store_info(cache_name)['bounding_box'] == [-1.5, 2.25, 8.0, 9.125]
+
+
+def test_cached_store_is_rebuilt_after_source_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    file_n = write_dataset(tmp_path, TRAJECTORY_TEXT)
+    file_name = os.path.join('.', config.trajectory_data_folder, file_n)
+    reader1 = DataReader()
+    reader1.read_trajectory_points_from_data_file(file_n)
+    write_dataset(tmp_path, TRAJECTORY_TEXT + '#3:\n>0:1,2;\n')
+    points, offsets = reader1.read_trajectory_points_from_data_file(file_n)
+    assert_matches_line_by_line(file_name, points, offsets)
+
+
+def test_block_store_matches_in_memory_store(tmp_path):
+    points = np.arange(14, dtype=np.float64).reshape((-1, 2))
+    point_numbers = np.array([2, 0, 4, 1])
+    offsets = np.concatenate(([0], np.cumsum(point_numbers)))
+    store1 = TrajectoryStore()
+    store1.write_store(str(tmp_path / 'whole'), points, offsets)
+    blocks = [(points[:2], point_numbers[:2]), (points[2:], point_numbers[2:])]
+    store1.write_store_from_blocks(str(tmp_path / 'blocks'), blocks)
+    whole_points, whole_offsets, whole_info = store1.read_store(str(tmp_path / 'whole'))
+    block_points, block_offsets, block_info = store1.read_store(str(tmp_path / 'blocks'))
+    assert np.array_equal(whole_points, block_points)
+    assert np.array_equal(whole_offsets, block_offsets)
+    assert whole_info == block_info
@@ -0,0 +1,49 @@
+import numpy as np
+
+from data_preparation.trajectory_chunks import TrajectoryChunks
+from discretization.get_discretization import DisData
+from primarkov.transition_counter import TransitionCounter
+
+
+# this function is the original matrix of one trajectory, its transitions divided by its transition number
+def trajectory_markov_probability(trajectory1, state_number):
+    trajectory_array = trajectory1.usable_simple_sequence
+    markov_matrix = np.zeros((state_number, state_number))
+    for markov_transform_start in range(trajectory_array.size - 1):
+        markov_matrix[trajectory_array[markov_transform_start], trajectory_array[markov_transform_start + 1]] += 1
+    markov_matrix[state_number - 2, trajectory_array[0]] = 1
+    markov_matrix[trajectory_array[-1], state_number - 1] = 1
+    return markov_matrix / max(trajectory_array.size + 1, 1)
+
+
+# this function is the original sum of the dense matrices of all usable trajectories, added to markov_matrix
+def add_markov_matrices_of_trajectories(markov_matrix, trajectory_list, state_number):
+    for trajectory1 in trajectory_list:
+        if not trajectory1.has_not_usable_index:
+            markov_matrix += trajectory_markov_probability(trajectory1, state_number)
+    return markov_matrix
+
+
+def test_transition_counts_match_dense_matrices(discretized_walks):
+    grid, trajectory_set1 = discretized_walks
+    state_number = grid.usable_state_number + 2
+    reference = add_markov_matrices_of_trajectories(np.zeros((state_number, state_number)),
+                                                    trajectory_set1.trajectory_list, state_number)
+    transition_counter = TransitionCounter(state_number)
+    transition_counter.add_trajectory_set(trajectory_set1)
+    assert np.array_equal(transition_counter.give_markov_matrix().toarray(), reference)
+
+
+def test_chunked_transition_counts_match_dense_matrices(trajectory_file, make_carrier):
+    cc = make_carrier(trajectory_file, streaming=True, state_pruning='drop', max_state_number=40)
+    np.random.seed(0)
+    trajectory_chunks = TrajectoryChunks(cc, 700)
+    grid = DisData(cc).get_discrete_data_in_chunks(trajectory_chunks)
+    state_number = grid.usable_state_number + 2
+    transition_counter = TransitionCounter(state_number)
+    reference = np.zeros((state_number, state_number))
+    for trajectory_set1 in trajectory_chunks:
+        grid.discretize_chunk(trajectory_set1)
+        transition_counter.add_trajectory_set(trajectory_set1)
+        reference = add_markov_matrices_of_trajectories(reference, trajectory_set1.trajectory_list, state_number)
+    assert np.array_equal(transition_counter.give_markov_matrix().toarray(), reference)
@@ -1,22 +1,123 @@
+import bz2
+import gzip
+import hashlib
+import logging
+import lzma
+import multiprocessing
 import os
 import re
+import warnings
 
 import config.folder_and_file_names as config
 import numpy as np
 
+from tools.trajectory_store import TrajectoryStore
+
+log = logging.getLogger(__name__)
+
+# every separator of coordinates ('[,|;*]+' in the line by line reader) is translated to this one
+COORDINATE_SEPARATOR = b';'
+SEPARATOR_TRANSLATION = bytes.maketrans(b',|*', COORDINATE_SEPARATOR * 3)
+SEPARATOR_RUN = re.compile(COORDINATE_SEPARATOR + b'{2,}')
+DATA_LINE_SIGN = b'>'
+# a data line starts with '>0:', coordinates follow after these three characters
+DATA_LINE_PREFIX_LENGTH = 3
+# every trajectory record starts with a line '#i:'
+RECORD_START = b'\n#'
+# bytes of coordinates that are converted as plain decimal numbers, see DataReader.convert_decimal_coordinates
+DECIMAL_BYTES = b'0123456789.+-' + COORDINATE_SEPARATOR
+# 10 ** i is exact for these i, and so is every integer with at most as many digits
+DECIMAL_POWERS = 10.0 ** np.arange(16)
+# compressed trajectory files are recognised by the first bytes and read as stream with these openers
+COMPRESSION_OPENERS = [
+    (b'\x1f\x8b', gzip.open),
+    (b'BZh', bz2.open),
+    (b'\xfd7zXZ\x00', lzma.open),
+]
+
 
 class DataReader:
 
-    def __init__(self):
-        pass
+    def __init__(self, block_size: int = 16 * 1024 * 1024, use_cache: bool = True, worker_number: int = 1):
+        # size in bytes of the blocks read from a trajectory file at once
+        self.block_size = block_size
+        # whether parsed trajectory files are kept as binary stores in config.trajectory_cache_folder
+        self.use_cache = use_cache
+        # number of processes parsing a trajectory file, every process parses one byte range of the file
+        self.worker_number = worker_number
 
     def read_trajectories_from_data_file(self, file_n):
-        file_name = os.path.join('.', config.trajectory_data_folder, file_n)
-        trajectory_list = self.read_tra_data(file_name)
+        points, offsets = self.read_trajectory_points_from_data_file(file_n)
+        trajectory_list = self.split_points_by_offsets(points, offsets)
         return trajectory_list
 
-    #
+    # this function gives the points of all trajectories of a data file and the offsets of the trajectories
+    def read_trajectory_points_from_data_file(self, file_n):
+        file_name = os.path.join('.', config.trajectory_data_folder, file_n)
+        if self.use_cache:
+            cache_name = self.give_cache_name(file_name)
+            points, offsets = self.read_tra_data_cached(file_name, cache_name)
+        else:
+            points, offsets = self.read_tra_data_in_bulk(file_name)
+        return points, offsets
+
+    # this function opens the binary store of a data file, converting the file into the cache folder if needed. It
+    # gives read only memory maps of points and offsets and the sidecar, the file is never held in memory as a whole.
+    # A data file name that is a store itself (see DataWriter.save_trajectories) is opened directly.
+    def open_trajectory_store(self, file_n):
+        file_name = os.path.join('.', config.trajectory_data_folder, file_n)
+        store1 = TrajectoryStore()
+        if store1.read_store_info(file_name) is not None:
+            return store1.read_store(file_name)
+        cache_name = self.give_cache_name(file_name)
+        if not store1.is_store_of(cache_name, file_name):
+            self.convert_data_file(file_name, cache_name)
+        return store1.read_store(cache_name)
+
+    # this function gives the store name of a trajectory file in the cache folder. The absolute path of the file is
+    # hashed into the name, so files with the same name in different folders do not share a store.
+    def give_cache_name(self, file_name):
+        path_hash = hashlib.md5(os.path.abspath(file_name).encode()).hexdigest()[:12]
+        store_file_n = '{}.{}'.format(os.path.basename(file_name), path_hash)
+        return os.path.join('.', config.trajectory_data_folder, config.trajectory_cache_folder, store_file_n)
+
+    # this function reads a trajectory file through a binary store. The store is rebuilt if size or modification time
+    # of the file changed. The points are a read only memory map shared by all processes reading the same file.
+    def read_tra_data_cached(self, file_name, cache_name):
+        store1 = TrajectoryStore()
+        if not store1.is_store_of(cache_name, file_name):
+            try:
+                self.convert_data_file(file_name, cache_name)
+            except OSError as error:
+                log.warning('Could not cache {} as {}: {}'.format(file_name, cache_name, error))
+                return self.read_tra_data_in_bulk(file_name)
+        try:
+            points, offsets, _ = store1.read_store(cache_name)
+        except (OSError, ValueError) as error:
+            log.warning('Could not open cached {}: {}'.format(cache_name, error))
+            return self.read_tra_data_in_bulk(file_name)
+        return points, offsets
+
+    # this function converts a trajectory file into a binary store, see TrajectoryStore. Unless the file is parsed by
+    # several processes, it is converted block by block and never held in memory as a whole.
+    def convert_data_file(self, file_name, store_name):
+        store1 = TrajectoryStore()
+        file_opener = self.give_file_opener(file_name)
+        if self.worker_number > 1 and file_opener is open:
+            points, offsets = self.read_tra_data_in_parallel(file_name, self.worker_number)
+            return store1.write_store(store_name, points, offsets, source_file_name=file_name)
+        with file_opener(file_name, 'rb') as stream:
+            return store1.write_store_from_blocks(store_name, self.iterate_tra_blocks(stream),
+                                                  source_file_name=file_name)
+
+    # this function reads a trajectory file into a list of point arrays. All arrays are views into one point buffer.
     def read_tra_data(self, file_name):
+        points, offsets = self.read_tra_data_in_bulk(file_name)
+        trajectory_list = self.split_points_by_offsets(points, offsets)
+        return trajectory_list
+
+    # this function is the original line by line reader, it is kept as reference for the bulk reader
+    def read_tra_data_line_by_line(self, file_name):
         trajectory_list = []
         f = open(file_name, 'r')
         for line in f.readlines():
@@ -28,3 +129,215 @@ class DataReader:
                 trajectory_list.append(trajectory_array)
         f.close()
         return trajectory_list
+
+    # this function reads a trajectory file in large blocks. It gives a (point_number, 2) array with points of all
+    # trajectories and an int64 offsets array, points of trajectory i are points[offsets[i]: offsets[i + 1]]
+    # Files compressed with gzip, bz2 or xz are decompressed block by block while they are parsed.
+    def read_tra_data_in_bulk(self, file_name):
+        file_opener = self.give_file_opener(file_name)
+        if self.worker_number > 1 and file_opener is open:
+            return self.read_tra_data_in_parallel(file_name, self.worker_number)
+        with file_opener(file_name, 'rb') as stream:
+            points, offsets = self.read_tra_stream(stream)
+        return points, offsets
+
+    # this function gives the function opening a trajectory file, open for an uncompressed file
+    def give_file_opener(self, file_name):
+        with open(file_name, 'rb') as stream:
+            file_start = stream.read(8)
+        for magic_bytes, file_opener in COMPRESSION_OPENERS:
+            if file_start.startswith(magic_bytes):
+                return file_opener
+        return open
+
+    # this function splits a trajectory file into byte ranges at record boundaries and parses every range in its own
+    # process. The results are concatenated in file order, so trajectory order and indices are unchanged.
+    def read_tra_data_in_parallel(self, file_name, worker_number: int):
+        byte_ranges = self.split_file_at_records(file_name, worker_number)
+        tasks = [(file_name, start, end, self.block_size) for start, end in byte_ranges]
+        if len(tasks) > 1:
+            with multiprocessing.Pool(min(worker_number, len(tasks))) as pool:
+                range_results = pool.starmap(parse_tra_file_range, tasks)
+        else:
+            range_results = [parse_tra_file_range(*task) for task in tasks]
+        point_blocks = [points for points, _ in range_results]
+        length_blocks = [point_numbers for _, point_numbers in range_results]
+        return self.bond_tra_blocks(point_blocks, length_blocks)
+
+    # this function gives about range_number (start, end) byte ranges covering the file. Every range except the first
+    # starts with a record line '#i:'.
+    def split_file_at_records(self, file_name, range_number: int) -> list:
+        file_size = os.path.getsize(file_name)
+        boundaries = [0]
+        with open(file_name, 'rb') as stream:
+            for i in range(1, range_number):
+                position = max(file_size * i // range_number, boundaries[-1])
+                record_start = self.find_record_start(stream, position)
+                if record_start >= file_size:
+                    break
+                if record_start > boundaries[-1]:
+                    boundaries.append(record_start)
+        boundaries.append(file_size)
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    # this function gives the position of the first record line starting at or after position, or the end of the file
+    def find_record_start(self, stream, position: int) -> int:
+        search_size = 64 * 1024
+        block_start = max(position - 1, 0)
+        while True:
+            stream.seek(block_start)
+            block = stream.read(search_size)
+            found = block.find(RECORD_START)
+            if found >= 0:
+                return block_start + found + 1
+            if len(block) < search_size:
+                return block_start + len(block)
+            block_start += len(block) - 1
+
+    # this function parses the bytes start, ..., end - 1 of a trajectory file that form complete records
+    def read_tra_range(self, file_name, start: int, end: int):
+        point_blocks = []
+        length_blocks = []
+        with open(file_name, 'rb') as stream:
+            stream.seek(start)
+            for block in self.iterate_line_blocks(stream, end - start):
+                points, point_numbers = self.parse_tra_block(block)
+                point_blocks.append(points)
+                length_blocks.append(point_numbers)
+        points, offsets = self.bond_tra_blocks(point_blocks, length_blocks)
+        return points, np.diff(offsets)
+
+    # this function reads all trajectories from a binary stream
+    def read_tra_stream(self, stream):
+        point_blocks = []
+        length_blocks = []
+        for points, point_numbers in self.iterate_tra_blocks(stream):
+            point_blocks.append(points)
+            length_blocks.append(point_numbers)
+        return self.bond_tra_blocks(point_blocks, length_blocks)
+
+    # this function yields (points, point number of every trajectory) for every block of a binary stream
+    def iterate_tra_blocks(self, stream):
+        for block in self.iterate_line_blocks(stream):
+            yield self.parse_tra_block(block)
+
+    # this function yields blocks of about block_size bytes that only contain complete lines. If byte_number is not
+    # negative, only that many bytes are read from the stream.
+    def iterate_line_blocks(self, stream, byte_number: int = -1):
+        remainder = b''
+        while byte_number != 0:
+            read_size = self.block_size if byte_number < 0 else min(self.block_size, byte_number)
+            chunk = stream.read(read_size)
+            if not chunk:
+                break
+            if byte_number > 0:
+                byte_number -= len(chunk)
+            block = remainder + chunk
+            cut_position = block.rfind(b'\n') + 1
+            if cut_position == 0:
+                remainder = block
+            else:
+                remainder = block[cut_position:]
+                yield block[:cut_position]
+        if remainder:
+            yield remainder
+
+    # this function concatenates points of many blocks and gives offsets of every trajectory
+    def bond_tra_blocks(self, point_blocks: list, length_blocks: list):
+        if point_blocks:
+            points = np.concatenate(point_blocks)
+            point_numbers = np.concatenate(length_blocks)
+        else:
+            points = np.empty((0, 2))
+            point_numbers = np.array([], dtype=np.int64)
+        offsets = np.zeros(point_numbers.size + 1, dtype=np.int64)
+        np.cumsum(point_numbers, out=offsets[1:])
+        return points, offsets
+
+    # this function splits a point buffer into a list of trajectory arrays, every array is a view
+    def split_points_by_offsets(self, points: np.ndarray, offsets: np.ndarray) -> list:
+        points = np.asarray(points)
+        bounds = np.asarray(offsets).tolist()
+        return [points[bounds[i]: bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+    # this function parses a block of complete lines. Only lines starting with '>' hold data. The three characters
+    # '>0:' are skipped, the rest is split at runs of separators and whatever follows the last separator is dropped,
+    # exactly like the line by line reader. Separators are unified, data lines and their coordinates are found by
+    # searches over the byte positions of the block without a loop over lines, and all coordinates of the block are
+    # converted by one np.fromstring call. It gives the points and the point number of every data line.
+    def parse_tra_block(self, block: bytes):
+        block = block.translate(SEPARATOR_TRANSLATION)
+        if COORDINATE_SEPARATOR * 2 in block:
+            block = SEPARATOR_RUN.sub(COORDINATE_SEPARATOR, block)
+        block_bytes = np.frombuffer(block, dtype=np.uint8)
+        line_ends = np.flatnonzero(block_bytes == ord(b'\n'))
+        line_starts = np.concatenate(([0], line_ends + 1))
+        line_ends = np.append(line_ends, block_bytes.size)
+        is_data_line = line_starts < block_bytes.size
+        is_data_line[is_data_line] = block_bytes[line_starts[is_data_line]] == ord(DATA_LINE_SIGN)
+        coordinate_starts = line_starts[is_data_line] + DATA_LINE_PREFIX_LENGTH
+        separators = np.flatnonzero(block_bytes == ord(COORDINATE_SEPARATOR))
+        # the coordinates of data line i end at separators[first_separators[i]: last_separators[i] + 1]
+        first_separators = np.searchsorted(separators, coordinate_starts)
+        last_separators = np.searchsorted(separators, line_ends[is_data_line]) - 1
+        has_values = last_separators >= first_separators
+        if (separators[first_separators[has_values]] == coordinate_starts[has_values]).any():
+            raise ValueError('could not convert an empty coordinate to float')
+        value_numbers = np.where(has_values, last_separators - first_separators + 1, 0)
+        if (value_numbers % 2 != 0).any():
+            raise ValueError('a trajectory has an odd number of coordinates')
+        value_number = int(np.sum(value_numbers))
+        if value_number == 0:
+            return np.empty((0, 2)), value_numbers // 2
+        # coordinates of all data lines, every line part ends with its last separator
+        part_bounds = np.zeros(block_bytes.size + 1, dtype=np.int8)
+        part_bounds[coordinate_starts[has_values]] = 1
+        part_bounds[separators[last_separators[has_values]] + 1] = -1
+        coordinate_bytes = block_bytes[np.cumsum(part_bounds[:-1], dtype=np.int8) > 0].tobytes()
+        values = self.convert_decimal_coordinates(coordinate_bytes, value_number)
+        if values is None:
+            values = self.convert_coordinates(coordinate_bytes, np.float64)
+        if values is None or values.size != value_number:
+            raise ValueError('could not convert a coordinate to float')
+        return values.reshape((-1, 2)), value_numbers // 2
+
+    # this function converts coordinates 'c;c;...;c;' of the form [+-]digits[.digits] with at most 15 characters. The
+    # digits without the dot are read as integer m below 2 ** 53 and m / 10 ** decimals is the correctly rounded value,
+    # the same float gives. It gives None if a coordinate has another form.
+    def convert_decimal_coordinates(self, coordinate_bytes: bytes, value_number: int):
+        if coordinate_bytes.translate(None, DECIMAL_BYTES):
+            return None
+        coordinate_array = np.frombuffer(coordinate_bytes, dtype=np.uint8)
+        value_ends = np.flatnonzero(coordinate_array == ord(COORDINATE_SEPARATOR))
+        value_starts = np.append(0, value_ends[:-1] + 1)
+        if value_ends.size != value_number or (value_ends - value_starts > DECIMAL_POWERS.size - 1).any():
+            return None
+        dots = np.flatnonzero(coordinate_array == ord(b'.'))
+        if dots.size == value_number and (dots >= value_starts).all() and (dots < value_ends).all():
+            # every coordinate has a dot
+            dot_values = np.arange(value_number)
+        else:
+            dot_values = np.searchsorted(value_ends, dots)
+            if (np.diff(dot_values) == 0).any():
+                return None
+        mantissas = self.convert_coordinates(coordinate_bytes.replace(b'.', b''), np.int64)
+        if mantissas is None or mantissas.size != value_number:
+            return None
+        decimals = np.zeros(value_number, dtype=np.int64)
+        decimals[dot_values] = value_ends[dot_values] - dots - 1
+        values = mantissas / DECIMAL_POWERS[decimals]
+        values[(mantissas == 0) & (coordinate_array[value_starts] == ord(b'-'))] = -0.0
+        return values
+
+    # this function converts coordinates 'c;c;...;c;' by one np.fromstring call. It stops at a coordinate it cannot
+    # convert, so fewer values than coordinates are given then.
+    def convert_coordinates(self, coordinate_bytes: bytes, dtype):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            return np.fromstring(coordinate_bytes[:-1], dtype=dtype, sep=COORDINATE_SEPARATOR.decode())
+
+
+# this function is the task of a reader process, see DataReader.read_tra_data_in_parallel
+def parse_tra_file_range(file_name, start: int, end: int, block_size: int):
+    reader = DataReader(block_size=block_size, use_cache=False)
+    return reader.read_tra_range(file_name, start, end)
@@ -0,0 +1,153 @@
+"""Streaming subsampling of trajectory files and splitting into folds."""
+import os
+from argparse import ArgumentParser
+
+import numpy as np
+
+import config.folder_and_file_names as config
+from tools.data_reader import DataReader
+from tools.data_writer import DataWriter
+
+# constants of the splitmix64 finaliser used to hash trajectory numbers into folds
+HASH_INCREMENT = np.uint64(0x9E3779B97F4A7C15)
+HASH_MULTIPLIERS = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+
+
+# This class makes one pass over a trajectory file. It keeps a uniform random sample of sample_size trajectories
+# (reservoir sampling, algorithm R) and splits the sample into fold_number folds by a hash of the trajectory number.
+# Only the sample and one block of the file are held in memory. With sample_size < 0 every trajectory is kept and
+# text folds are written while the file is read.
+class DataSampler:
+
+    def __init__(self, sample_size: int = -1, fold_number: int = 1, seed: int = 0, first_fold: int = 1,
+                 output_format: str = 'text', reader=None, writer=None):
+        self.sample_size = sample_size
+        self.fold_number = fold_number
+        self.seed = seed
+        # folds are numbered first_fold, ..., first_fold + fold_number - 1, evaluate.py reads folds from 1
+        self.first_fold = first_fold
+        # 'text' or 'store', see DataWriter.save_trajectories
+        self.output_format = output_format
+        self.reader = reader if reader is not None else DataReader(use_cache=False)
+        # text folds keep the coordinates of the input unless a writer with a precision is given
+        self.writer = writer if writer is not None else DataWriter(precision=None)
+
+    # this function gives the file names of the folds of output_name, e.g. PORTO_1.dat, ..., PORTO_5.dat
+    def give_fold_file_names(self, output_name: str) -> list:
+        extension = '.dat' if self.output_format == 'text' else ''
+        return ['{}_{}{}'.format(output_name, fold, extension)
+                for fold in range(self.first_fold, self.first_fold + self.fold_number)]
+
+    # this function gives the fold of every trajectory number
+    def give_folds(self, trajectory_numbers: np.ndarray) -> np.ndarray:
+        hash_values = np.asarray(trajectory_numbers, dtype=np.uint64) + np.uint64(self.seed) * HASH_INCREMENT
+        hash_values = hash_values + HASH_INCREMENT
+        hash_values = (hash_values ^ (hash_values >> np.uint64(30))) * HASH_MULTIPLIERS[0]
+        hash_values = (hash_values ^ (hash_values >> np.uint64(27))) * HASH_MULTIPLIERS[1]
+        hash_values = hash_values ^ (hash_values >> np.uint64(31))
+        return (hash_values % np.uint64(self.fold_number)).astype(np.int64)
+
+    # this function samples a trajectory file and writes the folds, it gives the fold file names
+    def split_data_file(self, file_name: str, output_name: str) -> list:
+        fold_file_names = self.give_fold_file_names(output_name)
+        if self.sample_size < 0 and self.output_format == 'text':
+            self.write_all_trajectories_to_folds(file_name, fold_file_names)
+            return fold_file_names
+        trajectory_numbers, trajectory_list = self.sample_data_file(file_name)
+        folds = self.give_folds(trajectory_numbers)
+        for fold, fold_file_name in enumerate(fold_file_names):
+            fold_trajectory_list = [trajectory_list[i] for i in np.flatnonzero(folds == fold)]
+            self.writer.save_trajectories(fold_trajectory_list, fold_file_name, self.output_format)
+        return fold_file_names
+
+    # this function gives the numbers of the sampled trajectories in ascending order and their point arrays
+    def sample_data_file(self, file_name: str):
+        rng = np.random.default_rng(self.seed)
+        reservoir_numbers = []
+        reservoir = []
+        seen_number = 0
+        file_opener = self.reader.give_file_opener(file_name)
+        with file_opener(file_name, 'rb') as stream:
+            for points, point_numbers in self.reader.iterate_tra_blocks(stream):
+                # a block of record lines only has no trajectory
+                if point_numbers.size == 0:
+                    continue
+                block_offsets = np.zeros(point_numbers.size + 1, dtype=np.int64)
+                np.cumsum(point_numbers, out=block_offsets[1:])
+                block_numbers = seen_number + np.arange(point_numbers.size)
+                seen_number += point_numbers.size
+                if self.sample_size < 0:
+                    fill_number = point_numbers.size
+                else:
+                    fill_number = int(min(max(self.sample_size - block_numbers[0], 0), point_numbers.size))
+                for i in range(fill_number):
+                    reservoir_numbers.append(int(block_numbers[i]))
+                    reservoir.append(points[block_offsets[i]: block_offsets[i + 1]].copy())
+                if fill_number == point_numbers.size:
+                    continue
+                # trajectory number n replaces a random slot with probability sample_size / (n + 1)
+                candidate_numbers = block_numbers[fill_number:]
+                slots = rng.integers(0, candidate_numbers + 1)
+                accepted = np.flatnonzero(slots < self.sample_size)
+                # if a slot is hit several times in the block, the last trajectory stays
+                reversed_slots = slots[accepted][::-1]
+                _, last_hit = np.unique(reversed_slots, return_index=True)
+                for position in accepted[::-1][last_hit]:
+                    i = fill_number + position
+                    reservoir_numbers[slots[position]] = int(block_numbers[i])
+                    reservoir[slots[position]] = points[block_offsets[i]: block_offsets[i + 1]].copy()
+        order = np.argsort(np.array(reservoir_numbers, dtype=np.int64), kind='stable')
+        trajectory_numbers = np.array(reservoir_numbers, dtype=np.int64)[order]
+        trajectory_list = [reservoir[i] for i in order]
+        return trajectory_numbers, trajectory_list
+
+    # this function writes every trajectory of the file into the text file of its fold while the file is read
+    def write_all_trajectories_to_folds(self, file_name: str, fold_file_names: list) -> None:
+        fold_files = [open(fold_file_name, 'w') for fold_file_name in fold_file_names]
+        record_numbers = np.zeros(self.fold_number, dtype=np.int64)
+        seen_number = 0
+        try:
+            file_opener = self.reader.give_file_opener(file_name)
+            with file_opener(file_name, 'rb') as stream:
+                for points, point_numbers in self.reader.iterate_tra_blocks(stream):
+                    block_offsets = np.zeros(point_numbers.size + 1, dtype=np.int64)
+                    np.cumsum(point_numbers, out=block_offsets[1:])
+                    trajectory_list = self.reader.split_points_by_offsets(points, block_offsets)
+                    folds = self.give_folds(seen_number + np.arange(point_numbers.size))
+                    seen_number += point_numbers.size
+                    for fold in range(self.fold_number):
+                        fold_trajectory_list = [trajectory_list[i] for i in np.flatnonzero(folds == fold)]
+                        fold_files[fold].write(self.writer.format_trajectory_batch(
+                            fold_trajectory_list, 0, len(fold_trajectory_list), int(record_numbers[fold])))
+                        record_numbers[fold] += len(fold_trajectory_list)
+        finally:
+            for fold_file in fold_files:
+                fold_file.close()
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(description="Subsample a trajectory file and split it into folds")
+    parser.add_argument('input', type=str, help='Trajectory file, may be compressed')
+    parser.add_argument('output', type=str,
+                        help='Name of the folds, fold i is written to <output>_i.dat (or the store <output>_i), '
+                             'relative to the dataset folder')
+    parser.add_argument('-n', '--sample_size', type=int, default=-1,
+                        help='Number of sampled trajectories, all trajectories by default')
+    parser.add_argument('-k', '--folds', type=int, default=1, help='Number of folds')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Seed of sampling and fold hashing')
+    parser.add_argument('--first_fold', type=int, default=1, help='Number of the first fold')
+    parser.add_argument('--format', type=str, default='text', choices=['text', 'store'], help='Output format')
+    parser.add_argument('--precision', type=int, default=None,
+                        help='Digits after the decimal point of text output, by default coordinates are written '
+                             'without rounding')
+    return parser
+
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    sampler = DataSampler(sample_size=args.sample_size, fold_number=args.folds, seed=args.seed,
+                          first_fold=args.first_fold, output_format=args.format,
+                          writer=DataWriter(precision=args.precision))
+    output_name = os.path.join('.', config.trajectory_data_folder, args.output)
+    for written_file_name in sampler.split_data_file(args.input, output_name):
+        print(written_file_name)
@@ -9,13 +9,60 @@ import config.folder_and_file_names as config
 import os
 import fcntl
 
+from tools.trajectory_store import TrajectoryStore
+
 
 class DataWriter:
 
-    def __init__(self):
-        pass
+    def __init__(self, precision=2, batch_size: int = 10000):
+        # number of digits after the decimal point of written coordinates, None writes the shortest digits that read
+        # back to the same float
+        self.precision = precision
+        # number of trajectories formatted into one buffer before the buffer is written
+        self.batch_size = batch_size
+
+    # this function writes trajectories as text file ('text') or as binary trajectory store ('store')
+    def save_trajectories(self, trajectory_list: list, file_path: str, output_format: str = 'text'):
+        if output_format == 'text':
+            self.save_trajectory_data_in_list_to_file(trajectory_list, file_path)
+        elif output_format == 'store':
+            self.save_trajectory_data_in_list_to_store(trajectory_list, file_path)
+        else:
+            raise ValueError('unknown output format {}'.format(output_format))
 
+    # this function writes trajectories in the format of datasets/data_format.txt. Whole batches of trajectories are
+    # formatted into one string and written at once.
     def save_trajectory_data_in_list_to_file(self, trajectory_list: list, file_path: str):
+        with open(file_path, 'w') as file_object:
+            for batch_start in range(0, len(trajectory_list), self.batch_size):
+                batch_end = min(batch_start + self.batch_size, len(trajectory_list))
+                file_object.write(self.format_trajectory_batch(trajectory_list, batch_start, batch_end))
+
+    # this function formats trajectories batch_start, ..., batch_end - 1 of the list. Trajectory i gets the record
+    # number record_offset + i.
+    def format_trajectory_batch(self, trajectory_list: list, batch_start: int, batch_end: int,
+                                record_offset: int = 0) -> str:
+        if self.precision is None:
+            point_format = '%r,%r;'
+        else:
+            point_format = '%.{0}f,%.{0}f;'.format(self.precision)
+        batch_parts = []
+        for i in range(batch_start, batch_end):
+            tr = self.give_point_array(trajectory_list[i])
+            coordinates = tr.ravel().tolist()
+            batch_parts.append('#' + str(record_offset + i) + ':\n>0:' + (point_format * tr.shape[0]) %
+                               tuple(coordinates) + '\n')
+        return ''.join(batch_parts)
+
+    # this function gives the (point_number, 2) coordinates of a trajectory, an empty 1-D array has no points
+    def give_point_array(self, tr) -> np.ndarray:
+        tr = np.asarray(tr, dtype=float)
+        if tr.ndim != 2:
+            tr = tr.reshape((-1, 2))
+        return tr[:, :2]
+
+    # this function is the original writer with one write per point, it is kept as reference
+    def save_trajectory_data_in_list_to_file_point_by_point(self, trajectory_list: list, file_path: str):
         file_name = file_path
         with open(file_name, 'w+') as file_object:
             for i in range(len(trajectory_list)):
@@ -29,3 +76,15 @@ class DataWriter:
                 file_object.write('\n')
         file_object.close()
 
+    # this function writes trajectories as binary trajectory store with the name file_path, see TrajectoryStore.
+    # Coordinates are stored in full precision.
+    def save_trajectory_data_in_list_to_store(self, trajectory_list: list, file_path: str):
+        point_arrays = [self.give_point_array(tr) for tr in trajectory_list]
+        point_numbers = np.array([tr.shape[0] for tr in point_arrays], dtype=np.int64)
+        offsets = np.zeros(point_numbers.size + 1, dtype=np.int64)
+        np.cumsum(point_numbers, out=offsets[1:])
+        if point_arrays:
+            points = np.concatenate(point_arrays)
+        else:
+            points = np.empty((0, 2))
+        return TrajectoryStore().write_store(file_path, points, offsets)
@@ -1,4 +1,5 @@
 import numpy as np
+from scipy import sparse
 
 
 class GeneralTools:
@@ -32,20 +33,11 @@ class GeneralTools:
             raise TypeError('type of given bin is wrong')
         indices = np.searchsorted(bin1, array1)
         max_bin_index = bin1.size - 1
+        # values at most 0.0001 outside of the bins belong to the first or last bin
         left_outlier = (indices <= 0)
-        if left_outlier.any():
-            left_outlier_indices = np.arange(indices.size)[left_outlier]
-            for index in left_outlier_indices:
-                continuous_value = array1[index]
-                if bin1[0] - continuous_value < 0.0001:
-                    indices[index] = 1
+        indices[left_outlier & (bin1[0] - array1 < 0.0001)] = 1
         right_outlier = (indices > max_bin_index)
-        if right_outlier.any():
-            right_outlier_indices = np.arange(indices.size)[right_outlier]
-            for index in right_outlier_indices:
-                continuous_value = array1[index]
-                if continuous_value - bin1[-1] < 0.0001:
-                    indices[index] = max_bin_index
+        indices[right_outlier & (array1 - bin1[-1] < 0.0001)] = max_bin_index
         outlier_indicator = (indices <= 0) | (indices > max_bin_index)
         indices = indices - 1
         if outlier_handling == 'label':
@@ -55,6 +47,59 @@ class GeneralTools:
                 raise ValueError('array to digitize has outlier, which is illegal')
         return indices
 
+    # this function digitizes every value of array1 by its own bin like get_bin_index. All bins are concatenated in
+    # flat_bins, the bin of value i is flat_bins[bin_starts[i]: bin_ends[i]]. The bins are searched at once by a binary
+    # search that runs on all values together.
+    def get_segmented_bin_index(self, array1: np.ndarray, flat_bins: np.ndarray, bin_starts: np.ndarray,
+                                bin_ends: np.ndarray, outlier_handling: str = 'label') -> np.ndarray:
+        array1 = np.asarray(array1)
+        bin_starts = np.asarray(bin_starts, dtype=np.int64)
+        bin_ends = np.asarray(bin_ends, dtype=np.int64)
+        indices = self.get_segmented_sorted_index(array1, flat_bins, bin_starts, bin_ends)
+        max_bin_index = bin_ends - bin_starts - 1
+        left_outlier = (indices <= 0)
+        indices[left_outlier & (flat_bins[bin_starts] - array1 < 0.0001)] = 1
+        right_outlier = (indices > max_bin_index) & (array1 - flat_bins[bin_ends - 1] < 0.0001)
+        indices[right_outlier] = max_bin_index[right_outlier]
+        outlier_indicator = (indices <= 0) | (indices > max_bin_index)
+        indices = indices - 1
+        if outlier_handling == 'label':
+            indices[outlier_indicator] = -1
+        if outlier_handling == 'error':
+            if outlier_indicator.any():
+                raise ValueError('array to digitize has outlier, which is illegal')
+        return indices
+
+    # this function gives the ranks of the order statistics of number values that bound the values between the quantile
+    # and the 1 - quantile quantile
+    def give_quantile_ranks(self, number: int, quantile: float):
+        if not 0 <= quantile < 0.5:
+            raise ValueError('quantile must be in [0, 0.5)')
+        low_rank = int(np.floor(quantile * (number - 1)))
+        return low_rank, number - 1 - low_rank
+
+    # this function gives np.searchsorted(bin, value, side) of every value of array1 in its own bin, see
+    # get_segmented_bin_index
+    def get_segmented_sorted_index(self, array1: np.ndarray, flat_bins: np.ndarray, bin_starts: np.ndarray,
+                                   bin_ends: np.ndarray, side: str = 'left') -> np.ndarray:
+        array1 = np.asarray(array1)
+        bin_starts = np.asarray(bin_starts, dtype=np.int64)
+        lower = bin_starts.copy()
+        upper = np.asarray(bin_ends, dtype=np.int64).copy()
+        while True:
+            searching = lower < upper
+            if not searching.any():
+                break
+            middle = (lower + upper) // 2
+            middle_bins = flat_bins[np.minimum(middle, flat_bins.size - 1)]
+            if side == 'left':
+                go_right = searching & (middle_bins < array1)
+            else:
+                go_right = searching & (middle_bins <= array1)
+            lower = np.where(go_right, middle + 1, lower)
+            upper = np.where(searching & ~go_right, middle, upper)
+        return lower - bin_starts
+
     # this function gives result of digitize of a 2-dimensional array by two bins. it is how a point is digitized.
     # be careful, the result is y and x, not x and y
     def get_points_bin_index(self, point_array: np.ndarray, x_bin: np.ndarray, y_bin: np.ndarray) -> np.ndarray:
@@ -75,22 +120,32 @@ class GeneralTools:
             whole_frequency_array[cell_index] = cell_frequency
         return whole_frequency_array
 
+    # this function gives, group after group, every key of the group and how often it occurs in the group divided by
+    # the divisor of the group, e.g. the cell densities of all trajectories of a set with the point numbers as divisors.
+    # groups are positions into divisors, keys of a group are in ascending order.
+    def grouped_frequency(self, group_array: np.ndarray, key_array: np.ndarray, divisors: np.ndarray):
+        group_array = np.asarray(group_array, dtype=np.int64)
+        key_array = np.asarray(key_array, dtype=np.int64)
+        order = np.lexsort((key_array, group_array))
+        sorted_groups = group_array[order]
+        sorted_keys = key_array[order]
+        new_key = np.ones(sorted_keys.size, dtype=bool)
+        new_key[1:] = (sorted_keys[1:] != sorted_keys[:-1]) | (sorted_groups[1:] != sorted_groups[:-1])
+        key_starts = np.flatnonzero(new_key)
+        frequency = np.diff(np.append(key_starts, sorted_keys.size))
+        return sorted_keys[key_starts], frequency / np.asarray(divisors)[sorted_groups[key_starts]]
+
     #
     def unreapted_int_array(self, sequence: np.ndarray):
-        index_array = []
-        frequency_array = []
-        index_array.append(sequence[0])
-        repeat_counter = 0
-        for point1 in sequence:
-            if point1 == index_array[-1]:
-                repeat_counter += 1
-            else:
-                index_array.append(point1)
-                frequency_array.append(repeat_counter)
-                repeat_counter = 1
-        frequency_array.append(repeat_counter)
-        index_array = np.asarray(index_array, dtype=int)
-        frequency_array = np.asarray(frequency_array, dtype=int)
+        sequence = np.asarray(sequence)
+        if sequence.size == 0:
+            raise IndexError('an empty array has no unrepeated array')
+        # an element begins where the value changes
+        new_element = np.ones(sequence.size, dtype=bool)
+        new_element[1:] = sequence[1:] != sequence[:-1]
+        element_starts = np.flatnonzero(new_element)
+        index_array = sequence[element_starts].astype(int)
+        frequency_array = np.diff(np.append(element_starts, sequence.size)).astype(int)
         return index_array, frequency_array
 
     # this function calculates density giving a single index array
@@ -216,18 +271,31 @@ class GeneralTools:
     # this function gives usable to real index dict
     def inverse_index_dict(self, all_number: int, original_dict: np.ndarray):
         inverse_dict = np.zeros(all_number, dtype=int)
-        for original_index in range(original_dict.size):
-            inverse_index = original_dict[original_index]
-            if inverse_index >= 0:
-                inverse_dict[inverse_index] = original_index
+        original_dict = np.asarray(original_dict)
+        mapped = original_dict >= 0
+        inverse_dict[original_dict[mapped]] = np.flatnonzero(mapped)
         return inverse_dict
 
-    #
-    def neighbors_usable_indices_of_states(self, states, neighbor_dict):
-        neighbor_pool = []
-        for state in states:
-            neighbor_pool = neighbor_pool + neighbor_dict[state].tolist()
-        neighbor_pool = np.array(neighbor_pool, dtype=int)
+    # this function gives a row of a dense or sparse matrix as array
+    def give_matrix_row(self, matrix, row: int) -> np.ndarray:
+        if sparse.issparse(matrix):
+            return matrix[row].toarray().ravel()
+        return np.array(matrix[row, :])
+
+    # this function gives a column of a dense or sparse matrix as array
+    def give_matrix_column(self, matrix, column: int) -> np.ndarray:
+        if sparse.issparse(matrix):
+            return matrix[:, column].toarray().ravel()
+        return np.array(matrix[:, column])
+
+    # this function gives the sums of a dense or sparse matrix along axis as array
+    def give_matrix_sums(self, matrix, axis: int) -> np.ndarray:
+        return np.asarray(matrix.sum(axis=axis)).ravel()
+
+    # this function gives all neighbors of states, adjacency is a compressed sparse row matrix, see Grid.adjacency_matrix
+    def neighbors_usable_indices_of_states(self, states, adjacency):
+        states = np.asarray(states, dtype=int)
+        neighbor_pool = adjacency[states].indices.astype(int)
         neighbor_pool = np.unique(neighbor_pool)
         return neighbor_pool
 
@@ -1,3 +1,5 @@
+import multiprocessing
+
 import numpy as np
 
 
@@ -16,11 +18,84 @@ class Noise:
             noisy_object = self.positive_regulation(noisy_object)
         return noisy_object
 
+    # this function gives the generator of the noise of a part of the data, e.g. a row of a matrix. Philox is counter
+    # based, the key (seed, part) fixes the random numbers of the part, so parts can be made in any order or in parallel
+    def give_keyed_generator(self, seed: int, part: int):
+        return np.random.Generator(np.random.Philox(key=np.array([part, seed], dtype=np.uint64)))
+
+    # this function add laplace noise to the rows start_row, start_row + 1, ... of a matrix, real data is row_array
+    def add_laplace_to_rows(self, row_array, start_row, epsilon1, sensitivity1, seed):
+        lambda1 = sensitivity1 / epsilon1
+        noisy_rows = np.array(row_array, dtype=float)
+        for row_index in range(noisy_rows.shape[0]):
+            generator1 = self.give_keyed_generator(seed, start_row + row_index)
+            noisy_rows[row_index] += generator1.laplace(scale=lambda1, size=noisy_rows.shape[1])
+        return noisy_rows
+
     # this function change meaningless negative value to zero. These negative value comes from
     # noise adding and usually meaningless such as density. This function sum up all negative value
     # and add this negative sum to the smallest positive value. Iter this until the negative sum runs out.
     def positive_regulation(self, noisy_array1):
-        noisy_array1 = noisy_array1
+        if not np.any(noisy_array1 < 0):
+            return noisy_array1
+        return self.positive_regulation_of_rows(np.reshape(noisy_array1, (1, -1)))[0]
+
+    # this function does positive_regulation for every row of a block of rows at once. In a sorted row the negative
+    # values come first, the positive ones last. A cumulative sum of the positive values gives for every row where the
+    # negative sum runs out, the values before are set to zero and the one there to what is left of it. The negative
+    # sum and the value left are summed like the queue does, see give_sums_of_slices, so the rows are identical to
+    # positive_regulation_by_queue. Rows where the negative sum runs out within the rounding error of the cumulative sum
+    # are regulated by the queue itself.
+    def positive_regulation_of_rows(self, noisy_rows):
+        noisy_rows = np.asarray(noisy_rows, dtype=float)
+        if noisy_rows.size == 0:
+            return noisy_rows
+        column_number = noisy_rows.shape[1]
+        sort_indices = np.argsort(noisy_rows, axis=1)
+        sorted_rows = np.take_along_axis(noisy_rows, sort_indices, axis=1)
+        negative_numbers = np.count_nonzero(sorted_rows < 0, axis=1)
+        positive_starts = column_number - np.count_nonzero(sorted_rows > 0, axis=1)
+        negative_sums = self.give_sums_of_slices(sorted_rows, np.zeros_like(negative_numbers), negative_numbers)
+        positive_prefix_sums = np.cumsum(np.where(sorted_rows > 0, sorted_rows, 0), axis=1)
+        positive_sums = positive_prefix_sums[:, -1]
+        # sorted positions before cut_positions[row] are set to zero and the one at it to what is left
+        cut_positions = np.count_nonzero(positive_prefix_sums < - negative_sums[:, np.newaxis], axis=1)
+        used_out = (negative_sums < 0) & (positive_sums <= - negative_sums)
+        regulated = (negative_sums < 0) & ~used_out
+        row_indices = np.arange(cut_positions.size)
+        cut_sums = positive_prefix_sums[row_indices, np.minimum(cut_positions, column_number - 1)]
+        before_cut_sums = positive_prefix_sums[row_indices, np.maximum(cut_positions - 1, 0)]
+        tolerance = 4 * np.finfo(float).eps * column_number * (positive_sums - negative_sums)
+        by_queue = (negative_sums < 0) & ((np.abs(positive_sums + negative_sums) <= tolerance) |
+                                          (regulated & (np.abs(cut_sums + negative_sums) <= tolerance)) |
+                                          (regulated & (np.abs(before_cut_sums + negative_sums) <= tolerance)))
+        regulated_rows = np.flatnonzero(regulated & ~by_queue)
+        # the value left is the sum of the positive values up to the cut plus the negative sum
+        cut_values = self.give_sums_of_slices(sorted_rows[regulated_rows], positive_starts[regulated_rows],
+                                              cut_positions[regulated_rows] - positive_starts[regulated_rows] + 1)
+        sorted_positions = np.arange(column_number)
+        sorted_rows[(sorted_positions < cut_positions[:, np.newaxis]) & regulated[:, np.newaxis]] = 0
+        sorted_rows[used_out] = 0
+        sorted_rows[regulated_rows, cut_positions[regulated_rows]] = cut_values + negative_sums[regulated_rows]
+        array_after_regulation = np.empty_like(sorted_rows)
+        np.put_along_axis(array_after_regulation, sort_indices, sorted_rows, axis=1)
+        for row in np.flatnonzero(by_queue):
+            array_after_regulation[row] = self.positive_regulation_by_queue(noisy_rows[row].copy())
+        return array_after_regulation
+
+    # this function gives np.sum(rows[i, starts[i]: starts[i] + lengths[i]]) of every row. Slices of the same length
+    # are summed as rows of one array, which np.sum adds up row by row like a single slice.
+    def give_sums_of_slices(self, rows, starts, lengths):
+        sums = np.zeros(rows.shape[0])
+        for length in np.unique(lengths[lengths > 0]):
+            with_length = np.flatnonzero(lengths == length)
+            slice_indices = starts[with_length, np.newaxis] + np.arange(length)
+            sums[with_length] = np.sum(np.take_along_axis(rows[with_length], slice_indices, axis=1), axis=1)
+        return sums
+
+    # this function is the queue of positive_regulation for one array, the smallest positive values are used up one
+    # after another
+    def positive_regulation_by_queue(self, noisy_array1):
         sort_indices = np.argsort(noisy_array1)
         sorted_array1 = noisy_array1[sort_indices]
         negative_indices = np.argwhere(sorted_array1 < 0).reshape(-1)
@@ -50,11 +125,23 @@ class Noise:
             array_after_regulation = noisy_array1
         return array_after_regulation
 
-    # this function regulate matrix after adding noise by row
-    def positive_regulation_for_markov_matrix(self, noisy_matrix1, regulation_method='queue_minus'):
+    # this function regulate matrix after adding noise by row, blocks of row_block rows are regulated at once by
+    # positive_regulation_of_rows and spread across worker_number processes
+    def positive_regulation_for_markov_matrix(self, noisy_matrix1, regulation_method='queue_minus', worker_number=1,
+                                              row_block=256):
+        if row_block < 1:
+            raise ValueError('row_block must be at least 1, not {}'.format(row_block))
         if regulation_method == 'queue_minus':
-            for rows in range(noisy_matrix1.shape[0]):
-                noisy_matrix1[rows] = self.positive_regulation(noisy_matrix1[rows])
+            block_starts = range(0, noisy_matrix1.shape[0], row_block)
+            row_blocks = (noisy_matrix1[start: start + row_block] for start in block_starts)
+            if worker_number > 1 and len(block_starts) > 1:
+                with multiprocessing.Pool(min(worker_number, len(block_starts))) as pool:
+                    for start, regulated_block in zip(block_starts, pool.imap(self.positive_regulation_of_rows,
+                                                                              row_blocks)):
+                        noisy_matrix1[start: start + row_block] = regulated_block
+            else:
+                for start, row_block1 in zip(block_starts, row_blocks):
+                    noisy_matrix1[start: start + row_block] = self.positive_regulation_of_rows(row_block1)
         elif regulation_method == 'truncation':
             noisy_matrix1[noisy_matrix1 < 0] = 0
         return noisy_matrix1
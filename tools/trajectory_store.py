@@ -0,0 +1,190 @@
+"""Binary columnar storage of trajectory files."""
+import json
+import os
+import shutil
+from argparse import ArgumentParser
+
+import numpy as np
+
+STORE_FORMAT_VERSION = 1
+# number of point numbers turned into offsets at once when a store is written block by block
+OFFSET_BLOCK_SIZE = 1024 * 1024
+POINTS_SUFFIX = '.points.npy'
+OFFSETS_SUFFIX = '.offsets.npy'
+INFO_SUFFIX = '.json'
+
+
+# A store consists of three files next to each other:
+#   <store_name>.points.npy   float64 (point_number, 2) array with the points of all trajectories
+#   <store_name>.offsets.npy  int64 (trajectory_number + 1) array, trajectory i is points[offsets[i]: offsets[i + 1]]
+#   <store_name>.json         sidecar with point number, trajectory number, bounding box and source file key
+# The sidecar is written last, a store without a readable sidecar is treated as missing.
+class TrajectoryStore:
+
+    def __init__(self):
+        pass
+
+    # this function writes points and offsets into a store, every file is replaced atomically
+    def write_store(self, store_name: str, points: np.ndarray, offsets: np.ndarray, source_file_name=None):
+        points = np.ascontiguousarray(points, dtype=np.float64).reshape((-1, 2))
+        offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        if offsets.size < 1 or offsets[0] != 0 or offsets[-1] != points.shape[0]:
+            raise ValueError('offsets do not match the point array')
+        store_info = {
+            'format_version': STORE_FORMAT_VERSION,
+            'point_number': int(points.shape[0]),
+            'trajectory_number': int(offsets.size - 1),
+            'bounding_box': self.give_bounding_box(points),
+        }
+        if source_file_name is not None:
+            store_info['source'] = self.give_source_key(source_file_name)
+        store_folder = os.path.dirname(os.path.abspath(store_name))
+        os.makedirs(store_folder, exist_ok=True)
+        self.replace_file(store_name + POINTS_SUFFIX, lambda f: np.save(f, points))
+        self.replace_file(store_name + OFFSETS_SUFFIX, lambda f: np.save(f, offsets))
+        self.replace_file(store_name + INFO_SUFFIX, lambda f: f.write(json.dumps(store_info, indent=2).encode()))
+        return store_info
+
+    # this function writes a store from (points, point number of every trajectory) blocks, e.g. of
+    # DataReader.iterate_tra_blocks. Only one block is in memory at a time, the blocks are collected in temporary raw
+    # files next to the store and copied into the .npy files at the end.
+    def write_store_from_blocks(self, store_name: str, blocks, source_file_name=None):
+        store_folder = os.path.dirname(os.path.abspath(store_name))
+        os.makedirs(store_folder, exist_ok=True)
+        raw_points_name = '{}{}.{}.raw'.format(store_name, POINTS_SUFFIX, os.getpid())
+        raw_numbers_name = '{}{}.{}.raw'.format(store_name, OFFSETS_SUFFIX, os.getpid())
+        point_number = 0
+        trajectory_number = 0
+        lower = np.array([np.inf, np.inf])
+        upper = np.array([-np.inf, -np.inf])
+        try:
+            with open(raw_points_name, 'wb') as points_file, open(raw_numbers_name, 'wb') as numbers_file:
+                for points, point_numbers in blocks:
+                    points = np.ascontiguousarray(points, dtype=np.float64).reshape((-1, 2))
+                    point_numbers = np.ascontiguousarray(point_numbers, dtype=np.int64)
+                    if np.sum(point_numbers) != points.shape[0]:
+                        raise ValueError('point numbers do not match the point block')
+                    points.tofile(points_file)
+                    point_numbers.tofile(numbers_file)
+                    point_number += points.shape[0]
+                    trajectory_number += point_numbers.size
+                    if points.shape[0] > 0:
+                        lower = np.minimum(lower, np.min(points, axis=0))
+                        upper = np.maximum(upper, np.max(points, axis=0))
+            store_info = {
+                'format_version': STORE_FORMAT_VERSION,
+                'point_number': point_number,
+                'trajectory_number': trajectory_number,
+                'bounding_box': None,
+            }
+            if point_number > 0:
+                store_info['bounding_box'] = [float(lower[0]), float(lower[1]), float(upper[0]), float(upper[1])]
+            if source_file_name is not None:
+                store_info['source'] = self.give_source_key(source_file_name)
+            self.replace_file(store_name + POINTS_SUFFIX,
+                              lambda f: self.copy_raw_points(raw_points_name, point_number, f))
+            self.replace_file(store_name + OFFSETS_SUFFIX,
+                              lambda f: self.copy_raw_point_numbers_as_offsets(raw_numbers_name, trajectory_number, f))
+            self.replace_file(store_name + INFO_SUFFIX, lambda f: f.write(json.dumps(store_info, indent=2).encode()))
+        finally:
+            for raw_name in [raw_points_name, raw_numbers_name]:
+                if os.path.exists(raw_name):
+                    os.remove(raw_name)
+        return store_info
+
+    # this function writes raw float64 points as .npy file
+    def copy_raw_points(self, raw_points_name: str, point_number: int, f):
+        np.lib.format.write_array_header_1_0(f, {'descr': np.dtype(np.float64).str, 'fortran_order': False,
+                                                 'shape': (point_number, 2)})
+        with open(raw_points_name, 'rb') as raw_file:
+            shutil.copyfileobj(raw_file, f)
+
+    # this function writes the offsets of raw int64 point numbers as .npy file
+    def copy_raw_point_numbers_as_offsets(self, raw_numbers_name: str, trajectory_number: int, f):
+        np.lib.format.write_array_header_1_0(f, {'descr': np.dtype(np.int64).str, 'fortran_order': False,
+                                                 'shape': (trajectory_number + 1,)})
+        offset = np.zeros(1, dtype=np.int64)
+        offset.tofile(f)
+        with open(raw_numbers_name, 'rb') as raw_file:
+            while True:
+                point_numbers = np.fromfile(raw_file, dtype=np.int64, count=OFFSET_BLOCK_SIZE)
+                if point_numbers.size == 0:
+                    break
+                offsets = offset[0] + np.cumsum(point_numbers)
+                offsets.tofile(f)
+                offset[0] = offsets[-1]
+
+    # this function opens a store. Points and offsets are read only memory maps, so processes reading the same
+    # store share the page cache instead of holding their own copy.
+    def read_store(self, store_name: str):
+        store_info = self.read_store_info(store_name)
+        if store_info is None:
+            raise FileNotFoundError('no trajectory store {}'.format(store_name))
+        points = np.load(store_name + POINTS_SUFFIX, mmap_mode='r')
+        offsets = np.load(store_name + OFFSETS_SUFFIX, mmap_mode='r')
+        if points.shape != (store_info['point_number'], 2) or offsets.size != store_info['trajectory_number'] + 1:
+            raise ValueError('trajectory store {} does not match its sidecar'.format(store_name))
+        return points, offsets, store_info
+
+    # this function gives the sidecar of a store or None if there is no valid one
+    def read_store_info(self, store_name: str):
+        try:
+            with open(store_name + INFO_SUFFIX, 'r') as f:
+                store_info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if store_info.get('format_version') != STORE_FORMAT_VERSION:
+            return None
+        return store_info
+
+    # this function tells whether a store was made from the current version of a source file
+    def is_store_of(self, store_name: str, source_file_name: str) -> bool:
+        store_info = self.read_store_info(store_name)
+        if store_info is None or 'source' not in store_info:
+            return False
+        return store_info['source'] == self.give_source_key(source_file_name)
+
+    # this function gives [x_min, y_min, x_max, y_max] of all points or None if there are no points
+    def give_bounding_box(self, points: np.ndarray):
+        if points.shape[0] == 0:
+            return None
+        lower = np.min(points, axis=0)
+        upper = np.max(points, axis=0)
+        return [float(lower[0]), float(lower[1]), float(upper[0]), float(upper[1])]
+
+    # this function gives size and modification time of a file, a store is valid as long as they are unchanged
+    def give_source_key(self, file_name: str) -> dict:
+        file_state = os.stat(file_name)
+        return {'size': file_state.st_size, 'mtime_ns': file_state.st_mtime_ns}
+
+    # this function writes a temporary file next to the target and moves it over the target, so a concurrent reader
+    # sees either the old or the new file
+    def replace_file(self, file_name: str, write_function):
+        temporary_name = '{}.{}.tmp'.format(file_name, os.getpid())
+        try:
+            with open(temporary_name, 'wb') as f:
+                write_function(f)
+            os.replace(temporary_name, file_name)
+        except BaseException:
+            if os.path.exists(temporary_name):
+                os.remove(temporary_name)
+            raise
+
+
+def get_parser() -> ArgumentParser:
+    parser = ArgumentParser(description="Convert a trajectory file into a binary trajectory store")
+    parser.add_argument('input', type=str, help='Trajectory file in the format of datasets/data_format.txt')
+    parser.add_argument('output', type=str, nargs='?', default=None,
+                        help='Store name, the input file name without extension by default')
+    return parser
+
+
+if __name__ == "__main__":
+    from tools.data_reader import DataReader
+    args = get_parser().parse_args()
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.input)[0]
+    info = DataReader().convert_data_file(args.input, output)
+    print('{} trajectories with {} points written to {}'.format(info['trajectory_number'], info['point_number'],
+                                                                output))